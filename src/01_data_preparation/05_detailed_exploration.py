@@ -8,12 +8,12 @@ sorting, mathematical conversion to Hounsfield Units (HU), and diagnostic
 radiological windowing. It generates and saves several visual diagnostic plots.
 """
 
-import pydicom
+import sys
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from pathlib import Path
-import os
 
 # --- CONFIGURATION ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
@@ -21,102 +21,40 @@ DIR_DICOM = PROJECT_ROOT / "data" / "raw" / "dicom"
 PATH_MAPPING = PROJECT_ROOT / "data" / "processed" / "exact_image_mapping.csv"
 DIR_FIGURES = PROJECT_ROOT / "results" / "figures"
 DIR_FIGURES.mkdir(parents=True, exist_ok=True)
+MONTAGE_PANEL_PX = 256 # Montage thumbnails are read from the pyramid level of this size
 
-def load_scan(path):
-    """
-    Loads all DICOM files from a specified folder and sorts them spatially.
-
-    The function reads all '.dcm' files in the directory and sorts the list 
-    based on the 'ImagePositionPatient[2]' DICOM header attribute. This ensures 
-    the 2D slices are stacked in the correct anatomical order along the Z-axis.
-
-    Args:
-        path (Path or str): The directory path containing the DICOM files.
-
-    Returns:
-        list of pydicom.dataset.FileDataset: A spatially sorted list of DICOM objects.
-    """
-    # 1. List all files
-    slices = [pydicom.dcmread(path / f) for f in os.listdir(path) if f.endswith('.dcm')]
-    
-    # 2. Sort by ImagePositionPatient (Z-coordinate)
-    # This is important, otherwise the images are mixed up!
-    slices.sort(key=lambda x: float(x.ImagePositionPatient[2]))
-    
-    return slices
-
-def get_pixels_hu(slices):
-    """
-    Converts raw DICOM pixel values to a 3D numpy array of Hounsfield Units (HU).
-
-    This function applies the linear transformation defined in the DICOM header 
-    (RescaleIntercept and RescaleSlope) to convert arbitrary scanner pixel 
-    values into standardized radiodensity metrics (Hounsfield Units). It also 
-    normalizes out-of-bounds scanner padding (often -2000) to 0 (Air).
-
-    Args:
-        slices (list of pydicom.dataset.FileDataset): Spatially sorted DICOM objects.
-
-    Returns:
-        numpy.ndarray: A 3D array of shape (Slices, Rows, Columns) containing 
-        the calculated HU values as 16-bit integers.
-    """
-    image = np.stack([s.pixel_array for s in slices])
-    image = image.astype(np.int16)
-
-    # Outside the scan area is often -2000, we set this to 0 (air)
-    image[image == -2000] = 0
-    
-    # Conversion: HU = Pixel * Slope + Intercept
-    intercept = slices[0].RescaleIntercept
-    slope = slices[0].RescaleSlope
-    
-    if slope != 1:
-        image = slope * image.astype(np.float64)
-        image = image.astype(np.int16)
-        
-    image += np.int16(intercept)
-    
-    return np.array(image, dtype=np.int16)
-
-def apply_window(image, center, width):
-    """
-    Applies radiological CT windowing to restrict the visible HU range.
-
-    Windowing acts as a contrast/brightness adjustment, clipping the HU values 
-    to a specific range defined by a Window Center (Level) and Window Width. 
-    This highlights specific tissues, such as lung parenchyma or mediastinal soft tissue.
-
-    Args:
-        image (numpy.ndarray): The input 2D or 3D image array in Hounsfield Units.
-        center (int): The center value (Level) of the window in HU.
-        width (int): The width of the window in HU.
-
-    Returns:
-        numpy.ndarray: The windowed (clipped) image array.
-    """
-    img_min = center - width // 2
-    img_max = center + width // 2
-    
-    windowed = np.clip(image, img_min, img_max)
-    return windowed
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.intensity_stats import volume_histogram, HIST_MIN_HU, N_BINS
+from utils.volume_cache import load_series_hu, overview_slices, DEFAULT_MEMORY_BUDGET_MB
+from utils.instrumentation import instrumented, span
+from utils.windowing import apply_window, render_windows, WINDOW_PRESETS
 
+@instrumented("05_detailed_exploration")
 def main():
     """
     Executes the detailed CT volume analysis and visualization pipeline.
 
     The function performs the following steps on a sample patient:
     1. Determines the physical DICOM directory path from the mapping file.
-    2. Loads the full 3D scan and converts it to Hounsfield Units (HU).
+    2. Loads the full 3D scan in Hounsfield Units (HU) within the memory
+       budget (in RAM, or memory-mapped from the volume cache if larger; a
+       body-cropped cache then holds only the body box, and slice indices are
+       reported in full-series coordinates).
     3. Generates a histogram illustrating the global HU density distribution.
     4. Extracts the middle slice and visualizes it under three conditions: 
        Raw HU, Lung Window, and Mediastinal Window.
     5. Creates a 4x4 overview montage (grid) of evenly spaced slices across 
-       the entire Z-axis using the Lung Window.
+       the entire Z-axis using the Lung Window, read from the downsampled
+       pyramid level that fits the thumbnail size.
 
     Returns:
         None. All visualizations are saved to the 'results/figures' directory.
     """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--memory_budget_mb', type=float, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="Largest volume kept in RAM; larger series are memory-mapped from the volume cache")
+    args = parser.parse_args()
+
     print("### STEP 3: DETAILED CT ANALYSIS (WINDOWING & 3D) ###")
     
     # 1. Get patient path
@@ -130,16 +68,24 @@ def main():
     
     print(f"Loading 3D volume for {subject_id}...")
     
-    # 2. Load volume & convert to HU
-    slices = load_scan(full_path)
-    patient_pixels = get_pixels_hu(slices)
+    # 2. Load volume & convert to HU (peak RSS is recorded in the run log)
+    with span("load_volume", budget_mb=args.memory_budget_mb) as s:
+        patient_pixels, meta = load_series_hu(full_path, budget_mb=args.memory_budget_mb)
+        s.add_items(len(patient_pixels))
+        s.attrs['storage'] = meta['storage']
     
-    print(f" -> Volume shape: {patient_pixels.shape} (Slices, X, Y)")
+    print(f" -> Volume shape: {patient_pixels.shape} (Slices, X, Y), {meta['storage'].upper()}")
+    if meta.get('cropped_to_body', False):
+        # Over-budget series from a body-cropped cache: only the body box is stored
+        print(f" -> Body-cropped cache: box at offset {meta['offset']} of the full series {meta['full_shape']}")
     print(f" -> Min HU: {np.min(patient_pixels)}, Max HU: {np.max(patient_pixels)}")
 
     # 3. VISUALIZATION 1: HISTOGRAM (Density distribution)
+    # Integer HU bins via np.bincount (no flattened copy of the volume)
+    hu_hist = volume_histogram(patient_pixels)['histogram']
+    hu_edges = np.arange(HIST_MIN_HU, HIST_MIN_HU + N_BINS + 1)
     plt.figure(figsize=(10, 5))
-    plt.hist(patient_pixels.flatten(), bins=80, color='c')
+    plt.stairs(hu_hist, hu_edges, fill=True, color='c')
     plt.xlabel("Hounsfield Units (HU)")
     plt.ylabel("Frequency")
     plt.title(f"HU Distribution for {subject_id}")
@@ -153,8 +99,9 @@ def main():
     plt.show()
 
     # 4. VISUALIZATION 2: WINDOWING COMPARISON
-    # We take a slice from the middle
-    mid_idx = len(patient_pixels) // 2
+    # We take a slice from the middle (of the full series, also for a cropped cache)
+    z_offset = meta['offset'][0]
+    mid_idx = min(max(meta['full_shape'][0] // 2 - z_offset, 0), len(patient_pixels) - 1)
     slice_img = patient_pixels[mid_idx]
 
     fig, ax = plt.subplots(1, 3, figsize=(15, 5))
@@ -164,12 +111,11 @@ def main():
     ax[0].set_title("No Windowing (Raw HU)")
     
     # B) Lung Window (W:1500, L:-600) -> Here you can see the tumor
-    lung_window = apply_window(slice_img, center=-600, width=1500)
+    # C) Mediastinal Window (W:350, L:50) -> Here you can see soft tissues/heart
+    lung_window, soft_window = render_windows(slice_img, [WINDOW_PRESETS['lung'], WINDOW_PRESETS['mediastinal']])
     ax[1].imshow(lung_window, cmap='gray')
     ax[1].set_title("Lung Window (L:-600, W:1500)")
     
-    # C) Mediastinal Window (W:350, L:50) -> Here you can see soft tissues/heart
-    soft_window = apply_window(slice_img, center=50, width=350)
     ax[2].imshow(soft_window, cmap='gray')
     ax[2].set_title("Mediastinal Window (L:50, W:350)")
     
@@ -187,11 +133,15 @@ def main():
     fig, axes = plt.subplots(4, 4, figsize=(12, 12))
     axes = axes.flatten()
     
+    # Thumbnails come from the pyramid level that fits MONTAGE_PANEL_PX (no full-resolution reads)
+    thumbnails, factor = overview_slices(patient_pixels, meta, indices, MONTAGE_PANEL_PX)
+    print(f" -> Montage from pyramid level x{factor}: {thumbnails.shape[1:]}")
+    
+    # We show the lung window, as we can recognize the most there (all 16 slices in one lookup)
+    montage = apply_window(thumbnails, *WINDOW_PRESETS['lung'])
     for i, idx in enumerate(indices):
-        # We show the lung window, as we can recognize the most there
-        img = apply_window(patient_pixels[idx], center=-600, width=1500)
-        axes[i].imshow(img, cmap='gray')
-        axes[i].set_title(f"Slice {idx}")
+        axes[i].imshow(montage[i], cmap='gray')
+        axes[i].set_title(f"Slice {idx + z_offset}")
         axes[i].axis('off')
         
     plt.suptitle(f"Volume Overview: {subject_id}", fontsize=16)
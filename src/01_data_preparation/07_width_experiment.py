@@ -9,12 +9,11 @@ matrix to empirically determine the optimal contrast setting for visualizing
 lung tumors and parenchyma in the deep learning pipeline.
 """
 
-import pydicom
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from pathlib import Path
-import os
 import math
 
 # --- CONFIGURATION ---
@@ -24,28 +23,27 @@ PATH_MAPPING = PROJECT_ROOT / "data" / "processed" / "exact_image_mapping.csv"
 DIR_FIGURES = PROJECT_ROOT / "results" / "figures"
 DIR_FIGURES.mkdir(parents=True, exist_ok=True)
 
-def load_middle_slice(path):
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.preview import read_middle_slice
+from utils.windowing import render_windows
+
+def load_middle_slice(path, subject_id=None):
     """
     Loads only the middle slice from a DICOM folder for testing purposes.
 
-    The function reads all '.dcm' files in the directory, sorts them anatomically 
-    along the Z-axis using 'ImagePositionPatient', and returns the median slice.
+    The slices are sorted anatomically along the Z-axis from their headers
+    alone (or the cached header index of the patient), so only the pixel
+    data of the returned middle slice is ever read.
 
     Args:
         path (Path or str): The directory path containing the DICOM files.
+        subject_id (str, optional): The patient ID, enables the header index.
 
     Returns:
         pydicom.dataset.FileDataset or None: The middle DICOM slice object, 
         or None if the directory is empty.
     """
-    files = [f for f in os.listdir(path) if f.endswith('.dcm')]
-    if not files: return None
-    
-    # Sorting is important for consistent results
-    slices = [pydicom.dcmread(path / f) for f in files]
-    slices.sort(key=lambda x: float(x.ImagePositionPatient[2]))
-    
-    return slices[len(slices) // 2]
+    return read_middle_slice(path, subject_id)
 
 def get_pixels_hu(slice_item):
     """
@@ -74,22 +72,6 @@ def get_pixels_hu(slice_item):
     image += np.int16(intercept)
     return image
 
-def apply_window(image, center, width):
-    """
-    Applies radiological CT windowing to restrict the visible HU range.
-
-    Args:
-        image (numpy.ndarray): The input 2D image array in Hounsfield Units.
-        center (int): The center value (Level) of the window in HU.
-        width (int): The width of the window in HU.
-
-    Returns:
-        numpy.ndarray: The windowed (clipped) image array.
-    """
-    img_min = center - width // 2
-    img_max = center + width // 2
-    return np.clip(image, img_min, img_max)
-
 def main():
     """
     Executes the fine-grained window width experiment and generates a visualization grid.
@@ -115,7 +97,7 @@ def main():
     clean_path = raw_path.lstrip('./').lstrip('.\\').replace('\\', '/')
     full_path = DIR_DICOM / clean_path
     
-    mid_slice = load_middle_slice(full_path)
+    mid_slice = load_middle_slice(full_path, match['Subject ID'])
     img_hu = get_pixels_hu(mid_slice)
     
     # 2. Experiment Configuration
@@ -134,12 +116,12 @@ def main():
     # Large portrait format for the 24 images
     plt.figure(figsize=(16, 24))
     
+    # All 24 windows in one batched lookup-table call
+    panels = render_windows(img_hu, [(fixed_center, width) for width in widths])
+    
     for i, width in enumerate(widths):
         ax = plt.subplot(rows, cols, i + 1)
-        
-        img_windowed = apply_window(img_hu, center=fixed_center, width=width)
-        
-        ax.imshow(img_windowed, cmap='gray')
+        ax.imshow(panels[i], cmap='gray')
         
         # Format title
         title_color = 'black'
@@ -9,6 +9,7 @@ the extracted coordinates to mathematically and visually prove that the spatial
 mapping between the clinical AIM annotations and the DICOM pixel arrays is perfectly aligned.
 """
 
+import sys
 import pydicom
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
@@ -24,6 +25,9 @@ PATH_MAPPING = PROJECT_ROOT / "data" / "processed" / "exact_image_mapping.csv"
 DIR_FIGURES = PROJECT_ROOT / "results" / "figures"
 DIR_FIGURES.mkdir(parents=True, exist_ok=True)
 
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.windowing import apply_window, WINDOW_PRESETS
+
 # DATA FROM XML (Manually extracted for this test)
 TARGET_PATIENT = "AMC-003"
 TARGET_SOP_UID = "1.3.6.1.4.1.14519.5.2.1.4334.1501.553921625749272741224744327937"
@@ -42,19 +46,14 @@ def apply_lung_window(image):
         image (numpy.ndarray): The 2D image array in Hounsfield Units.
 
     Returns:
-        numpy.ndarray: The windowed (clipped) image array.
+        numpy.ndarray: The windowed image array (uint8, via the cached lookup table).
     """
-    # Standard Lung Window: Center -600, Width 1500
-    center = -600
-    width = 1500
-    
     # HU Conversion (simplified)
     image = image.astype(np.int16)
     image[image == -2000] = -1000
     
-    img_min = center - width // 2
-    img_max = center + width // 2
-    return np.clip(image, img_min, img_max)
+    # Standard Lung Window: Center -600, Width 1500
+    return apply_window(image, *WINDOW_PRESETS['lung'])
 
 def main():
     """
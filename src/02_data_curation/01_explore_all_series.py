@@ -8,6 +8,7 @@ patient's local DICOM directories to find the exact matching folder,
 extracting spatial metadata like slice thickness and slice count in the process.
 """
 
+import sys
 import pydicom
 import os
 from pathlib import Path
@@ -21,6 +22,10 @@ DIR_DICOM = PROJECT_ROOT / "data" / "raw" / "dicom"
 DIR_XML = PROJECT_ROOT / "data" / "raw" / "xml"  # <--- THIS IS THE FIX
 DIR_PROCESSED = PROJECT_ROOT / "data" / "processed"
 DIR_PROCESSED.mkdir(parents=True, exist_ok=True)
+FILE_MATCHING = DIR_PROCESSED / "xml_dicom_patient_matching.csv"
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.instrumentation import instrumented, count_items
 
 # XML Namespace
 NS = {'aim': 'gme://caCORE.caCORE/4.4/edu.northwestern.radiology.AIM'}
@@ -107,7 +112,7 @@ def find_dicom_folder_for_uid(patient_dir, target_uid):
             
     return None, "UID not found in patient folder", None, None
 
-def main():
+def run():
     """
     Executes the pure XML-to-DICOM validation and mapping pipeline.
 
@@ -116,7 +121,10 @@ def main():
     2. Parses each XML for the target Series UID.
     3. Physically searches the respective patient's DICOM folders for the match.
     4. Aggregates the results (including slice counts and thicknesses) into a DataFrame.
-    5. Saves the mapping to a CSV file and prints a statistical summary.
+    5. Prints a statistical summary.
+
+    Returns:
+        pandas.DataFrame or None: The matching table, or None if nothing could be matched.
     """
     print("\n" + "="*60)
     print("PURE XML TO DICOM VALIDATION (No CSV used.)")
@@ -126,19 +134,20 @@ def main():
     print(f"Searching for XML files in: {DIR_XML}")
     if not DIR_XML.exists():
         print(f"STOP: The folder {DIR_XML} does not exist.")
-        return
+        return None
 
     xml_files = list(DIR_XML.rglob("*.xml"))
     print(f"Found: {len(xml_files)} XML files (Ground Truth).")
     
     if len(xml_files) == 0:
         print("STOP: No XML files found. Script is aborting.")
-        return
+        return None
     
     results = []
     
     # 2. Find the matching folder for each XML
     for xml_path in tqdm(xml_files, desc="Processing patients"):
+        count_items()
         patient_id, target_uid = parse_xml(xml_path)
         
         if not patient_id or not target_uid:
@@ -163,7 +172,7 @@ def main():
         
     if len(results) == 0:
         print("STOP: Error parsing all XMLs.")
-        return
+        return None
 
     # 4. Save & analyze results
     df = pd.DataFrame(results)
@@ -171,9 +180,6 @@ def main():
     # Remove duplicates
     df = df.drop_duplicates(subset=['PatientID', 'XML_Target_UID'])
     
-    out_path = DIR_PROCESSED / "xml_dicom_patient_matching.csv"
-    df.to_csv(out_path, index=False, sep=';', decimal=',')
-    
     print("\n" + "="*60)
     print("RESULT ANALYSIS")
     print("="*60)
@@ -194,7 +200,19 @@ def main():
     if len(df_errors) > 0:
         print(f"\n{len(df_errors)} errors found (e.g., DICOMs deleted or UID not found).")
 
-    print(f"\nList saved to: {out_path}")
+    return df
+
+@instrumented("01_explore_all_series")
+def main():
+    """
+    Runs the validation and saves the matching table to a CSV file.
+    """
+    df = run()
+    if df is None:
+        return
+
+    df.to_csv(FILE_MATCHING, index=False, sep=';', decimal=',')
+    print(f"\nList saved to: {FILE_MATCHING}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,13 +4,15 @@ Central Data Manifest Creation Script.
 This script acts as the core of the data curation pipeline. It aggregates 
 the clinical ground truth (histology), the spatial XML annotations (X, Y 
 coordinates and SOPInstanceUID), and the physical DICOM metadata (spacing, 
-thickness, slice count, and kernels) into a single, centralized 'manifest.csv'. 
+thickness, slice count, and kernels) into a single, centralized, typed manifest
+('manifest.parquet', with 'manifest.csv' as a human-readable export). 
 
 For patients without XML annotations, it implements an automated fallback 
 search to locate the most suitable CT scan for potential unsupervised learning.
 """
 
 import os
+import sys
 import pandas as pd
 import pydicom
 from pathlib import Path
@@ -25,6 +27,10 @@ FILE_CLINICAL = PROJECT_ROOT / "data" / "raw" / "clinical" / "NSCLCR01Radiogenom
 DIR_PROCESSED = PROJECT_ROOT / "data" / "processed"
 DIR_PROCESSED.mkdir(parents=True, exist_ok=True)
 
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import write_manifest, FILE_MANIFEST
+from utils.instrumentation import instrumented, span
+
 NS = {'aim': 'gme://caCORE.caCORE/4.4/edu.northwestern.radiology.AIM'}
 
 def clean_uid(uid):
@@ -181,106 +187,162 @@ def get_exact_dicom_metadata(patient_dir, target_uid):
             continue
     return None
 
-def main():
+# Columns of a manifest row before any DICOM metadata is attached
+MANIFEST_COLUMNS = [
+    'subject_id', 'histology', 'xml_present', 'chosen_series_uid', 'selection_reason',
+    'slice_thickness', 'spacing_between_slices', 'pixel_spacing_x', 'pixel_spacing_y',
+    'reconstruction_kernel', 'series_description', 'slice_count', 'qc_pass',
+    'sop_instance_uid', 'x_raw', 'y_raw', 'x_pixel', 'y_pixel', 'coordinate_mapped_successfully'
+]
+META_COLUMNS = ['slice_thickness', 'spacing_between_slices', 'pixel_spacing_x', 'pixel_spacing_y',
+                'reconstruction_kernel', 'series_description', 'slice_count']
+
+def catalog_patient_dirs():
+    """
+    Lists all patient folders of the DICOM tree in one pass.
+
+    Patients may sit directly in the DICOM root or in the nested
+    'NSCLC Radiogenomics' folder; a top-level folder wins.
+
+    Returns:
+        pandas.DataFrame: Columns 'subject_id', 'patient_dir' and 'top_level'
+        (False for folders found only in the nested tree), in directory order.
+    """
+    nested_root = DIR_DICOM / "NSCLC Radiogenomics"
+    catalog = {}
+    for root in [DIR_DICOM, nested_root]:
+        if not root.is_dir():
+            continue
+        for p in root.iterdir():
+            if p.is_dir() and p != nested_root:
+                catalog.setdefault(p.name, (p, root == DIR_DICOM))
+    return pd.DataFrame({'subject_id': list(catalog.keys()),
+                         'patient_dir': [p for p, _ in catalog.values()],
+                         'top_level': [top for _, top in catalog.values()]})
+
+def join_patient_sources(df_clinical, xml_dict, df_dirs):
+    """
+    Brings clinical labels, XML records and the DICOM catalog together with keyed merges.
+
+    Replaces the former per-patient `df_clinical[df_clinical['Case ID'] == pid]`
+    scan (one full-table pass per patient, i.e. quadratic in cohort size).
+
+    Args:
+        df_clinical (pandas.DataFrame): The clinical table ('Case ID', 'Histology').
+        xml_dict (dict): Output of `parse_all_xmls`.
+        df_dirs (pandas.DataFrame): Output of `catalog_patient_dirs`.
+
+    Returns:
+        pandas.DataFrame: One row per patient with all manifest columns, the
+        'patient_dir' (NaN if missing) and the XML series UID, without DICOM metadata.
+    """
+    # Master cohort: all clinical IDs, then top-level DICOM folders without a clinical row.
+    # Nested 'NSCLC Radiogenomics' folders are only used to locate clinical patients.
+    clinical_ids = pd.Series(df_clinical['Case ID'].dropna().unique(), dtype=object)
+    extra_ids = df_dirs.loc[df_dirs['top_level'] & ~df_dirs['subject_id'].isin(clinical_ids), 'subject_id']
+    df = pd.DataFrame({'subject_id': pd.concat([clinical_ids, extra_ids], ignore_index=True)})
+
+    labels = (df_clinical[['Case ID', 'Histology']].dropna(subset=['Case ID'])
+              .drop_duplicates(subset='Case ID', keep='first')
+              .rename(columns={'Case ID': 'subject_id', 'Histology': 'histology'}))
+    df = df.merge(labels, on='subject_id', how='left', indicator='_clinical')
+    df.loc[df['_clinical'] == 'left_only', 'histology'] = "Unknown"
+
+    df_xml = pd.DataFrame.from_dict(xml_dict, orient='index',
+                                    columns=['series_uid', 'sop_uid', 'x_raw', 'y_raw'])
+    df_xml = (df_xml.rename_axis('subject_id').reset_index()
+              .rename(columns={'sop_uid': 'sop_instance_uid'}))
+    df = df.merge(df_xml, on='subject_id', how='left', indicator='_xml')
+    df = df.merge(df_dirs.drop(columns='top_level'), on='subject_id', how='left')
+
+    has_dir = df['patient_dir'].notna()
+    df['xml_present'] = has_dir & (df['_xml'] == 'both')
+    df['selection_reason'] = 'No_DICOM_Folder_Found'
+    df.loc[has_dir & df['xml_present'], 'selection_reason'] = 'XML_Ground_Truth'
+    df.loc[has_dir & ~df['xml_present'], 'selection_reason'] = 'Fallback_Auto_Best_CT'
+
+    # XML fields are only taken over for patients whose DICOM folder exists
+    for column in ['sop_instance_uid', 'x_raw', 'y_raw']:
+        df[column] = df[column].where(df['xml_present'], None)
+    df['chosen_series_uid'] = df['series_uid'].where(df['xml_present'], None)
+
+    for column in META_COLUMNS + ['x_pixel', 'y_pixel']:
+        df[column] = None
+    df['slice_count'] = 0
+    df['qc_pass'] = False
+    df['coordinate_mapped_successfully'] = False
+    return df[MANIFEST_COLUMNS + ['patient_dir']]
+
+def run():
     """
     Executes the central manifest creation pipeline.
+
+    All table work (clinical labels, XML records, folder lookup) is done with
+    keyed merges; the per-patient loop only reads DICOM headers.
+
+    Returns:
+        pandas.DataFrame or None: The new manifest, or None if the clinical CSV is missing.
     """
     print("Starting manifest creation (Full Cohort)...")
     
     if not FILE_CLINICAL.exists():
         print(f"ERROR: Clinical CSV not found at {FILE_CLINICAL}")
-        return
+        return None
         
     df_clinical = pd.read_csv(FILE_CLINICAL)
     df_clinical.columns = [c.strip() for c in df_clinical.columns]
-    all_patients = df_clinical['Case ID'].dropna().unique().tolist()
-    
-    for p in DIR_DICOM.iterdir():
-        if p.is_dir() and p.name not in all_patients and p.name != "NSCLC Radiogenomics":
-            all_patients.append(p.name)
 
-    print(f"{len(all_patients)} patients found in the master cohort.")
     print("Parsing all XML files...")
-    xml_dict = parse_all_xmls()
-    
-    manifest_rows = []
-    
-    for pid in tqdm(all_patients, desc="Creating patient entries"):
-        histology = "Unknown"
-        clinical_match = df_clinical[df_clinical['Case ID'] == pid]
-        if len(clinical_match) > 0:
-            histology = clinical_match.iloc[0]['Histology']
-        
-        row = {
-            'subject_id': pid,
-            'histology': histology,
-            'xml_present': False,
-            'chosen_series_uid': None,
-            'selection_reason': None,
-            'slice_thickness': None,
-            'spacing_between_slices': None,
-            'pixel_spacing_x': None,
-            'pixel_spacing_y': None,
-            'reconstruction_kernel': None,
-            'series_description': None,
-            'slice_count': 0,
-            'qc_pass': False,
-            'sop_instance_uid': None,
-            'x_raw': None,
-            'y_raw': None,
-            'x_pixel': None,
-            'y_pixel': None,
-            'coordinate_mapped_successfully': False
-        }
-        
-        patient_dir = DIR_DICOM / pid
-        if not patient_dir.exists():
-            patient_dir = DIR_DICOM / "NSCLC Radiogenomics" / pid
-            
-        if not patient_dir.exists():
-            row['selection_reason'] = 'No_DICOM_Folder_Found'
-            manifest_rows.append(row)
-            continue
-            
-        if pid in xml_dict:
-            row['xml_present'] = True
-            row['selection_reason'] = 'XML_Ground_Truth'
-            row['chosen_series_uid'] = xml_dict[pid]['series_uid']
-            row['sop_instance_uid'] = xml_dict[pid]['sop_uid']
-            row['x_raw'] = xml_dict[pid]['x_raw']
-            row['y_raw'] = xml_dict[pid]['y_raw']
-            
-            meta = get_exact_dicom_metadata(patient_dir, row['chosen_series_uid'])
-            if meta:
-                row.update(meta)
-                row['qc_pass'] = True
-                if row['x_raw'] is not None:
-                    row['coordinate_mapped_successfully'] = True
+    with span("parse_xml") as s:
+        xml_dict = parse_all_xmls()
+        s.add_items(len(xml_dict))
+    with span("join_sources") as s:
+        df = join_patient_sources(df_clinical, xml_dict, catalog_patient_dirs())
+        s.add_items(len(df))
+    print(f"{len(df)} patients found in the master cohort.")
+
+    # Filesystem work only for patients with a DICOM folder
+    meta_rows = {}
+    todo = df[df['patient_dir'].notna()]
+    with span("read_dicom_metadata", items=len(todo)):
+        for idx, pid, patient_dir, xml_present, target_uid in tqdm(
+                zip(todo.index, todo['subject_id'], todo['patient_dir'], todo['xml_present'], todo['chosen_series_uid']),
+                total=len(todo), desc="Reading DICOM metadata"):
+            if xml_present:
+                meta = get_exact_dicom_metadata(patient_dir, target_uid)
+                if meta:
+                    meta_rows[idx] = dict(meta, qc_pass=True)
+                else:
+                    meta_rows[idx] = {'selection_reason': 'XML_UID_Not_Found_On_Disk'}
             else:
-                row['qc_pass'] = False
-                row['selection_reason'] = 'XML_UID_Not_Found_On_Disk'
-                
-        else:
-            row['xml_present'] = False
-            row['selection_reason'] = 'Fallback_Auto_Best_CT'
-            
-            fallback_uid, meta = get_best_fallback_series(patient_dir)
-            if fallback_uid and meta:
-                row['chosen_series_uid'] = fallback_uid
-                row.update(meta)
-                row['qc_pass'] = True 
-        
-        manifest_rows.append(row)
-        
-    df_manifest = pd.DataFrame(manifest_rows)
-    
-    out_path = DIR_PROCESSED / "manifest.csv"
-    df_manifest.to_csv(out_path, index=False, sep=';', decimal=',')
+                fallback_uid, meta = get_best_fallback_series(patient_dir)
+                if fallback_uid and meta:
+                    meta_rows[idx] = dict(meta, chosen_series_uid=fallback_uid, qc_pass=True)
+
+    if meta_rows:
+        df_meta = pd.DataFrame.from_dict(meta_rows, orient='index')
+        for column in df_meta.columns:
+            found = df_meta[column].notna()
+            df.loc[df_meta.index[found], column] = df_meta.loc[found, column]
+
+    df['coordinate_mapped_successfully'] = df['xml_present'] & df['qc_pass'] & df['x_raw'].notna()
+    return df[MANIFEST_COLUMNS].reset_index(drop=True)
+
+@instrumented("02_create_manifest")
+def main():
+    """
+    Creates the manifest and saves it (atomically) as 'manifest.parquet'.
+    """
+    df_manifest = run()
+    if df_manifest is None:
+        return
+
+    df_manifest = write_manifest(df_manifest)
     
     print("\n" + "="*50)
     print("MANIFEST SUCCESSFULLY CREATED")
     print("="*50)
-    print(f"Saved to: {out_path}")
+    print(f"Saved to: {FILE_MANIFEST}")
     print(f"\nTotal Patients: {len(df_manifest)}")
 
 if __name__ == "__main__":
@@ -1,30 +1,31 @@
 """
-2D Coordinate Mapping and Visual QC Script.
+2D Coordinate Mapping and QC Script.
 
 This script updates the central manifest by translating raw clinical XML 
 float coordinates (x_raw, y_raw) into exact, integer-based pixel array indices 
 (x_pixel, y_pixel). It validates that the coordinates fall within the image 
-bounds (e.g., 512x512). To ensure the mapping algorithm is flawless before 
-extracting ML tensors, it randomly selects 20 patients and generates visual 
-Quality Control (QC) overlay images, plotting a red cross directly onto the 
-target DICOM slice.
+bounds (e.g., 512x512), vectorized across the cohort on top of the cached DICOM
+header index, and writes every failed case to a report table.
+
+The visual Quality Control (QC) overlays, a red cross plotted directly onto
+the target DICOM slice, are rendered by the separate 09_render_qc_overlays.py
+stage.
 """
 
+import sys
 import pandas as pd
-import pydicom
-import os
-import matplotlib.pyplot as plt
 from pathlib import Path
-from tqdm import tqdm
 import numpy as np
-import random  # NEW: For random selection
 
 # --- CONFIGURATION ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DIR_DICOM = PROJECT_ROOT / "data" / "raw" / "dicom"
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
-DIR_QC = PROJECT_ROOT / "data" / "qc_overlays"
-DIR_QC.mkdir(parents=True, exist_ok=True)
+FILE_MAPPING_REPORT = PROJECT_ROOT / "data" / "processed" / "coordinate_mapping_report.csv"
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest, write_manifest, manifest_exists, atomic_write, FILE_MANIFEST
+from utils.dicom_index import build_header_index
+from utils.instrumentation import instrumented, span
 
 def clean_uid(uid):
     """
@@ -39,151 +40,118 @@ def clean_uid(uid):
     if pd.isna(uid) or uid is None: return None
     return str(uid).strip().replace('\x00', '')
 
-def transform_to_hu(dicom_ds):
+def map_coordinates(targets):
     """
-    Converts raw pixel values to Hounsfield Units (Standard for CTs).
+    Rounds the XML coordinates to pixels and checks them against the slice size.
 
-    This function applies the RescaleIntercept and RescaleSlope from the 
-    DICOM header to the raw pixel array, transforming it into radiologically 
-    standardized Hounsfield Units.
+    All operations are vectorized over the cohort. Rounding follows Python's
+    `round` (half to even), exactly like the former per-row implementation.
 
     Args:
-        dicom_ds (pydicom.dataset.FileDataset): The loaded DICOM file object.
+        targets (pandas.DataFrame): One row per patient with 'x_raw', 'y_raw'
+            and the target slice's 'rows'/'columns' (NaN if the slice was not found).
 
     Returns:
-        numpy.ndarray: The converted image array in HU (as float64).
+        tuple: (x_pixel, y_pixel, in_bounds) as NumPy arrays.
     """
-    image = dicom_ds.pixel_array.astype(np.float64)
-    intercept = dicom_ds.RescaleIntercept if 'RescaleIntercept' in dicom_ds else -1024.0
-    slope = dicom_ds.RescaleSlope if 'RescaleSlope' in dicom_ds else 1.0
-    image = (image * slope) + intercept
-    return image
+    x_pixel = np.round(targets['x_raw'].to_numpy(dtype=np.float64))
+    y_pixel = np.round(targets['y_raw'].to_numpy(dtype=np.float64))
+    columns = targets['columns'].to_numpy(dtype=np.float64, na_value=np.nan)
+    rows = targets['rows'].to_numpy(dtype=np.float64, na_value=np.nan)
+    # NaN comparisons are False, so missing slices or coordinates fail the check
+    in_bounds = (x_pixel >= 0) & (x_pixel < columns) & (y_pixel >= 0) & (y_pixel < rows)
+    return x_pixel, y_pixel, in_bounds
 
-def main():
+def run(df):
     """
-    Executes the coordinate mapping and random visual QC pipeline.
+    Executes the vectorized coordinate mapping.
 
     The function performs the following operations:
-    1. Loads the manifest and filters for valid patients with XML data.
-    2. Randomly selects a subset of up to 20 patients for visual QC.
-    3. Iterates over the valid patients, locating their specific target DICOM 
-       file using the `SOPInstanceUID`.
-    4. Rounds the raw XML float coordinates to nearest integer pixel indices.
-    5. Performs an in-bounds check against the image dimensions (Rows/Columns).
-    6. For the selected QC patients, renders the CT slice (converted to HU) 
-       and plots a red cross at the calculated pixel coordinates, saving it to disk.
-    7. Updates the central manifest with the calculated `x_pixel`, `y_pixel`, 
+    1. Filters the manifest for valid patients with XML data.
+    2. Loads the cached DICOM header index of these patients (see
+       `utils.dicom_index`) and joins every target `SOPInstanceUID` to the
+       Rows/Columns of its slice.
+    3. Rounds the raw XML float coordinates to nearest integer pixel indices
+       and performs the in-bounds check, vectorized across the cohort.
+    4. Updates the central manifest with the calculated `x_pixel`, `y_pixel`, 
        and a boolean `coordinate_mapped_successfully` flag.
+    5. Writes all failed cases (slice not found / missing coordinates /
+       out of bounds) to a report table.
+
+    The visual QC overlays are rendered by 09_render_qc_overlays.py.
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+
+    Returns:
+        pandas.DataFrame: The updated manifest.
+    """
+    # We only process those that have an XML and where we found images
+    mask = (df['xml_present'] == True) & (df['qc_pass'] == True)
+    patients_to_process = df[mask]
+    print(f"Processing {len(patients_to_process)} patients with XML annotations...")
+
+    with span("header_index", items=len(patients_to_process)):
+        index = build_header_index(patients_to_process['subject_id'].tolist())
+    slice_table = index[['subject_id', 'series_uid', 'sop_uid', 'path', 'rows', 'columns']].drop_duplicates(
+        subset=['subject_id', 'series_uid', 'sop_uid'], keep='first')
+
+    targets = pd.DataFrame({
+        'subject_id': patients_to_process['subject_id'].to_numpy(dtype=object),
+        'series_uid': patients_to_process['chosen_series_uid'].map(clean_uid).to_numpy(dtype=object),
+        'sop_uid': patients_to_process['sop_instance_uid'].map(clean_uid).to_numpy(dtype=object),
+        'x_raw': patients_to_process['x_raw'].to_numpy(dtype=np.float64, na_value=np.nan),
+        'y_raw': patients_to_process['y_raw'].to_numpy(dtype=np.float64, na_value=np.nan),
+    }, index=patients_to_process.index)
+    targets = targets.reset_index().merge(slice_table, on=['subject_id', 'series_uid', 'sop_uid'],
+                                          how='left').set_index('index')
+
+    with span("map_coordinates", items=len(targets)):
+        x_pixel, y_pixel, in_bounds = map_coordinates(targets)
+    mapped = targets.index[in_bounds]
+
+    df['coordinate_mapped_successfully'] = df['coordinate_mapped_successfully'].astype(bool)
+    df.loc[targets.index, 'coordinate_mapped_successfully'] = in_bounds
+    df.loc[mapped, 'x_pixel'] = x_pixel[in_bounds].astype(np.int64)
+    df.loc[mapped, 'y_pixel'] = y_pixel[in_bounds].astype(np.int64)
+
+    # Report table of all failed cases instead of per-patient warnings
+    slice_found = targets['path'].notna().to_numpy()
+    has_coordinates = (targets['x_raw'].notna() & targets['y_raw'].notna()).to_numpy()
+    reason = np.select([~slice_found, ~has_coordinates], ['Slice_Not_Found', 'Missing_Coordinates'], 'Out_Of_Bounds')
+    report = targets.loc[~in_bounds, ['subject_id', 'sop_uid', 'x_raw', 'y_raw', 'columns', 'rows']].copy()
+    report.insert(1, 'reason', reason[~in_bounds])
+    report['x_pixel'] = pd.array(x_pixel[~in_bounds], dtype='Int64')
+    report['y_pixel'] = pd.array(y_pixel[~in_bounds], dtype='Int64')
+    atomic_write(FILE_MAPPING_REPORT, lambda tmp: report.to_csv(tmp, index=False, sep=';', decimal=','))
+    if len(report) > 0:
+        print(f"WARNING: {len(report)} patients could not be mapped (see {FILE_MAPPING_REPORT.name}):")
+        print(report['reason'].value_counts().to_string())
+
+    return df
+
+@instrumented("03_coordinate_mapping_and_qc")
+def main():
+    """
+    Loads the manifest, runs the mapping, and writes the manifest back.
     """
     print("Starting 2D Coordinate Mapping and QC...")
     
-    if not FILE_MANIFEST.exists():
+    if not manifest_exists():
         print("ERROR: Manifest not found.")
         return
         
-    df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
+    df = read_manifest()
+    df = run(df)
     
-    # We only process those that have an XML and where we found images
-    mask = (df['xml_present'] == True) & (df['qc_pass'] == True)
-    patients_to_process = df[mask].copy()
-    
-    # NEW: Select 20 RANDOM patients for the QC images
-    all_valid_pids = patients_to_process['subject_id'].unique().tolist()
-    num_qc_images = min(20, len(all_valid_pids)) # Take 20, or fewer if not enough exist
-    qc_target_pids = set(random.sample(all_valid_pids, num_qc_images))
-    
-    print(f"Processing {len(patients_to_process)} patients with XML annotations...")
-    print(f"Creating QC images for {num_qc_images} randomly selected patients.")
-
-    # Iterate over all relevant patients (for the manifest update)
-    for idx, row in tqdm(patients_to_process.iterrows(), total=len(patients_to_process), desc="Mapping Slices"):
-        pid = row['subject_id']
-        target_series = clean_uid(row['chosen_series_uid'])
-        target_sop = clean_uid(row['sop_instance_uid'])
-        
-        # If the SOP UID is missing
-        if not target_sop:
-            df.at[idx, 'coordinate_mapped_successfully'] = False
-            continue
-            
-        patient_dir = DIR_DICOM / pid
-        if not patient_dir.exists():
-            patient_dir = DIR_DICOM / "NSCLC Radiogenomics" / pid
-            
-        slice_found = False
-        
-        # STEP 1: Find the exact slice (SOPInstanceUID)
-        for root_dir, dirs, files in os.walk(patient_dir):
-            if slice_found: break
-            dicom_files = [f for f in files if f.endswith('.dcm')]
-            
-            for dcm_file in dicom_files:
-                dcm_path = Path(root_dir) / dcm_file
-                try:
-                    # We first read only the metadata to save RAM
-                    ds = pydicom.dcmread(dcm_path, stop_before_pixels=True)
-                    current_series = clean_uid(ds.SeriesInstanceUID)
-                    current_sop = clean_uid(ds.SOPInstanceUID)
-                    
-                    if current_series == target_series and current_sop == target_sop:
-                        slice_found = True
-                        
-                        # STEP 2: Validate coordinates
-                        columns = ds.Columns
-                        rows = ds.Rows
-                        
-                        x_raw = float(row['x_raw'])
-                        y_raw = float(row['y_raw'])
-                        
-                        # Round to whole pixels
-                        x_pixel = int(round(x_raw))
-                        y_pixel = int(round(y_raw))
-                        
-                        # In-Bounds Check
-                        if (0 <= x_pixel < columns) and (0 <= y_pixel < rows):
-                            # Add to manifest
-                            df.at[idx, 'x_pixel'] = x_pixel
-                            df.at[idx, 'y_pixel'] = y_pixel
-                            df.at[idx, 'coordinate_mapped_successfully'] = True
-                            
-                            # STEP 3: Generate Overlay QC (Only for the random 20.)
-                            if pid in qc_target_pids:
-                                ds_full = pydicom.dcmread(dcm_path)
-                                image_hu = transform_to_hu(ds_full)
-                                
-                                plt.figure(figsize=(8, 8))
-                                plt.imshow(image_hu, cmap='gray', vmin=-1000, vmax=400) 
-                                plt.plot(x_pixel, y_pixel, 'rx', markersize=15, markeredgewidth=3)
-                                plt.title(f"{pid} - Tumor Marking\nSOP: {current_sop[-10:]}\nX: {x_pixel}, Y: {y_pixel}")
-                                plt.axis('off')
-                                
-                                qc_path = DIR_QC / f"{pid}_QC_Overlay.png"
-                                plt.savefig(qc_path, bbox_inches='tight')
-                                plt.close()
-                                
-                                # So we don't accidentally make 2 images for the same patient
-                                qc_target_pids.remove(pid) 
-                                
-                        else:
-                            # Out of bounds
-                            df.at[idx, 'coordinate_mapped_successfully'] = False
-                            print(f"\nWARNING: {pid}: Coordinates Out-Of-Bounds. (x:{x_pixel}, y:{y_pixel} on {columns}x{rows})")
-                            
-                        break # Slice found, we can jump to the next file
-                except Exception as e:
-                    continue
-        
-        if not slice_found:
-            df.at[idx, 'coordinate_mapped_successfully'] = False
-            
     # Update Manifest
-    df.to_csv(FILE_MANIFEST, index=False, sep=';', decimal=',')
+    df = write_manifest(df)
     
     print("\n" + "="*50)
     print("MAPPING AND QC COMPLETE")
     print("="*50)
     print(f"Manifest updated: {FILE_MANIFEST}")
-    print(f"QC images saved in: {DIR_QC}")
+    print(f"Mapping failures: {FILE_MAPPING_REPORT}")
     print("\nMapping Statistics:")
     print(df[df['xml_present'] == True]['coordinate_mapped_successfully'].value_counts())
 
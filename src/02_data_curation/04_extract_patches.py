@@ -7,26 +7,44 @@ window in the X/Y plane and extending 3 slices above and below the target Z-axis
 slice (resulting in a 128x128x7 tensor). The script handles anatomical Z-axis 
 sorting, Hounsfield Unit conversion, and edge-case padding (using -1000 HU / Air) 
 for tumors located near the lung boundaries. Extracted patches are saved as numpy `.npy` arrays.
+
+With `--mode 3d` the script instead produces true volumetric patches: cubic
+crops (64x64x64 voxels at 1 mm isotropic spacing) resampled from the
+memory-mapped HU volume cache. Only the crop region of each series is read from
+disk, so the full-resolution series is never held in RAM. `--crop_body` builds
+new cache entries cropped to the body bounding box (see 08_precompute_body_masks.py).
 """
 
-import pandas as pd
+import sys
+import math
+import argparse
 import pydicom
 import os
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
+from scipy.ndimage import map_coordinates
 
 # --- CONFIGURATION (Defining the professor's specifications here) ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DIR_DICOM = PROJECT_ROOT / "data" / "raw" / "dicom"
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
 
 # PATCH PARAMETERS (Documented for protocol & manifest)
 PATCH_SIZE_XY = 128
 PATCH_SLICES_Z_PLUS_MINUS = 3  # +/- 3 Slices -> Total of 7 Slices (2.5D)
 
+# 3D PATCH PARAMETERS (Cubic crop at isotropic spacing)
+PATCH_SIZE_3D = 64
+PATCH_SPACING_3D_MM = 1.0
+
 DIR_PATCHES = PROJECT_ROOT / "data" / "processed" / "patches_2_5D"
 DIR_PATCHES.mkdir(parents=True, exist_ok=True)
+DIR_PATCHES_3D = PROJECT_ROOT / "data" / "processed" / "patches_3D"
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.volume_cache import get_or_build_volume, load_volume, AIR_HU
+from utils.manifest import read_manifest, write_manifest, FILE_MANIFEST
+from utils.instrumentation import instrumented, count_items
 
 def transform_to_hu(dicom_ds):
     """
@@ -137,20 +155,149 @@ def extract_2_5d_patch(slices_info, target_sop, x_center, y_center):
     patch_3d = np.stack(patch_volume, axis=0)
     return patch_3d, "Success"
 
-def main():
+def extract_3d_patch(volume, meta, target_sop, x_center, y_center):
     """
-    Executes the batched 2.5D patch extraction pipeline.
+    Extracts a cubic patch at isotropic spacing from a cached HU volume.
+
+    Only the voxels covering the physical extent of the cube (plus a one voxel 
+    margin for interpolation) are read from the memory-mapped volume. The tumor 
+    coordinates are given in full-series coordinates and shifted by the cache 
+    offset, so body-cropped caches yield the same patch. Like the 
+    2.5D extraction, the Z-axis duplicates the outermost slice at the edge of 
+    the scan, while X/Y is padded with -1000 HU (Air). The crop is then 
+    resampled trilinearly to PATCH_SIZE_3D voxels per axis.
+
+    Args:
+        volume (numpy.ndarray): The (Z, Y, X) HU volume (usually a memory map).
+        meta (dict): The cache metadata of the volume.
+        target_sop (str): The SOPInstanceUID of the center slice containing the tumor.
+        x_center (int): The X pixel coordinate of the tumor center.
+        y_center (int): The Y pixel coordinate of the tumor center.
+
+    Returns:
+        tuple: (numpy.ndarray, str). The int16 patch of shape (D, H, W) and a 
+        status message. Returns (None, error) on failure.
+    """
+    if target_sop not in meta['sop_uids']:
+        return None, "Target SOP not found in series"
+
+    full_center = (meta['sop_uids'].index(target_sop), y_center, x_center)
+    center = tuple(c - o for c, o in zip(full_center, meta['offset']))
+    spacing = (meta['slice_spacing'], meta['pixel_spacing'][0], meta['pixel_spacing'][1])
+    half_extent_mm = PATCH_SIZE_3D * PATCH_SPACING_3D_MM / 2
+
+    # Voxel window (per axis) in the original grid that covers the cube
+    starts, stops = [], []
+    for c, sp in zip(center, spacing):
+        half = int(math.ceil(half_extent_mm / sp)) + 1
+        starts.append(c - half)
+        stops.append(c + half + 1)
+
+    # Z: clip indices (duplicates edge slices), reads only the needed slices
+    z_idx = np.clip(np.arange(starts[0], stops[0]), 0, volume.shape[0] - 1)
+    z_lo, z_hi = z_idx.min(), z_idx.max() + 1
+    slab = volume[z_lo:z_hi]
+
+    # Y/X: copy the in-bounds part into an air-filled block
+    block = np.full((len(z_idx), stops[1] - starts[1], stops[2] - starts[2]), AIR_HU, dtype=np.int16)
+    y0, y1 = max(starts[1], 0), min(stops[1], volume.shape[1])
+    x0, x1 = max(starts[2], 0), min(stops[2], volume.shape[2])
+    if y0 < y1 and x0 < x1:
+        block[:, y0 - starts[1]:y1 - starts[1], x0 - starts[2]:x1 - starts[2]] = \
+            slab[z_idx - z_lo, y0:y1, x0:x1]
+
+    # Sample positions of the isotropic output grid inside the block
+    offsets_mm = (np.arange(PATCH_SIZE_3D) - (PATCH_SIZE_3D - 1) / 2) * PATCH_SPACING_3D_MM
+    axes = [(c - s) + offsets_mm / sp for c, s, sp in zip(center, starts, spacing)]
+    grid = np.meshgrid(*axes, indexing='ij')
+
+    patch = map_coordinates(block.astype(np.float32), grid, order=1, mode='nearest')
+    return np.rint(patch).astype(np.int16), "Success"
+
+@instrumented("04_extract_patches_3d")
+def main_3d(crop_body=False):
+    """
+    Executes the 3D volumetric patch extraction pipeline.
 
     The function performs the following operations:
     1. Loads the manifest and filters for successfully mapped patients.
+    2. Reuses the memory-mapped HU volume cache of each series, or builds it
+       (the patient's DICOM headers are only scanned on a cache miss).
+    3. Extracts the isotropic cubic patch around the mapped tumor coordinates.
+    4. Saves the extracted tensor as a numpy `.npy` file.
+    5. Updates the manifest with the 3D patch status and file paths, leaving 
+       the 2.5D columns untouched.
+
+    Args:
+        crop_body (bool): If True, new cache entries keep only the body bounding box.
+    """
+    print("Starting 3D Patch Extraction...")
+    DIR_PATCHES_3D.mkdir(parents=True, exist_ok=True)
+
+    df = read_manifest()
+    mask = (df['coordinate_mapped_successfully'] == True)
+    patients_to_process = df[mask].copy()
+
+    print(f"Processing {len(patients_to_process)} validated patients...")
+
+    df['patch_3d_size'] = PATCH_SIZE_3D
+    df['patch_3d_spacing_mm'] = PATCH_SPACING_3D_MM
+    df['patch_3d_extracted'] = False
+    df['patch_3d_file_path'] = None
+
+    for idx, row in tqdm(patients_to_process.iterrows(), total=len(patients_to_process)):
+        pid = row['subject_id']
+        t_series = str(row['chosen_series_uid']).strip()
+        t_sop = str(row['sop_instance_uid']).strip()
+
+        patient_dir = DIR_DICOM / pid
+        if not patient_dir.exists():
+            patient_dir = DIR_DICOM / "NSCLC Radiogenomics" / pid
+
+        # 1. Decode the series once into the memory-mapped cache (headers are only scanned on a miss)
+        volume, meta = load_volume(t_series)
+        if volume is None:
+            slices_info = get_sorted_dicom_series(patient_dir, t_series)
+            if not slices_info:
+                continue
+            volume, meta = get_or_build_volume(slices_info, t_series, crop_to_body=crop_body)
+
+        # 2. Cut out the isotropic cube (reads only the crop from disk)
+        patch_array, status = extract_3d_patch(volume, meta, t_sop, int(row['x_pixel']), int(row['y_pixel']))
+
+        if status == "Success":
+            filepath = DIR_PATCHES_3D / f"{pid}_patch_{PATCH_SIZE_3D}_3D.npy"
+            np.save(filepath, patch_array)
+
+            df.at[idx, 'patch_3d_extracted'] = True
+            df.at[idx, 'patch_3d_file_path'] = str(filepath.relative_to(PROJECT_ROOT))
+            count_items()
+
+    df = write_manifest(df)
+
+    print("\n" + "="*50)
+    print("3D PATCH EXTRACTION COMPLETE")
+    print("="*50)
+    print(f"Patches saved in: {DIR_PATCHES_3D}")
+    print(f"Manifest updated: {FILE_MANIFEST}")
+
+def run(df):
+    """
+    Executes the batched 2.5D patch extraction pipeline.
+
+    The function performs the following operations:
+    1. Filters the manifest for successfully mapped patients.
     2. Iterates through the cohort, sorting their DICOM slices anatomically.
     3. Extracts the 128x128x7 tensor around the mapped tumor coordinates.
     4. Saves the extracted tensor as a numpy `.npy` file.
     5. Updates the central manifest with patch extraction status and file paths.
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+
+    Returns:
+        pandas.DataFrame: The updated manifest.
     """
-    print("Starting 2.5D Patch Extraction...")
-    
-    df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
     mask = (df['coordinate_mapped_successfully'] == True)
     patients_to_process = df[mask].copy()
     
@@ -191,9 +338,22 @@ def main():
             # 4. Document in the manifest
             df.at[idx, 'patch_extracted'] = True
             df.at[idx, 'patch_file_path'] = str(filepath.relative_to(PROJECT_ROOT))
+            count_items()
+            
+    return df
+
+@instrumented("04_extract_patches")
+def main():
+    """
+    Loads the manifest, extracts all 2.5D patches and writes the manifest back.
+    """
+    print("Starting 2.5D Patch Extraction...")
+    
+    df = read_manifest()
+    df = run(df)
             
     # Update Manifest
-    df.to_csv(FILE_MANIFEST, index=False, sep=';', decimal=',')
+    df = write_manifest(df)
     
     print("\n" + "="*50)
     print("PATCH EXTRACTION COMPLETE")
@@ -202,4 +362,14 @@ def main():
     print(f"Manifest updated: {FILE_MANIFEST}")
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', type=str, default='2.5d', choices=['2.5d', '3d'],
+                        help="2.5d = 7-slice stacks, 3d = isotropic cubic crops from the volume cache")
+    parser.add_argument('--crop_body', action='store_true',
+                        help="3d mode: cache only the body bounding box of newly decoded series")
+    args = parser.parse_args()
+
+    if args.mode == '3d':
+        main_3d(crop_body=args.crop_body)
+    else:
+        main()
\ No newline at end of file
@@ -7,19 +7,28 @@ the training, validation, and test sets. It explicitly filters out ambiguous
 "NOS" cases and rare subtypes that lack enough samples to be split.
 """
 
-import pandas as pd
+import sys
 from sklearn.model_selection import train_test_split
 from pathlib import Path
 
 # --- CONFIGURATION ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest, write_manifest
+from utils.instrumentation import instrumented
 
-def main():
+def run(df):
+    """
+    Assigns the stratified Train/Validation/Test split to the manifest.
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+
+    Returns:
+        pandas.DataFrame: The manifest with the 'dataset_split' column.
+    """
     print("Creating stratified data split...")
     
-    df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
-    
     # 1. Filter for patients that passed QC and have patches
     valid_df = df[df['patch_extracted'] == True].copy()
     
@@ -68,11 +77,17 @@ def main():
     df.loc[val_df.index, 'dataset_split'] = 'Validation'
     df.loc[test_df.index, 'dataset_split'] = 'Test'
     
-    # Save the updated manifest
-    df.to_csv(FILE_MANIFEST, index=False, sep=';', decimal=',')
-    
     print("\nSplit complete. Final Distribution in Manifest:")
     print(df['dataset_split'].value_counts())
+    return df
+
+@instrumented("05_split_data")
+def main():
+    df = read_manifest()
+    df = run(df)
+    
+    # Save the updated manifest
+    df = write_manifest(df)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+Multi-Window Channel Precomputation Script.
+
+This script moves radiological windowing out of the training loop. For every
+extracted 2.5D patch it applies a configurable set of CT windows (by default
+the lung window L-600/W1500 and the mediastinal window L50/W350) through
+precomputed uint8 lookup tables. One 7-slice patch thus becomes 7xK uint8
+channels, stored in a single memory-mapped array at 1 byte/voxel.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.windowing import parse_window
+from utils.manifest import read_manifest
+from utils.patch_store import build_window_store, DIR_WINDOW_STORE, FILE_CHANNELS
+from utils.instrumentation import instrumented, count_items
+
+@instrumented("06_build_window_channels")
+def main():
+    """
+    Executes the window channel precomputation.
+
+    The function performs the following steps:
+    1. Parses the requested windows (presets or 'name:center:width').
+    2. Loads the manifest and selects all patients with an extracted patch.
+    3. Windows every patch through the lookup tables and writes the uint8 store.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--windows', nargs='+', default=['lung', 'mediastinal'],
+                        help="Window presets or 'name:center:width' specifications")
+    args = parser.parse_args()
+
+    windows = [parse_window(w) for w in args.windows]
+    print("Starting multi-window channel precomputation...")
+    for name, center, width in windows:
+        print(f" -> {name}: L:{center}, W:{width}")
+
+    df = read_manifest(columns=['subject_id', 'patch_extracted', 'patch_file_path'])
+    n_patches = int((df['patch_extracted'] == True).sum())
+    if n_patches == 0:
+        print("ERROR: No extracted patches found. Run 04_extract_patches.py first.")
+        return
+
+    index = build_window_store(df, windows)
+    count_items(len(index))
+
+    print("\n" + "="*50)
+    print("WINDOW CHANNELS COMPLETE")
+    print("="*50)
+    print(f"Patches stored: {len(index)} ({len(windows)} windows each)")
+    print(f"Store saved to: {DIR_WINDOW_STORE / FILE_CHANNELS}")
+
+if __name__ == "__main__":
+    main()
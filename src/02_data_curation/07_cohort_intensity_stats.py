@@ -0,0 +1,104 @@
+"""
+Cohort-Wide HU Histogram and Intensity Statistics Script.
+
+This script streams every series in the memory-mapped HU volume cache and
+accumulates exact integer HU histograms (via `np.bincount` on offset int16
+values) together with the per-series minimum, maximum and mean. Series are
+processed in parallel worker processes and the partial histograms are merged
+at the end. The result is a single Parquet table: one row per series plus one
+cohort row whose mean/std and 0.5/99.5 percentiles serve as the normalization
+constants for training.
+"""
+
+import os
+import sys
+import argparse
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.volume_cache import load_volume, DIR_VOLUME_CACHE
+from utils.manifest import read_manifest, manifest_exists
+from utils.intensity_stats import (volume_histogram, merge_partials, summarize,
+                                   FILE_INTENSITY_STATS, COHORT_ROW)
+from utils.instrumentation import instrumented, count_items
+
+def process_series(series_uid):
+    """
+    Worker: streams one cached volume and returns its partial statistics.
+
+    Args:
+        series_uid (str): The SeriesInstanceUID of the cached volume.
+
+    Returns:
+        tuple: (series_uid, partial dict from `volume_histogram`).
+    """
+    volume, _ = load_volume(series_uid)
+    return series_uid, volume_histogram(volume)
+
+@instrumented("07_cohort_intensity_stats")
+def main():
+    """
+    Executes the cohort intensity statistics job.
+
+    The function performs the following steps:
+    1. Lists all series in the HU volume cache.
+    2. Streams each volume in a process pool, computing partial histograms.
+    3. Merges the partials into the cohort histogram and derives the
+       normalization constants.
+    4. Writes one Parquet table (per-series rows + cohort row).
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print("Starting cohort-wide HU statistics...")
+
+    series_uids = sorted(p.stem for p in DIR_VOLUME_CACHE.glob("*.json"))
+    if len(series_uids) == 0:
+        print(f"ERROR: No cached volumes found in {DIR_VOLUME_CACHE}.")
+        print("Run 04_extract_patches.py --mode 3d first to build the volume cache.")
+        return
+
+    # Subject IDs for readability of the table
+    subject_by_series = {}
+    if manifest_exists():
+        df_manifest = read_manifest(columns=['subject_id', 'chosen_series_uid'])
+        subject_by_series = dict(zip(df_manifest['chosen_series_uid'], df_manifest['subject_id']))
+
+    partials = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for series_uid, partial in tqdm(pool.map(process_series, series_uids),
+                                        total=len(series_uids), desc="Streaming volumes"):
+            partials[series_uid] = partial
+            count_items()
+
+    rows = []
+    for series_uid in series_uids:
+        row = {'series_uid': series_uid, 'subject_id': subject_by_series.get(series_uid)}
+        row.update(summarize(partials[series_uid]))
+        rows.append(row)
+
+    cohort = {'series_uid': COHORT_ROW, 'subject_id': None}
+    cohort.update(summarize(merge_partials(list(partials.values()))))
+    rows.append(cohort)
+
+    df_stats = pd.DataFrame(rows)
+    FILE_INTENSITY_STATS.parent.mkdir(parents=True, exist_ok=True)
+    df_stats.to_parquet(FILE_INTENSITY_STATS, index=False)
+
+    print("\n" + "="*50)
+    print("COHORT HU STATISTICS COMPLETE")
+    print("="*50)
+    print(f"Series processed: {len(series_uids)}")
+    print(f"Cohort Mean HU: {cohort['hu_mean']:.1f} | Std: {cohort['hu_std']:.1f}")
+    print(f"Cohort 0.5% / 99.5% HU: {cohort['hu_p005']} / {cohort['hu_p995']}")
+    print(f"Saved to: {FILE_INTENSITY_STATS}")
+
+if __name__ == "__main__":
+    main()
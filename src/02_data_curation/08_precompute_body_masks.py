@@ -0,0 +1,79 @@
+"""
+Body and Lung Mask Precomputation Script.
+
+This script runs once per series in the HU volume cache. It computes a body
+mask (HU thresholding, 3D connected components, largest component, holes
+filled) and a lung mask, and stores both bit-packed next to the volume. With
+`--crop` the cached volume is rewritten to the body bounding box plus a
+margin, and the box offset is recorded in the cache metadata. Every later
+full-volume operation (montages, histograms, sliding-window inference) then
+only touches the patient instead of the surrounding air and scanner table.
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from tqdm import tqdm
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.volume_cache import precompute_body_mask, DIR_VOLUME_CACHE, BODY_MARGIN_VOXELS
+from utils.instrumentation import instrumented, count_items
+
+def process_series(series_uid, crop, margin):
+    """
+    Worker: computes the masks of one series and returns the size reduction.
+
+    Args:
+        series_uid (str): The SeriesInstanceUID of the cached volume.
+        crop (bool): If True, the cache is cropped to the body bounding box.
+        margin (int): Voxels kept around the body on every side.
+
+    Returns:
+        tuple: (full voxel count, stored voxel count).
+    """
+    meta = precompute_body_mask(series_uid, crop=crop, margin=margin)
+    full = meta['full_shape'][0] * meta['full_shape'][1] * meta['full_shape'][2]
+    stored = meta['shape'][0] * meta['shape'][1] * meta['shape'][2]
+    return full, stored
+
+@instrumented("08_precompute_body_masks")
+def main():
+    """
+    Executes the mask precomputation (and optional cropping) for all cached series.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--crop', action='store_true', help="Rewrite the cache to the body bounding box")
+    parser.add_argument('--margin', type=int, default=BODY_MARGIN_VOXELS)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Labeling is memory hungry (int32 labels per volume), so keep this moderate")
+    args = parser.parse_args()
+
+    print("Starting body/lung mask precomputation...")
+
+    series_uids = sorted(p.stem for p in DIR_VOLUME_CACHE.glob("*.json"))
+    if len(series_uids) == 0:
+        print(f"ERROR: No cached volumes found in {DIR_VOLUME_CACHE}.")
+        return
+
+    worker = partial(process_series, crop=args.crop, margin=args.margin)
+    total_full, total_stored = 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for full, stored in tqdm(pool.map(worker, series_uids), total=len(series_uids), desc="Masking volumes"):
+            total_full += full
+            total_stored += stored
+            count_items()
+
+    print("\n" + "="*50)
+    print("BODY MASKS COMPLETE")
+    print("="*50)
+    print(f"Series processed: {len(series_uids)}")
+    print(f"Cached voxels: {total_stored:,} of {total_full:,} ({total_stored / total_full * 100:.1f}% of the full volumes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Parallel Visual QC Overlay Rendering Script.
+
+This stage renders the Quality Control overlays of the coordinate mapping (the
+target DICOM slice in HU with a red cross at `x_pixel`/`y_pixel`) for every
+successfully mapped patient. It used to run inline in
+03_coordinate_mapping_and_qc.py for 20 random patients with one `plt.figure`
+per patient.
+
+Rendering is headless (Agg backend) and runs in a process pool. Every worker
+builds a single figure once and only swaps the image data, marker and title
+per patient; the canvas is drawn once and its pixel buffer is written both as
+the full-size PNG and as a small thumbnail next to it.
+"""
+
+import os
+import sys
+import random
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pydicom
+from PIL import Image
+from tqdm import tqdm
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_QC = PROJECT_ROOT / "data" / "qc_overlays"
+FIGURE_SIZE_INCH = 8
+FIGURE_DPI = 100
+THUMBNAIL_SIZE = 200
+QC_VMIN, QC_VMAX = -1000, 400
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest, manifest_exists
+from utils.dicom_index import build_header_index
+from utils.volume_cache import slice_to_hu
+from utils.instrumentation import instrumented, span
+
+# Per-process figure, created once by `init_worker`
+_canvas = {}
+
+def get_qc_paths(pid, qc_dir=DIR_QC):
+    """Returns the full-size and thumbnail paths of a patient's QC overlay."""
+    qc_dir = Path(qc_dir)
+    return qc_dir / f"{pid}_QC_Overlay.png", qc_dir / f"{pid}_QC_Overlay_thumb.png"
+
+def init_worker():
+    """Builds the single reusable figure of a worker process."""
+    fig = plt.figure(figsize=(FIGURE_SIZE_INCH, FIGURE_SIZE_INCH), dpi=FIGURE_DPI)
+    ax = fig.add_axes([0.0, 0.0, 1.0, 0.88])
+    ax.axis('off')
+    image = ax.imshow(np.zeros((2, 2), dtype=np.int16), cmap='gray', vmin=QC_VMIN, vmax=QC_VMAX)
+    marker, = ax.plot([], [], 'rx', markersize=15, markeredgewidth=3)
+    title = fig.text(0.5, 0.94, "", ha='center', va='center', fontsize=12)
+    _canvas.update(fig=fig, ax=ax, image=image, marker=marker, title=title)
+
+def render_overlay(task):
+    """
+    Worker: renders the QC overlay of one patient into the reused figure.
+
+    Args:
+        task (tuple): (pid, dcm_path, sop_uid, x_pixel, y_pixel, qc_dir).
+
+    Returns:
+        tuple: (pid, error message or None).
+    """
+    pid, dcm_path, sop_uid, x_pixel, y_pixel, qc_dir = task
+    if not _canvas:
+        init_worker()
+    try:
+        image_hu = slice_to_hu(pydicom.dcmread(dcm_path))
+        height, width = image_hu.shape
+
+        _canvas['image'].set_data(image_hu)
+        _canvas['image'].set_extent((-0.5, width - 0.5, height - 0.5, -0.5))
+        _canvas['ax'].set_xlim(-0.5, width - 0.5)
+        _canvas['ax'].set_ylim(height - 0.5, -0.5)
+        _canvas['marker'].set_data([x_pixel], [y_pixel])
+        _canvas['title'].set_text(f"{pid} - Tumor Marking\nSOP: {sop_uid[-10:]}\nX: {x_pixel}, Y: {y_pixel}")
+
+        fig = _canvas['fig']
+        fig.canvas.draw()
+        rendered = Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).convert('RGB')
+
+        full_path, thumb_path = get_qc_paths(pid, qc_dir)
+        rendered.save(full_path)
+        rendered.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        rendered.save(thumb_path)
+        return pid, None
+    except Exception as e:
+        return pid, str(e)
+
+def collect_tasks(df, qc_dir=DIR_QC, sample=None):
+    """
+    Joins the mapped patients to the DICOM header index to get their slice files.
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+        qc_dir (Path): Output directory.
+        sample (int, optional): Render only this many random patients.
+
+    Returns:
+        list of tuples: One render task per patient.
+    """
+    mapped = df[df['coordinate_mapped_successfully'] == True]
+    index = build_header_index(mapped['subject_id'].tolist())
+    slice_paths = dict(zip(zip(index['subject_id'], index['sop_uid']), index['path']))
+
+    tasks = []
+    for pid, sop_uid, x_pixel, y_pixel in zip(mapped['subject_id'], mapped['sop_instance_uid'],
+                                               mapped['x_pixel'], mapped['y_pixel']):
+        path = slice_paths.get((pid, sop_uid))
+        if path is None or pd.isna(x_pixel) or pd.isna(y_pixel):
+            continue
+        tasks.append((pid, str(PROJECT_ROOT / path), sop_uid, int(x_pixel), int(y_pixel), str(qc_dir)))
+
+    if sample is not None and sample < len(tasks):
+        tasks = random.sample(tasks, sample)
+    return tasks
+
+def run(df, workers=None, sample=None, qc_dir=DIR_QC):
+    """
+    Renders the QC overlays (and thumbnails) of all mapped patients.
+
+    Args:
+        df (pandas.DataFrame): The manifest (not modified).
+        workers (int, optional): Number of render processes (default: all CPUs).
+        sample (int, optional): Render only this many random patients.
+        qc_dir (Path): Output directory.
+
+    Returns:
+        list of tuples: (pid, error) for every patient that failed to render.
+    """
+    Path(qc_dir).mkdir(parents=True, exist_ok=True)
+    with span("collect_tasks") as s:
+        tasks = collect_tasks(df, qc_dir, sample)
+        s.add_items(len(tasks))
+    workers = workers or os.cpu_count() or 1
+    print(f"Rendering QC overlays for {len(tasks)} patients ({workers} workers)...")
+
+    failures = []
+    with span("render", items=len(tasks), workers=workers):
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                results = pool.map(render_overlay, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+                for pid, error in tqdm(results, total=len(tasks), desc="Rendering QC"):
+                    if error is not None:
+                        failures.append((pid, error))
+        else:
+            for task in tqdm(tasks, desc="Rendering QC"):
+                pid, error = render_overlay(task)
+                if error is not None:
+                    failures.append((pid, error))
+
+    for pid, error in failures:
+        print(f"WARNING: {pid}: QC overlay failed ({error})")
+    return failures
+
+@instrumented("09_render_qc_overlays")
+def main():
+    """
+    Loads the manifest and renders the QC overlays of all mapped patients.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--sample', type=int, default=None,
+                        help="Render only N random patients instead of the full cohort")
+    args = parser.parse_args()
+
+    print("Starting QC overlay rendering...")
+    if not manifest_exists():
+        print("ERROR: Manifest not found.")
+        return
+
+    df = read_manifest(columns=['subject_id', 'sop_instance_uid', 'x_pixel', 'y_pixel',
+                                'coordinate_mapped_successfully'])
+    failures = run(df, workers=args.workers, sample=args.sample)
+
+    print("\n" + "="*50)
+    print("QC RENDERING COMPLETE")
+    print("="*50)
+    print(f"Failed: {len(failures)}")
+    print(f"QC images saved in: {DIR_QC}")
+
+if __name__ == "__main__":
+    main()
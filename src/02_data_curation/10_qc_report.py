@@ -0,0 +1,323 @@
+"""
+Cohort Contact-Sheet QC Report Script.
+
+Visual checks used to be scattered over several scripts (the QC overlays of
+the coordinate mapping, 08_locate_exact_tumor.py for one hardcoded patient,
+visualize_first_patient.py for the first patient with ROIs). This script
+builds one static HTML contact sheet for the whole cohort. Every patient card
+shows:
+
+- the target slice (HU, window L-300/W1400) with the mapped crosshair,
+- the ROI contour from the AIM XML (if it has more than one point),
+- the extracted 7-slice 2.5D patch as a strip.
+
+Cards are rendered into a thumbnail cache keyed by a hash of the patch file
+content, the mapped pixel, the target SOP and the ROI, so regenerating the
+report after a small change only re-renders the affected patients.
+
+Output: 'data/qc_report/index.html' with the thumbnails in 'data/qc_report/thumbs/'.
+"""
+
+import os
+import sys
+import html
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pydicom
+from tqdm import tqdm
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_XML = PROJECT_ROOT / "data" / "raw" / "xml"
+DIR_QC = PROJECT_ROOT / "data" / "qc_overlays"
+DIR_QC_REPORT = PROJECT_ROOT / "data" / "qc_report"
+DIR_THUMBS = DIR_QC_REPORT / "thumbs"
+FILE_REPORT = DIR_QC_REPORT / "index.html"
+NS = {'aim': 'gme://caCORE.caCORE/4.4/edu.northwestern.radiology.AIM'}
+
+QC_VMIN, QC_VMAX = -1000, 400
+PATCH_STRIP_SLICES = 7
+CARD_SIZE_INCH = (3.5, 4.2)
+CARD_DPI = 100
+RENDER_VERSION = 1  # Bump to invalidate all cached thumbnails after a layout change
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest, manifest_exists, atomic_write
+from utils.dicom_index import build_header_index
+from utils.volume_cache import slice_to_hu
+from utils.instrumentation import instrumented, span
+
+# Per-process figure, created once by `init_worker`
+_card = {}
+
+def parse_roi_contours():
+    """
+    Reads all 2D ROI coordinates of every AIM XML file.
+
+    Returns:
+        dict: Patient ID -> list of (x, y) pixel coordinates.
+    """
+    contours = {}
+    for xml_path in DIR_XML.rglob("*.xml"):
+        try:
+            root = ET.parse(xml_path).getroot()
+            person = root.find('.//aim:person/aim:id', NS)
+            if person is None: continue
+
+            points = []
+            for coord in root.findall('.//aim:markupEntityCollection//aim:TwoDimensionSpatialCoordinate', NS):
+                x_node = coord.find('aim:x', NS)
+                y_node = coord.find('aim:y', NS)
+                if x_node is not None and y_node is not None:
+                    points.append((float(x_node.attrib.get('value')), float(y_node.attrib.get('value'))))
+            contours[person.attrib.get('value')] = points
+        except Exception:
+            continue
+    return contours
+
+def hash_file(path):
+    """Returns the SHA-1 of a file's content (or of its absence)."""
+    if path is None or not Path(path).exists():
+        return "missing"
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def card_key(patch_path, sop_uid, x_pixel, y_pixel, contour):
+    """
+    Computes the thumbnail cache key of one patient card.
+
+    Returns:
+        str: Short hex digest over the patch content and all drawn annotations.
+    """
+    hasher = hashlib.sha1(f"v{RENDER_VERSION}|{sop_uid}|{x_pixel}|{y_pixel}|{contour}".encode())
+    hasher.update(hash_file(patch_path).encode())
+    return hasher.hexdigest()[:16]
+
+def init_worker():
+    """Builds the single reusable card figure of a worker process."""
+    fig = plt.figure(figsize=CARD_SIZE_INCH, dpi=CARD_DPI)
+    ax_slice = fig.add_axes([0.0, 0.22, 1.0, 0.78])
+    ax_slice.axis('off')
+    slice_image = ax_slice.imshow(np.zeros((2, 2), dtype=np.int16), cmap='gray', vmin=QC_VMIN, vmax=QC_VMAX)
+    contour, = ax_slice.plot([], [], '-', color='yellow', linewidth=1.0)
+    marker, = ax_slice.plot([], [], 'r+', markersize=14, markeredgewidth=1.5)
+
+    strip = []
+    width = 1.0 / PATCH_STRIP_SLICES
+    for i in range(PATCH_STRIP_SLICES):
+        ax = fig.add_axes([i * width, 0.0, width, 0.2])
+        ax.axis('off')
+        strip.append(ax.imshow(np.zeros((2, 2), dtype=np.float32), cmap='gray', vmin=QC_VMIN, vmax=QC_VMAX))
+    _card.update(fig=fig, ax_slice=ax_slice, slice_image=slice_image, contour=contour,
+                 marker=marker, strip=strip)
+
+def render_card(task):
+    """
+    Worker: renders one patient card into the reused figure and saves it.
+
+    Args:
+        task (tuple): (pid, dcm_path or None, x_pixel, y_pixel, contour, patch_path or None, thumb_path).
+
+    Returns:
+        tuple: (pid, error message or None).
+    """
+    pid, dcm_path, x_pixel, y_pixel, contour, patch_path, thumb_path = task
+    if not _card:
+        init_worker()
+    try:
+        if dcm_path is not None:
+            image_hu = slice_to_hu(pydicom.dcmread(dcm_path))
+        else:
+            image_hu = np.full((2, 2), QC_VMIN, dtype=np.int16)
+        height, width = image_hu.shape
+        _card['slice_image'].set_data(image_hu)
+        _card['slice_image'].set_extent((-0.5, width - 0.5, height - 0.5, -0.5))
+        _card['ax_slice'].set_xlim(-0.5, width - 0.5)
+        _card['ax_slice'].set_ylim(height - 0.5, -0.5)
+
+        if x_pixel is not None:
+            _card['marker'].set_data([x_pixel], [y_pixel])
+        else:
+            _card['marker'].set_data([], [])
+        if len(contour) > 1:
+            xs, ys = zip(*(contour + contour[:1]))
+            _card['contour'].set_data(xs, ys)
+        else:
+            _card['contour'].set_data([], [])
+
+        patch = np.load(patch_path) if patch_path is not None else None
+        for i, image in enumerate(_card['strip']):
+            if patch is not None and i < len(patch):
+                image.set_data(patch[i])
+                image.set_extent((-0.5, patch.shape[2] - 0.5, patch.shape[1] - 0.5, -0.5))
+                image.axes.set_xlim(-0.5, patch.shape[2] - 0.5)
+                image.axes.set_ylim(patch.shape[1] - 0.5, -0.5)
+                image.set_visible(True)
+            else:
+                image.set_visible(False)
+
+        tmp_path = Path(thumb_path).with_name(f".{Path(thumb_path).name}.tmp.png")
+        _card['fig'].savefig(tmp_path)
+        os.replace(tmp_path, thumb_path)
+        return pid, None
+    except Exception as e:
+        return pid, str(e)
+
+def build_cards(df):
+    """
+    Collects everything drawn on each patient card and its cache key.
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+
+    Returns:
+        list of dict: One card per patient with XML annotations.
+    """
+    annotated = df[df['xml_present'] == True]
+    contours = parse_roi_contours()
+    index = build_header_index(annotated['subject_id'].tolist())
+    slice_paths = dict(zip(zip(index['subject_id'], index['sop_uid']), index['path']))
+
+    cards = []
+    for row in annotated.itertuples(index=False):
+        pid = row.subject_id
+        mapped = bool(row.coordinate_mapped_successfully) and not pd.isna(row.x_pixel)
+        x_pixel = int(row.x_pixel) if mapped else None
+        y_pixel = int(row.y_pixel) if mapped else None
+        slice_path = slice_paths.get((pid, row.sop_instance_uid))
+        patch_path = PROJECT_ROOT / row.patch_file_path if row.patch_extracted == True else None
+        contour = contours.get(pid, [])
+        key = card_key(patch_path, row.sop_instance_uid, x_pixel, y_pixel, contour)
+
+        cards.append({
+            'pid': pid,
+            'histology': row.histology,
+            'split': row.dataset_split,
+            'mapped': mapped,
+            'patch': patch_path is not None,
+            'x_pixel': x_pixel,
+            'y_pixel': y_pixel,
+            'thumb_path': DIR_THUMBS / f"{pid}_{key}.png",
+            'task': (pid, str(PROJECT_ROOT / slice_path) if slice_path is not None else None,
+                     x_pixel, y_pixel, contour, str(patch_path) if patch_path is not None else None),
+        })
+    return cards
+
+def write_html(cards, report_path=FILE_REPORT):
+    """
+    Writes the static contact sheet referencing the cached thumbnails.
+
+    Args:
+        cards (list of dict): Output of `build_cards`.
+        report_path (Path): The HTML file.
+    """
+    items = []
+    for card in cards:
+        status = 'ok' if card['mapped'] and card['patch'] else 'fail'
+        thumb = os.path.relpath(card['thumb_path'], report_path.parent)
+        overlay = DIR_QC / f"{card['pid']}_QC_Overlay.png"
+        link = os.path.relpath(overlay, report_path.parent) if overlay.exists() else thumb
+        coords = f"({card['x_pixel']}, {card['y_pixel']})" if card['mapped'] else "not mapped"
+        items.append(
+            f'<figure class="{status}"><a href="{html.escape(link)}">'
+            f'<img src="{html.escape(thumb)}" loading="lazy"></a>'
+            f'<figcaption><b>{html.escape(str(card["pid"]))}</b> {coords}<br>'
+            f'{html.escape(str(card["histology"]))} &middot; {html.escape(str(card["split"]))}'
+            f'{"" if card["patch"] else " &middot; no patch"}</figcaption></figure>')
+
+    n_fail = sum(1 for card in cards if not (card['mapped'] and card['patch']))
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>NSCLC QC Contact Sheet</title>
+<style>
+body {{ font-family: sans-serif; background: #222; color: #ddd; }}
+main {{ display: flex; flex-wrap: wrap; gap: 8px; }}
+figure {{ margin: 0; padding: 4px; background: #333; border: 2px solid #333; font-size: 12px; }}
+figure.fail {{ border-color: #c33; }}
+img {{ display: block; width: 175px; }}
+</style></head>
+<body><h1>QC Contact Sheet</h1>
+<p>{len(cards)} annotated patients, {n_fail} without mapped coordinate or patch (red border).
+Target slice with crosshair (red) and ROI contour (yellow); strip: extracted 7-slice patch.</p>
+<main>
+{chr(10).join(items)}
+</main></body></html>
+"""
+    atomic_write(report_path, lambda tmp: Path(tmp).write_text(page, encoding='utf-8'))
+
+def run(df, workers=None):
+    """
+    Builds the contact sheet, re-rendering only cards whose cache key changed.
+
+    Args:
+        df (pandas.DataFrame): The manifest (not modified).
+        workers (int, optional): Number of render processes (default: all CPUs).
+
+    Returns:
+        tuple: (number of cards, number of re-rendered cards).
+    """
+    DIR_THUMBS.mkdir(parents=True, exist_ok=True)
+    with span("build_cards") as s:
+        cards = build_cards(df)
+        s.add_items(len(cards))
+
+    stale = [card for card in cards if not card['thumb_path'].exists()]
+    tasks = [card['task'] + (str(card['thumb_path']),) for card in stale]
+    print(f"{len(cards)} cards, {len(tasks)} to render ({len(cards) - len(tasks)} cached).")
+
+    workers = workers or os.cpu_count() or 1
+    with span("render_cards", items=len(tasks), workers=workers):
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                results = list(tqdm(pool.map(render_card, tasks), total=len(tasks), desc="Rendering cards"))
+        else:
+            results = [render_card(task) for task in tqdm(tasks, desc="Rendering cards")]
+    for pid, error in results:
+        if error is not None:
+            print(f"WARNING: {pid}: card failed ({error})")
+
+    # Drop thumbnails that no card references anymore
+    current = {card['thumb_path'].name for card in cards}
+    for path in DIR_THUMBS.glob("*.png"):
+        if path.name not in current:
+            path.unlink()
+
+    write_html(cards)
+    return len(cards), len(tasks)
+
+@instrumented("10_qc_report")
+def main():
+    """
+    Loads the manifest and (re)generates the QC contact sheet.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print("Starting QC report generation...")
+    if not manifest_exists():
+        print("ERROR: Manifest not found.")
+        return
+
+    df = read_manifest()
+    n_cards, n_rendered = run(df, workers=args.workers)
+
+    print("\n" + "="*50)
+    print("QC REPORT COMPLETE")
+    print("="*50)
+    print(f"Cards: {n_cards} ({n_rendered} re-rendered)")
+    print(f"Report saved to: {FILE_REPORT}")
+
+if __name__ == "__main__":
+    main()
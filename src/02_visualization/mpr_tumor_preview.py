@@ -0,0 +1,100 @@
+"""
+Multi-Planar Tumor Preview Script.
+
+Renders axial, coronal and sagittal reformats plus slab maximum-intensity
+projections (MIP) around the annotated tumor of one patient, straight from
+the memory-mapped HU volume cache (see utils/mpr.py). No DICOM file is read:
+the planes are strided views of the cache, so only the pages of the field of
+view are touched.
+
+The volume cache is filled by `04_extract_patches.py --mode 3d`.
+
+Usage:
+    python mpr_tumor_preview.py --patient R01-001 --half_size_mm 40 --slab_mm 10
+"""
+
+import sys
+import time
+import argparse
+import matplotlib.pyplot as plt
+from pathlib import Path
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_FIGURES = PROJECT_ROOT / "results" / "figures"
+DIR_FIGURES.mkdir(parents=True, exist_ok=True)
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest
+from utils.volume_cache import load_volume
+from utils.mpr import lesion_mpr, PLANES
+from utils.windowing import render_windows, WINDOW_PRESETS
+from utils.instrumentation import instrumented, span
+
+def select_patient(df, patient_id=None):
+    """
+    Picks the manifest row of the patient to preview.
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+        patient_id (str, optional): The patient; defaults to the first mapped patient.
+
+    Returns:
+        pandas.Series or None: The manifest row, or None if no mapped patient matches.
+    """
+    mapped = df[df['coordinate_mapped_successfully'] == True]
+    if patient_id is not None:
+        mapped = mapped[mapped['subject_id'] == patient_id]
+    return mapped.iloc[0] if len(mapped) > 0 else None
+
+@instrumented("mpr_tumor_preview")
+def main():
+    """
+    Renders the 2x3 MPR/MIP figure of one patient and saves it to 'results/figures'.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patient', type=str, default=None, help="Subject ID (default: first mapped patient)")
+    parser.add_argument('--half_size_mm', type=float, default=40.0, help="Half size of the field of view")
+    parser.add_argument('--slab_mm', type=float, default=10.0, help="Thickness of the MIP slab")
+    args = parser.parse_args()
+
+    row = select_patient(read_manifest(), args.patient)
+    if row is None:
+        print("ERROR: No patient with a mapped tumor coordinate found in the manifest.")
+        return
+
+    pid = row['subject_id']
+    series_uid = str(row['chosen_series_uid']).strip()
+    volume, meta = load_volume(series_uid)
+    if volume is None:
+        print(f"ERROR: Series of {pid} is not in the volume cache. Run 04_extract_patches.py --mode 3d first.")
+        return
+
+    start = time.perf_counter()
+    with span("render_mpr", items=1, patient=pid):
+        planes = lesion_mpr(volume, meta, str(row['sop_instance_uid']).strip(),
+                            row['x_pixel'], row['y_pixel'], args.half_size_mm, args.slab_mm)
+        # Lung window, planes and MIPs of one plane in a single lookup each
+        rendered = {p: render_windows(planes[p]['view'], [WINDOW_PRESETS['lung']])[0] for p in PLANES}
+        rendered_mip = {p: render_windows(planes[p]['mip'], [WINDOW_PRESETS['lung']])[0] for p in PLANES}
+    print(f"MPR of {pid} computed in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    fig, axes = plt.subplots(2, 3, figsize=(15, 10))
+    for k, plane in enumerate(PLANES):
+        marker_row, marker_col = planes[plane]['marker']
+        for ax, image, title in [(axes[0, k], rendered[plane], plane.capitalize()),
+                                 (axes[1, k], rendered_mip[plane], f"{plane.capitalize()} MIP ({args.slab_mm:g} mm)")]:
+            ax.imshow(image, cmap='gray', vmin=0, vmax=255, aspect=planes[plane]['aspect'])
+            ax.plot(marker_col, marker_row, '+', color='red', markersize=14, markeredgewidth=1.5)
+            ax.set_title(title)
+            ax.axis('off')
+
+    plt.suptitle(f"Tumor MPR: {pid} (FOV {2 * args.half_size_mm:g} mm, Lung Window)", fontsize=16)
+    plt.tight_layout()
+    save_path = DIR_FIGURES / f"mpr_{pid}.png"
+    plt.savefig(save_path, dpi=150)
+    print(f">> Figure saved: {save_path}")
+    plt.show()
+
+if __name__ == "__main__":
+    main()
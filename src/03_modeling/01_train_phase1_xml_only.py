@@ -7,6 +7,7 @@ It evaluates them on the Test set to establish the baseline performance
 before any Deep Learning or imaging data is used.
 """
 
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -20,10 +21,13 @@ from imblearn.over_sampling import SMOTE
 
 # --- 1. CONFIGURATION ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
 # Point this to exactly where your new CSV is saved!
 FILE_CLINICAL = PROJECT_ROOT / "data" / "raw" / "clinical" / "NSCLCR01Radiogenomic_DATA_LABELS_2018-05-22_1500-shifted.csv"
 
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest
+from utils.instrumentation import instrumented
+
 def evaluate_model(name, model, X_test, y_test):
     """Calculates standard medical metrics for a given model."""
     y_probs = model.predict_proba(X_test)[:, 1]
@@ -46,11 +50,12 @@ def evaluate_model(name, model, X_test, y_test):
         "Specificity": f"{specificity * 100:.1f}%"
     }
 
+@instrumented("01_train_phase1_xml_only")
 def main():
     print("Loading manifest and clinical data...")
     
     # 1. Load manifest and clinical CSV
-    manifest_df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
+    manifest_df = read_manifest()
     clinical_df = pd.read_csv(FILE_CLINICAL)
     
     # 2. Filter out Excluded patients from manifest
@@ -11,6 +11,7 @@ Academic Rigor:
 - Evaluates the final ultimate models strictly on the untouched Test set.
 """
 
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -28,9 +29,12 @@ warnings.filterwarnings('ignore') # Hides annoying deprecation warnings from Skl
 
 # --- 1. CONFIGURATION ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
 FILE_CLINICAL = PROJECT_ROOT / "data" / "raw" / "clinical" / "NSCLCR01Radiogenomic_DATA_LABELS_2018-05-22_1500-shifted.csv"
 
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest
+from utils.instrumentation import instrumented
+
 def evaluate_model(name, model, X_test, y_test):
     y_probs = model.predict_proba(X_test)[:, 1]
     y_pred = model.predict(X_test)
@@ -133,10 +137,11 @@ def dynamic_grid_search(model, param_grid, X, y, cv=5, max_expansions=3):
         else:
             return gs
 
+@instrumented("02_train_phase1_xml_only_tuned")
 def main():
     print("Loading data for Hyperparameter Tuning...\n")
     
-    manifest_df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
+    manifest_df = read_manifest()
     clinical_df = pd.read_csv(FILE_CLINICAL)
     
     manifest_df = manifest_df[manifest_df['dataset_split'] != 'Excluded'].copy()
@@ -0,0 +1,395 @@
+"""
+Phase 2 Vision Sweep Orchestrator (3 Architectures x 6 Unfreeze Levels)
+
+Trains the whole vision grid expected by 04_evaluate_vision_vision_sweep.py
+in one command instead of 18 launches of 03_train_phase2_vision_only.py:
+
+- The Train/Validation/Test splits are loaded once and moved to shared
+  memory; every pool process maps the same tensors (no re-decoding).
+- Configurations are scheduled across a process pool. Each process gets a
+  fixed torch thread budget (--threads_per_worker), so the total sweep time
+  scales with the core count instead of serial re-launches.
+- Each configuration runs `train_vision_model` from the Phase 2 script
+  (same seed, loop, early stopping and test evaluation as a standalone run).
+- Results, checkpoint and log paths are written to the sweep database
+  (utils/sweep_db.py). Finished runs are skipped when a sweep is restarted.
+  The full configuration (input, hu_norm, epochs, augment bank, rung budgets)
+  is stored per run; restarting a sweep with a different one is refused
+  unless --rerun (or another --sweep name) is given.
+- The best checkpoint per (architecture, unfreeze level) is exported under
+  the Phase 2 name (`checkpoint_name`: 'best_<model>_unfrozen_<k>.pth' for HU
+  input, with '_windows'/'_cached' suffixes) in the project root for script 04.
+
+Successive halving (--scheduler halving): instead of training every
+configuration for the full --epochs, all configurations first get a small
+budget (--min_epochs). Within each group (--halve_within: per architecture and
+unfreeze level, or across the whole grid), the top 1/--eta runs by validation
+Sens+Spec (the best `current_clinical_score` of the early-stopping loop, AUC
+as tie-break) are promoted to the next rung with an eta times larger budget,
+the others are killed. Promoted runs resume from their saved training state
+(model, optimizer, early-stopping counters and all random states), so every
+epoch is trained once and a survivor ends exactly like an uninterrupted run.
+Only the survivors of the last rung (budget = --epochs) are evaluated on the
+Test split. Rungs are synchronous, so the promotions do not depend on which
+process finishes first, and a restarted sweep repeats the same decisions.
+
+Usage:
+    python 03_sweep_phase2_vision.py --epochs 10 --workers 6 --threads_per_worker 2
+    python 03_sweep_phase2_vision.py --models resnet --levels 0 1 --cache_prefix
+    python 03_sweep_phase2_vision.py --scheduler halving --lrs 0.01 0.001 0.0001 --batch_sizes 16 32 --epochs 18 --min_epochs 2 --eta 3
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import importlib
+import contextlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+import torch.multiprocessing as torch_mp
+import pandas as pd
+
+# --- 1. CONFIGURATION ---
+CURRENT_DIR = Path(__file__).parent
+PROJECT_ROOT = CURRENT_DIR.parent.parent
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+sys.path.insert(0, str(CURRENT_DIR))
+from utils import sweep_db
+from utils.loaders import share_dataset_memory
+from utils.instrumentation import instrumented, span
+
+PHASE2_MODULE = "03_train_phase2_vision_only"
+ARCHITECTURES = ['resnet', 'densenet', 'efficientnet']
+LEVELS = [0, 1, 2, 3, 4, 5]
+# Rough relative cost per training step, to start the longest runs first
+ARCH_COST = {'resnet': 1.0, 'densenet': 2.5, 'efficientnet': 1.0}
+# Successive halving: budget of the first rung and reduction factor per rung
+DEFAULT_MIN_EPOCHS = 2
+DEFAULT_ETA = 3
+
+# Per-process state, set once by `init_worker`
+_worker = {}
+
+def build_grid(models, levels, lrs, batch_sizes, epochs, cache_prefix=False, augment_bank=0,
+               input_kind='hu', hu_norm=False):
+    """
+    Expands the sweep grid into a list of configurations.
+
+    Prefix caching only applies to levels with a frozen prefix (< 5). The
+    input settings are part of every configuration, so the sweep database
+    can tell runs on other inputs apart.
+
+    Returns:
+        list of dict: One configuration per (model, level, lr, batch size).
+    """
+    configs = []
+    for model, level, lr, batch_size in itertools.product(models, levels, lrs, batch_sizes):
+        cached = cache_prefix and level < 5
+        configs.append({'model': model, 'unfreeze_blocks': level, 'lr': lr, 'batch_size': batch_size,
+                        'epochs': epochs, 'cache_prefix': cached, 'augment_bank': augment_bank if cached else 0,
+                        'input': input_kind, 'hu_norm': hu_norm})
+    return configs
+
+def estimated_cost(config):
+    """Relative cost used to schedule the longest configurations first."""
+    trainable = 0.2 if config['cache_prefix'] else 1.0
+    return ARCH_COST[config['model']] * (1 + config['unfreeze_blocks'] * trainable) * config['epochs']
+
+def rung_budgets(min_epochs, eta, max_epochs):
+    """
+    Epoch budgets of the successive-halving rungs: min_epochs * eta**r, capped by max_epochs.
+
+    Returns:
+        list of int: Increasing budgets; the last one is `max_epochs`.
+    """
+    budgets, budget = [], min_epochs
+    while budget < max_epochs:
+        budgets.append(budget)
+        budget *= eta
+    return budgets + [max_epochs]
+
+def halving_group(config, halve_within):
+    """Returns the group in which a configuration competes for promotion."""
+    return (config['model'], config['unfreeze_blocks']) if halve_within == 'model_level' else ()
+
+def select_promotions(rows, configs, eta, halve_within):
+    """
+    Selects the runs promoted to the next rung.
+
+    Args:
+        rows (list of dict): Rung results with 'run_key', 'best_val_score' and 'best_val_auc'.
+        configs (dict): Configuration per run key.
+        eta (int): Reduction factor; the top len(group) // eta runs (at least one) are kept.
+        halve_within (str): 'model_level' or 'grid' (see `halving_group`).
+
+    Returns:
+        set: The promoted run keys.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(halving_group(configs[row['run_key']], halve_within), []).append(row)
+
+    promoted = set()
+    for group_rows in groups.values():
+        ranked = sorted(group_rows, key=lambda r: (-r['best_val_score'],
+                                                   -(0.0 if pd.isna(r['best_val_auc']) else r['best_val_auc']),
+                                                   r['run_key']))
+        promoted.update(r['run_key'] for r in ranked[:max(1, len(group_rows) // eta)])
+    return promoted
+
+def init_worker(datasets, threads):
+    """Pool initializer: sets the thread budget and keeps the shared datasets."""
+    torch.set_num_threads(threads)
+    _worker['datasets'] = datasets
+    _worker['phase2'] = importlib.import_module(PHASE2_MODULE)
+
+def run_config(config, checkpoint, log_path, epoch_budget=None, state_path=None, run_test=True):
+    """
+    Trains one configuration (or one rung of it, with `state_path`) inside a pool process.
+
+    Returns:
+        tuple: (result dict or None, error message or None, wall seconds).
+    """
+    phase2 = _worker['phase2']
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    start = time.perf_counter()
+    # Rungs of a resumed run append to the same log
+    with open(log_path, 'a' if state_path else 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            with span("sweep_run", model=config['model'], unfreeze_blocks=config['unfreeze_blocks'], epoch_budget=epoch_budget):
+                result = phase2.train_vision_model(config, _worker['datasets'], device, checkpoint,
+                                                   epoch_budget=epoch_budget, state_path=state_path, run_test=run_test)
+            return result, None, time.perf_counter() - start
+        except Exception as e:
+            print(f"ERROR: {type(e).__name__}: {e}")
+            return None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+def run_paths(sweep_dir, key):
+    """Returns the checkpoint, training-state and log paths of a run."""
+    return sweep_dir / f"{key}.pth", sweep_dir / f"{key}.state.pt", sweep_dir / f"{key}.log"
+
+@contextlib.contextmanager
+def open_pool(phase2, args, n_jobs):
+    """Loads the splits once into shared memory and starts the process pool."""
+    cores = os.cpu_count() or 1
+    workers = args.workers or max(1, cores // args.threads_per_worker)
+    workers = max(1, min(workers, n_jobs))
+    print(f"Workers: {workers} x {args.threads_per_worker} threads ({cores} cores)\n")
+
+    # Load every split once; the pool processes map the same shared-memory tensors
+    with span("load_datasets"):
+        datasets, _ = phase2.load_split_datasets(args.input, args.hu_norm)
+        for dataset in datasets.values():
+            share_dataset_memory(dataset)
+
+    ctx = torch_mp.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init_worker,
+                             initargs=(datasets, args.threads_per_worker)) as pool:
+        yield pool
+
+def run_grid(pool, conn, sweep, todo, sweep_dir):
+    """Trains every configuration of `todo` for its full epoch count."""
+    futures = {}
+    for config in todo:
+        key = sweep_db.run_key(config)
+        checkpoint, _, log_path = run_paths(sweep_dir, key)
+        sweep_db.mark_running(conn, sweep, key, checkpoint, log_path)
+        futures[pool.submit(run_config, config, checkpoint, log_path)] = key
+
+    for future in as_completed(futures):
+        key = futures[future]
+        result, error, wall_s = future.result()
+        sweep_db.record_result(conn, sweep, key, result, error, wall_s)
+        if error:
+            print(f"[FAILED] {key} after {wall_s:.0f}s: {error}")
+        else:
+            print(f"[done] {key}: Val Sens+Spec {result['best_val_score']:.3f} | "
+                  f"Test AUC {result['test_auc']:.3f} | {result['epochs_run']} epochs in {wall_s:.0f}s")
+
+def run_halving(pool, conn, sweep, configs, sweep_dir, budgets, eta, halve_within):
+    """
+    Runs the successive-halving rungs; finished rungs (from the database) are not repeated.
+
+    Returns:
+        int: Epochs trained over all runs (for the comparison with the full grid).
+    """
+    by_key = {sweep_db.run_key(c): c for c in configs}
+    rung_rows = {(row['run_key'], row['rung']): row for row in sweep_db.load_rungs(conn, sweep) if row['error'] is None}
+    alive = sorted(by_key)
+
+    def total_wall(key):
+        return sum(row['wall_s'] or 0.0 for (k, _), row in rung_rows.items() if k == key)
+
+    for rung, budget in enumerate(budgets):
+        final = rung == len(budgets) - 1
+        todo = sorted([key for key in alive if (key, rung) not in rung_rows],
+                      key=lambda k: estimated_cost(by_key[k]), reverse=True)
+        print(f"--- Rung {rung}: {len(alive)} runs up to epoch {budget}"
+              f"{' + Test evaluation' if final else ''} | To run: {len(todo)} ---")
+
+        futures = {}
+        for key in todo:
+            checkpoint, state_path, log_path = run_paths(sweep_dir, key)
+            if rung == 0:
+                sweep_db.mark_running(conn, sweep, key, checkpoint, log_path)
+            futures[pool.submit(run_config, by_key[key], checkpoint, log_path, budget, state_path, final)] = key
+
+        for future in as_completed(futures):
+            key = futures[future]
+            result, error, wall_s = future.result()
+            sweep_db.record_rung(conn, sweep, key, rung, budget, result, error, wall_s)
+            if error:
+                sweep_db.record_result(conn, sweep, key, None, error, total_wall(key) + wall_s)
+                print(f"[FAILED] {key} in rung {rung} after {wall_s:.0f}s: {error}")
+                continue
+            rung_rows[(key, rung)] = dict(result, run_key=key, wall_s=wall_s)
+            if final:
+                sweep_db.record_result(conn, sweep, key, result, None, total_wall(key))
+            stopped = " (early stopped)" if result['stopped'] else ""
+            print(f"[rung {rung}] {key}: Val Sens+Spec {result['best_val_score']:.3f} | "
+                  f"{result['epochs_run']} epochs{stopped} in {wall_s:.0f}s")
+
+        rows = [rung_rows[(key, rung)] for key in alive if (key, rung) in rung_rows]
+        if final:
+            break
+        promoted = select_promotions(rows, by_key, eta, halve_within)
+        sweep_db.mark_promoted(conn, sweep, rung, promoted)
+        for row in rows:
+            if row['run_key'] not in promoted:
+                sweep_db.record_result(conn, sweep, row['run_key'], row, None, total_wall(row['run_key']), status='killed')
+        print(f">> Promoted {len(promoted)}/{len(rows)}: {', '.join(sorted(promoted))}\n")
+        alive = sorted(promoted)
+
+    epochs_run = {}
+    for (key, _), row in rung_rows.items():
+        epochs_run[key] = max(epochs_run.get(key, 0), row['epochs_run'] or 0)
+    return sum(epochs_run.values())
+
+def export_best_checkpoints(runs, phase2, target_dir=PROJECT_ROOT):
+    """
+    Copies the best finished run per Phase 2 checkpoint name to the project root.
+
+    Runs on HU input without prefix caching compete for the names read by
+    script 04; window-channel and prefix-cache runs for their suffixed names.
+
+    Returns:
+        list: The exported file paths.
+    """
+    best = {}
+    for run in runs:
+        if run['status'] != 'done' or not run['checkpoint'] or not Path(run['checkpoint']).exists():
+            continue
+        config = json.loads(run['config'])
+        name = phase2.checkpoint_name(run['model'], run['unfreeze_blocks'], config.get('input', 'hu'),
+                                      config.get('cache_prefix', False))
+        if name not in best or run['best_val_score'] > best[name]['best_val_score']:
+            best[name] = run
+
+    exported = []
+    for name, run in sorted(best.items()):
+        target = Path(target_dir) / name
+        shutil.copyfile(run['checkpoint'], target)
+        exported.append(target)
+    return exported
+
+def print_summary(runs):
+    """Prints the validation/test matrix of a sweep."""
+    df = pd.DataFrame(runs)
+    if df.empty:
+        return
+    columns = ['run_key', 'status', 'epochs_run', 'best_val_score', 'best_val_auc', 'test_auc', 'test_sens', 'test_spec', 'wall_s']
+    print("\n" + "="*100)
+    print("PHASE 2 SWEEP RESULTS (VALIDATION SCORE = SENS+SPEC)")
+    print("="*100)
+    print(df[columns].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print("="*100)
+
+@instrumented("03_sweep_phase2_vision")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sweep', type=str, default=None,
+                        help="Sweep name (rows and checkpoint folder; default: phase2_grid / phase2_halving)")
+    parser.add_argument('--models', nargs='+', default=ARCHITECTURES, choices=ARCHITECTURES)
+    parser.add_argument('--levels', nargs='+', type=int, default=LEVELS, choices=LEVELS)
+    parser.add_argument('--lrs', nargs='+', type=float, default=[0.001])
+    parser.add_argument('--batch_sizes', nargs='+', type=int, default=[16])
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--input', type=str, default='hu', choices=['hu', 'windows'])
+    parser.add_argument('--hu_norm', action='store_true')
+    parser.add_argument('--cache_prefix', action='store_true', help="Prefix activation caching for levels 0-4")
+    parser.add_argument('--augment_bank', type=int, default=0)
+    parser.add_argument('--scheduler', type=str, default='grid', choices=['grid', 'halving'],
+                        help="grid = every run for --epochs, halving = successive halving over epoch budgets")
+    parser.add_argument('--min_epochs', type=int, default=DEFAULT_MIN_EPOCHS, help="Halving: epoch budget of the first rung")
+    parser.add_argument('--eta', type=int, default=DEFAULT_ETA, help="Halving: keep the top 1/eta per rung, eta x the budget")
+    parser.add_argument('--halve_within', type=str, default='model_level', choices=['model_level', 'grid'],
+                        help="Halving: rank runs per (model, unfreeze level), keeping one winner per cell of script 04, or across the grid")
+    parser.add_argument('--workers', type=int, default=None, help="Pool processes (default: cores / threads_per_worker)")
+    parser.add_argument('--threads_per_worker', type=int, default=1, help="torch threads per pool process")
+    parser.add_argument('--rerun', action='store_true', help="Re-train runs that already finished")
+    parser.add_argument('--no_export', action='store_true', help="Do not copy the best checkpoints to the project root")
+    parser.add_argument('--db', type=str, default=str(sweep_db.FILE_SWEEP_DB))
+    args = parser.parse_args()
+    if args.scheduler == 'halving' and (args.eta < 2 or not 1 <= args.min_epochs <= args.epochs):
+        parser.error("--scheduler halving needs --eta >= 2 and 1 <= --min_epochs <= --epochs.")
+    args.sweep = args.sweep or f"phase2_{args.scheduler}"
+
+    phase2 = importlib.import_module(PHASE2_MODULE)
+    conn = sweep_db.connect(args.db)
+    sweep_dir = Path(args.db).parent / args.sweep
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+
+    configs = build_grid(args.models, args.levels, args.lrs, args.batch_sizes, args.epochs,
+                         args.cache_prefix, args.augment_bank, args.input, args.hu_norm)
+    budgets = rung_budgets(args.min_epochs, args.eta, args.epochs)
+    if args.scheduler == 'halving':
+        # Finished rungs are only valid for the same budgets
+        for config in configs:
+            config['rung_budgets'] = budgets
+
+    conflicts = sweep_db.config_conflicts(conn, args.sweep, configs)
+    if conflicts and not args.rerun:
+        parser.error(f"sweep '{args.sweep}' already holds {len(conflicts)} run(s) with a different configuration "
+                     f"(e.g. {conflicts[0]}; input, hu_norm, epochs, augment_bank or rung budgets changed). "
+                     f"Use another --sweep name, or --rerun to replace them.")
+    sweep_db.register_runs(conn, args.sweep, configs, replace=args.rerun)
+    print(f"=== PHASE 2 SWEEP '{args.sweep}' ({args.scheduler.upper()}) ===")
+
+    if args.scheduler == 'grid':
+        done = set() if args.rerun else sweep_db.finished_keys(conn, args.sweep)
+        todo = sorted([c for c in configs if sweep_db.run_key(c) not in done], key=estimated_cost, reverse=True)
+        print(f"Configs: {len(configs)} | To run: {len(todo)}")
+        if todo:
+            with open_pool(phase2, args, len(todo)) as pool:
+                run_grid(pool, conn, args.sweep, todo, sweep_dir)
+    else:
+        if args.rerun:
+            # Drop the rung decisions and the saved training states, so every run starts from epoch 0
+            sweep_db.clear_rungs(conn, args.sweep)
+            for config in configs:
+                for path in run_paths(sweep_dir, sweep_db.run_key(config))[1:]:
+                    path.unlink(missing_ok=True)
+        settled = {run['run_key'] for run in sweep_db.load_runs(conn, args.sweep) if run['status'] in ('done', 'killed')}
+        pending = [c for c in configs if sweep_db.run_key(c) not in settled]
+        print(f"Configs: {len(configs)} | Unfinished: {len(pending)} | Rung budgets (epochs): {budgets} | eta: {args.eta}")
+        if pending or args.rerun:
+            with open_pool(phase2, args, len(configs)) as pool:
+                trained = run_halving(pool, conn, args.sweep, configs, sweep_dir, budgets, args.eta, args.halve_within)
+            print(f">> Epochs trained: {trained} (full grid: up to {len(configs) * args.epochs})")
+
+    runs = sweep_db.load_runs(conn, args.sweep)
+    print_summary(runs)
+    if not args.no_export:
+        exported = export_best_checkpoints(runs, phase2)
+        print(f">> Exported {len(exported)} best checkpoints for 04_evaluate_vision_vision_sweep.py")
+    print(f">> Sweep database: {args.db}")
+
+if __name__ == "__main__":
+    main()
@@ -8,22 +8,21 @@ Features:
 - F1-Score Evaluation added for Subtyping
 - Clinical Early Stopping (Sens + Spec) using Validation Set
 - Strict Final Evaluation on untouched Test Set
+- Resumable training state (epoch budgets for successive-halving sweeps)
 """
 
 import os
+import sys
 import random
 import argparse
 import numpy as np
-import pandas as pd
 from pathlib import Path
 from tqdm import tqdm
 
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
 import torchvision.models as models
-import torchvision.transforms as T
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, roc_auc_score, confusion_matrix, roc_curve, f1_score
 import warnings
@@ -31,7 +30,17 @@ warnings.filterwarnings('ignore')
 
 # --- 1. CONFIGURATION & SEEDING ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest
+from utils.datasets import WindowStoreDataset, CTPatchDataset
+from utils.augment import BatchAugment
+from utils.prefix_cache import split_frozen_prefix, build_activation_dataset
+from utils.loaders import (make_loader, get_loader_rng_state, set_loader_rng_state,
+                           DEFAULT_NUM_WORKERS, DEFAULT_PREFETCH_FACTOR)
+from utils.intensity_stats import load_normalization_constants
+from utils.patch_store import load_or_compute_channel_stats
+from utils.instrumentation import instrumented, span
 
 def set_seed(seed=42):
     """Locks down all random number generators for absolute reproducibility."""
@@ -45,38 +54,77 @@ def set_seed(seed=42):
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = False
 
-# --- 2. DATASET DEFINITION ---
-class CTPatchDataset(Dataset):
-    def __init__(self, manifest_df, label_encoder, transform=None):
-        self.df = manifest_df[manifest_df['patch_extracted'] == True].copy()
-        self.df.reset_index(drop=True, inplace=True)
-        self.le = label_encoder
-        self.transform = transform
-        
-    def __len__(self):
-        return len(self.df)
+def save_training_state(state_path, state, model, optimizer, train_loader):
+    """
+    Saves everything needed to continue a run after its last epoch.
 
-    def __getitem__(self, idx):
-        row = self.df.iloc[idx]
-        
-        patch_path = PROJECT_ROOT / row['patch_file_path']
-        patch_array = np.load(patch_path).astype(np.float32)
-        
-        image_tensor = torch.tensor(patch_array)
-        if image_tensor.shape[-1] < 10: 
-            image_tensor = image_tensor.permute(2, 0, 1)
-            
-        if self.transform:
-            image_tensor = self.transform(image_tensor)
-            
-        label = self.le.transform([row['histology']])[0]
-        label_tensor = torch.tensor(label, dtype=torch.long)
-        
-        return image_tensor, label_tensor
+    Args:
+        state_path (Path or str): Target file (written atomically).
+        state (dict): Loop counters ('epoch', 'best_clinical_score', 'best_auc_tracker',
+            'patience_counter', 'last_clinical_score', 'stopped').
+        model (torch.nn.Module): The full model.
+        optimizer (torch.optim.Optimizer): Its optimizer (Adam moments).
+        train_loader: The shuffled train loader (sampler generator).
+    """
+    checkpoint = dict(state, model=model.state_dict(), optimizer=optimizer.state_dict(),
+                      loader_rng=get_loader_rng_state(train_loader),
+                      rng={'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state(),
+                           'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None})
+    tmp_path = Path(state_path).with_suffix('.tmp')
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, state_path)
+
+def load_training_state(state_path, model, optimizer, train_loader):
+    """
+    Restores a run saved by `save_training_state`, including every random state.
+
+    Call it after the model, optimizer and loaders are built: the following
+    epochs are then identical to an uninterrupted run.
+
+    Returns:
+        dict: The loop counters.
+    """
+    # Own file with numpy/python RNG states (not only tensors)
+    checkpoint = torch.load(state_path, weights_only=False)
+    model.load_state_dict(checkpoint.pop('model'))
+    optimizer.load_state_dict(checkpoint.pop('optimizer'))
+    set_loader_rng_state(train_loader, checkpoint.pop('loader_rng'))
+    rng = checkpoint.pop('rng')
+    random.setstate(rng['python'])
+    np.random.set_state(rng['numpy'])
+    torch.set_rng_state(rng['torch'])
+    if rng['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng['cuda'])
+    return checkpoint
 
 # --- 3. MODEL BUILDER ---
-def build_vision_model(model_name, unfreeze_blocks, in_channels, num_classes=2):
-    """Builds the model and unfreezes a specific number of architectural blocks."""
+def build_stem(original_conv, in_channels, inflate=False):
+    """
+    Replaces the pretrained RGB stem conv by one for `in_channels` inputs.
+
+    By default the new conv is randomly initialized. With `inflate=True` it is
+    initialized from the pretrained weights: the RGB kernels are averaged and
+    repeated over the input channels, scaled by 3/in_channels so that identical
+    channels give the same response as a gray RGB image.
+    """
+    conv = nn.Conv2d(in_channels, original_conv.out_channels,
+                     kernel_size=original_conv.kernel_size, stride=original_conv.stride,
+                     padding=original_conv.padding, bias=False)
+    if inflate:
+        with torch.no_grad():
+            mean_kernel = original_conv.weight.mean(dim=1, keepdim=True)
+            conv.weight.copy_(mean_kernel.repeat(1, in_channels, 1, 1) * (3.0 / in_channels))
+    return conv
+
+def build_vision_model(model_name, unfreeze_blocks, in_channels, num_classes=2, inflate_stem=False):
+    """
+    Builds the model and unfreezes a specific number of architectural blocks.
+
+    The replaced input stem is trainable by default. With `inflate_stem=True`
+    (prefix caching, see utils/prefix_cache.py) it is inflated from the
+    pretrained weights and stays frozen unless the full model is unfrozen.
+    """
+    train_stem = not inflate_stem or unfreeze_blocks >= 5
     if model_name == 'resnet':
         model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
         for param in model.parameters(): param.requires_grad = False
@@ -92,11 +140,8 @@ def build_vision_model(model_name, unfreeze_blocks, in_channels, num_classes=2):
         if unfreeze_blocks >= 5:
             for param in model.parameters(): param.requires_grad = True
 
-        original_conv = model.conv1
-        model.conv1 = nn.Conv2d(in_channels, original_conv.out_channels, 
-                                kernel_size=original_conv.kernel_size, stride=original_conv.stride, 
-                                padding=original_conv.padding, bias=False)
-        model.conv1.weight.requires_grad = True 
+        model.conv1 = build_stem(model.conv1, in_channels, inflate_stem)
+        model.conv1.weight.requires_grad = train_stem
         model.fc = nn.Linear(model.fc.in_features, num_classes)
         
     elif model_name == 'densenet':
@@ -118,11 +163,8 @@ def build_vision_model(model_name, unfreeze_blocks, in_channels, num_classes=2):
         if unfreeze_blocks >= 5:
             for param in model.parameters(): param.requires_grad = True
 
-        original_conv = model.features.conv0
-        model.features.conv0 = nn.Conv2d(in_channels, original_conv.out_channels, 
-                                         kernel_size=original_conv.kernel_size, stride=original_conv.stride, 
-                                         padding=original_conv.padding, bias=False)
-        model.features.conv0.weight.requires_grad = True
+        model.features.conv0 = build_stem(model.features.conv0, in_channels, inflate_stem)
+        model.features.conv0.weight.requires_grad = train_stem
         model.classifier = nn.Linear(model.classifier.in_features, num_classes)
         
     elif model_name == 'efficientnet':
@@ -140,11 +182,8 @@ def build_vision_model(model_name, unfreeze_blocks, in_channels, num_classes=2):
         if unfreeze_blocks >= 5:
             for param in model.parameters(): param.requires_grad = True
 
-        original_conv = model.features[0][0]
-        model.features[0][0] = nn.Conv2d(in_channels, original_conv.out_channels, 
-                                         kernel_size=original_conv.kernel_size, stride=original_conv.stride, 
-                                         padding=original_conv.padding, bias=False)
-        model.features[0][0].weight.requires_grad = True
+        model.features[0][0] = build_stem(model.features[0][0], in_channels, inflate_stem)
+        model.features[0][0].weight.requires_grad = train_stem
         model.classifier[1] = nn.Linear(model.classifier[1].in_features, num_classes)
 
     return model
@@ -188,26 +227,20 @@ def evaluate(model, dataloader, device):
     
     return acc, auc, f1, sens, spec, best_thresh
 
-# --- 5. MAIN SCRIPT ---
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--model', type=str, default='resnet', choices=['resnet', 'densenet', 'efficientnet'])
-    parser.add_argument('--unfreeze_blocks', type=int, default=1, choices=[0, 1, 2, 3, 4, 5], help="0=Frozen, 1-4=Partial, 5=Full")
-    parser.add_argument('--epochs', type=int, default=10)
-    parser.add_argument('--batch_size', type=int, default=16)
-    parser.add_argument('--lr', type=float, default=0.001)
-    args = parser.parse_args()
+# --- 5. DATA & TRAINING ---
+def load_split_datasets(input_kind='hu', hu_norm=False, stream_patches=False):
+    """
+    Loads the Train/Validation/Test datasets of the 2-class vision task.
 
-    # Important: Lock down all random states!
-    set_seed(42)
+    Args:
+        input_kind (str): 'hu' (raw HU patches) or 'windows' (uint8 window store).
+        hu_norm (bool): Standardize HU patches with the cohort constants.
+        stream_patches (bool): Read HU patches per access instead of holding each split in RAM.
 
-    print(f"=== STARTING PHASE 2 RUN ===")
-    print(f"Model: {args.model.upper()} | Unfrozen Blocks: {args.unfreeze_blocks} | Epochs: {args.epochs}")
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using Hardware: {device}\n")
-
-    df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
+    Returns:
+        tuple: (datasets, label_encoder) with datasets as {'train', 'val', 'test'}.
+    """
+    df = read_manifest()
     df = df[df['dataset_split'] != 'Excluded'].copy()
     valid_cancers = ['Adenocarcinoma', 'Squamous cell carcinoma']
     df = df[df['histology'].isin(valid_cancers)].copy()
@@ -221,71 +254,172 @@ def main():
     val_df = df[df['dataset_split'] == 'Validation']
     test_df = df[df['dataset_split'] == 'Test'] # Kept pure until the end
 
-    # --- DATA AUGMENTATION ---
-    train_transforms = T.Compose([
-        T.RandomHorizontalFlip(p=0.5),
-        T.RandomVerticalFlip(p=0.5),
-        T.RandomRotation(degrees=15)
-    ])
+    # No dataset-level transforms: augmentation runs on whole batches in the loader
+    if input_kind == 'windows':
+        # Per-channel mean/std strictly from the Train split (cached next to the store)
+        channel_stats = load_or_compute_channel_stats(train_df['subject_id'])
+        print(f"Channel Normalization -> computed on {channel_stats['n_patches']} Train patches\n")
+        train_dataset = WindowStoreDataset(train_df, le, transform=None, channel_stats=channel_stats)
+        val_dataset = WindowStoreDataset(val_df, le, transform=None, channel_stats=channel_stats) # No augmentation on Val
+        test_dataset = WindowStoreDataset(test_df, le, transform=None, channel_stats=channel_stats) # No augmentation on Test
+    else:
+        hu_stats = None
+        if hu_norm:
+            hu_stats = load_normalization_constants()
+            if hu_stats is None:
+                print("WARNING: No cohort HU statistics found. Run 07_cohort_intensity_stats.py first. Using raw HU.")
+            else:
+                print(f"HU Normalization -> Mean: {hu_stats['hu_mean']:.1f} | Std: {hu_stats['hu_std']:.1f}\n")
+        # The small splits fit in a few MB: each is decoded once into a contiguous tensor
+        in_memory = not stream_patches
+        train_dataset = CTPatchDataset(train_df, le, transform=None, hu_stats=hu_stats, in_memory=in_memory)
+        val_dataset = CTPatchDataset(val_df, le, transform=None, hu_stats=hu_stats, in_memory=in_memory) # No augmentation on Val
+        test_dataset = CTPatchDataset(test_df, le, transform=None, hu_stats=hu_stats, in_memory=in_memory) # No augmentation on Test
+
+    return {'train': train_dataset, 'val': val_dataset, 'test': test_dataset}, le
 
-    train_dataset = CTPatchDataset(train_df, le, transform=train_transforms)
-    val_dataset = CTPatchDataset(val_df, le, transform=None) # No augmentation on Val
-    test_dataset = CTPatchDataset(test_df, le, transform=None) # No augmentation on Test
+def checkpoint_name(model_name, unfreeze_blocks, input_kind='hu', cache_prefix=False):
+    """
+    Returns the file name of the best Phase 2 weights of a configuration.
 
-    # Since we set the global seed, shuffle=True will now shuffle identically every time
-    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False)
-    test_loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False)
+    HU runs keep the name read by 04_evaluate_vision_vision_sweep.py and the
+    Phase 3 fusion scripts; window-channel runs (different stem) and
+    prefix-cache runs (frozen inflated stem, eval-mode prefix BatchNorm) get
+    a suffix.
+    """
+    suffix = "" if input_kind == 'hu' else f"_{input_kind}"
+    suffix += "_cached" if cache_prefix else ""
+    return f"best_{model_name}_unfrozen_{unfreeze_blocks}{suffix}.pth"
+
+def train_vision_model(config, datasets, device, save_path, loader_args=None,
+                       epoch_budget=None, state_path=None, run_test=True):
+    """
+    Trains one vision configuration with clinical early stopping and tests the best checkpoint.
+
+    The global seed is reset first, so a configuration gives the same result
+    whether it runs alone or inside a sweep. With `state_path`, training stops
+    after `epoch_budget` epochs and saves its full state; calling again with a
+    larger budget resumes from that state exactly as if the run had never been
+    interrupted (used by the successive-halving sweep).
+
+    Args:
+        config (dict): 'model', 'unfreeze_blocks', 'epochs', 'batch_size', 'lr',
+            and optionally 'cache_prefix' and 'augment_bank'.
+        datasets (dict): {'train', 'val', 'test'} from `load_split_datasets`.
+        device (torch.device): Training device.
+        save_path (Path or str): Where the best (validation) weights are saved.
+        loader_args (dict, optional): Extra `make_loader` arguments (workers, prefetch).
+        epoch_budget (int, optional): Train at most up to this epoch (default: config['epochs']).
+        state_path (Path or str, optional): Resume from / save the training state here.
+        run_test (bool): Evaluate the best checkpoint on the Test split.
+
+    Returns:
+        dict: Best validation score/AUC, last validation score, epochs run,
+        whether early stopping triggered and (with `run_test`) the test metrics.
+    """
+    # Important: Lock down all random states!
+    set_seed(42)
+    loader_args = loader_args or {}
+    cache_prefix = config.get('cache_prefix', False)
+    train_dataset, val_dataset, test_dataset = datasets['train'], datasets['val'], datasets['test']
+
+    # --- DATA AUGMENTATION ---
+    # Flips (p=0.5 each) and a random rotation of up to 15 degrees, applied to whole batches at once
+    train_augment = BatchAugment(p_hflip=0.5, p_vflip=0.5, degrees=15)
+
+    # Since we set the global seed, shuffle=True will now shuffle identically every time (for any number of workers).
+    # Train augmentation runs in the main process on each batch, so worker scheduling cannot change it.
+    train_loader = make_loader(train_dataset, config['batch_size'], shuffle=True, batch_transform=train_augment, **loader_args)
+    val_loader = make_loader(val_dataset, config['batch_size'], **loader_args)
+    test_loader = make_loader(test_dataset, config['batch_size'], **loader_args)
 
     sample_img, _ = train_dataset[0]
     in_channels = sample_img.shape[0]
     print(f"Detected 2.5D Patches with {in_channels} channels.\n")
     print(f"Data Splits -> Train: {len(train_dataset)} | Val: {len(val_dataset)} | Test: {len(test_dataset)}\n")
 
-    model = build_vision_model(args.model, args.unfreeze_blocks, in_channels).to(device)
+    model = build_vision_model(config['model'], config['unfreeze_blocks'], in_channels, inflate_stem=cache_prefix).to(device)
+    net = model # The module that is trained and evaluated per epoch
+
+    if cache_prefix:
+        # The frozen prefix (eval mode, pretrained BN statistics) runs once per split; epochs only run the tail
+        with span("cache_prefix", model=config['model'], unfreeze_blocks=config['unfreeze_blocks']) as s:
+            prefix, net = split_frozen_prefix(model, config['model'], config['unfreeze_blocks'])
+            key = dict(model=config['model'], unfreeze_blocks=config['unfreeze_blocks'])
+            bank_views = config.get('augment_bank', 0)
+            train_dataset = build_activation_dataset(prefix, train_dataset, key, device, bank_views=bank_views)
+            val_dataset = build_activation_dataset(prefix, val_dataset, key, device)
+            test_dataset = build_activation_dataset(prefix, test_dataset, key, device)
+            s.add_items(len(train_dataset) * max(1, bank_views) + len(val_dataset) + len(test_dataset))
+        print(f"Prefix activations cached -> {tuple(train_dataset.views[0].shape[1:])} per patch, "
+              f"{len(train_dataset.views)} Train view(s)\n")
+        train_loader = make_loader(train_dataset, config['batch_size'], shuffle=True)
+        val_loader = make_loader(val_dataset, config['batch_size'])
+        test_loader = make_loader(test_dataset, config['batch_size'])
+
     criterion = nn.CrossEntropyLoss()
     trainable_params = [p for p in model.parameters() if p.requires_grad]
-    optimizer = optim.Adam(trainable_params, lr=args.lr)
-
-    save_name = f"best_{args.model}_unfrozen_{args.unfreeze_blocks}.pth"
+    optimizer = optim.Adam(trainable_params, lr=config['lr'])
 
     # --- TRAINING LOOP ---
     best_clinical_score = 0.0  
     best_auc_tracker = 0.0     
     patience = 7  
     patience_counter = 0
+    last_clinical_score = None
+    stopped = False
+    epochs = config['epochs']
+    epochs_run = 0
+
+    if state_path is not None and Path(state_path).exists():
+        state = load_training_state(state_path, model, optimizer, train_loader)
+        epochs_run, stopped = state['epoch'], state['stopped']
+        best_clinical_score, best_auc_tracker = state['best_clinical_score'], state['best_auc_tracker']
+        patience_counter, last_clinical_score = state['patience_counter'], state['last_clinical_score']
+        print(f"Resumed training state after epoch {epochs_run}.\n")
 
-    for epoch in range(args.epochs):
-        model.train()
+    stop_epoch = epochs if epoch_budget is None else min(epochs, epoch_budget)
+    if stopped:
+        stop_epoch = epochs_run # Early stopping already triggered: nothing left to train
+
+    for epoch in range(epochs_run, stop_epoch):
+        net.train()
         running_loss = 0.0
+        if cache_prefix:
+            train_dataset.set_epoch(epoch) # Augmentation bank: one fixed view per epoch
         
-        for images, labels in tqdm(train_loader, desc=f"Epoch {epoch+1}/{args.epochs}"):
-            images, labels = images.to(device), labels.to(device)
-            
-            optimizer.zero_grad()
-            outputs = model(images)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            
-            running_loss += loss.item() * images.size(0)
+        with span("train_epoch", epoch=epoch + 1) as s:
+            for images, labels in tqdm(train_loader, desc=f"Epoch {epoch+1}/{epochs}"):
+                images, labels = images.to(device), labels.to(device)
+                
+                optimizer.zero_grad()
+                outputs = net(images)
+                loss = criterion(outputs, labels)
+                loss.backward()
+                optimizer.step()
+                
+                running_loss += loss.item() * images.size(0)
+                s.add_items(images.size(0))
             
         epoch_loss = running_loss / len(train_loader.dataset)
         
         # Evaluate strictly on VALIDATION loader during training
-        val_acc, val_auc, val_f1, val_sens, val_spec, best_thresh = evaluate(model, val_loader, device)
+        with span("validate", items=len(val_loader.dataset), epoch=epoch + 1):
+            val_acc, val_auc, val_f1, val_sens, val_spec, best_thresh = evaluate(net, val_loader, device)
         
         print(f"Epoch {epoch+1} Loss: {epoch_loss:.4f} | Optimal Val Cutoff: {best_thresh:.2f} | Val AUC: {val_auc:.3f} | Val F1: {val_f1*100:.1f}% | Val Sens: {val_sens*100:.1f}% | Val Spec: {val_spec*100:.1f}%")
 
         # --- EARLY STOPPING & SAVING (BASED ON VAL SET) ---
         current_clinical_score = val_sens + val_spec
+        last_clinical_score = current_clinical_score
+        epochs_run = epoch + 1
         
         if current_clinical_score > best_clinical_score:
             best_clinical_score = current_clinical_score
             best_auc_tracker = val_auc
             patience_counter = 0  
             
-            torch.save(model.state_dict(), save_name)
+            torch.save(model.state_dict(), save_path)
             print(f"New best clinical model saved. (Val Sens+Spec: {best_clinical_score:.3f} | Val AUC: {best_auc_tracker:.3f})")
         else:
             patience_counter += 1
@@ -293,20 +427,34 @@ def main():
             
         if patience_counter >= patience:
             print(f"\nEarly stopping triggered. The model stopped improving after {epoch+1} epochs.")
+            stopped = True
             break
 
+    if state_path is not None:
+        save_training_state(state_path, {
+            'epoch': epochs_run, 'best_clinical_score': best_clinical_score, 'best_auc_tracker': best_auc_tracker,
+            'patience_counter': patience_counter, 'last_clinical_score': last_clinical_score, 'stopped': stopped,
+        }, model, optimizer, train_loader)
+
+    result = {
+        'best_val_score': best_clinical_score, 'best_val_auc': best_auc_tracker, 'last_val_score': last_clinical_score,
+        'epochs_run': epochs_run, 'stopped': stopped,
+    }
+    if not run_test:
+        return result
+
     # --- FINAL TEST EVALUATION ---
     print("\n" + "="*70)
     print("PHASE 2 FINAL RESULTS: EVALUATING ON UNTOUCHED TEST SET")
     print("="*70)
     
     # Load the absolute best weights identified by the Validation set
-    model.load_state_dict(torch.load(save_name))
+    model.load_state_dict(torch.load(save_path))
     
     # Evaluate exactly once on pure Test set
-    test_acc, test_auc, test_f1, test_sens, test_spec, test_thresh = evaluate(model, test_loader, device)
+    test_acc, test_auc, test_f1, test_sens, test_spec, test_thresh = evaluate(net, test_loader, device)
     
-    print(f"Model: {args.model.upper()} | Unfrozen Blocks: {args.unfreeze_blocks}")
+    print(f"Model: {config['model'].upper()} | Unfrozen Blocks: {config['unfreeze_blocks']}")
     print(f"Optimal Test Cutoff: {test_thresh:.2f}")
     print(f"Test Accuracy:    {test_acc*100:.1f}%")
     print(f"Test F1-Score:    {test_f1*100:.1f}%")
@@ -315,5 +463,48 @@ def main():
     print(f"Test Specificity: {test_spec*100:.1f}%")
     print("="*70)
 
+    result.update({
+        'test_acc': test_acc, 'test_auc': test_auc, 'test_f1': test_f1,
+        'test_sens': test_sens, 'test_spec': test_spec, 'test_thresh': test_thresh,
+    })
+    return result
+
+# --- 6. MAIN SCRIPT ---
+@instrumented("03_train_phase2_vision_only")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='resnet', choices=['resnet', 'densenet', 'efficientnet'])
+    parser.add_argument('--unfreeze_blocks', type=int, default=1, choices=[0, 1, 2, 3, 4, 5], help="0=Frozen, 1-4=Partial, 5=Full")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--input', type=str, default='hu', choices=['hu', 'windows'],
+                        help="hu = raw HU patches, windows = precomputed uint8 window channels (06_build_window_channels.py)")
+    parser.add_argument('--hu_norm', action='store_true',
+                        help="Standardize HU patches with the cohort constants from 07_cohort_intensity_stats.py")
+    parser.add_argument('--stream_patches', action='store_true',
+                        help="Read HU patches from disk on every access instead of holding each split as one in-RAM tensor")
+    parser.add_argument('--num_workers', type=int, default=DEFAULT_NUM_WORKERS, help="DataLoader worker processes (0 = main process)")
+    parser.add_argument('--prefetch_factor', type=int, default=DEFAULT_PREFETCH_FACTOR, help="Batches prefetched per worker")
+    parser.add_argument('--cache_prefix', action='store_true',
+                        help="Compute the frozen prefix once per split and train only the unfrozen tail (utils/prefix_cache.py)")
+    parser.add_argument('--augment_bank', type=int, default=0,
+                        help="With --cache_prefix: number of fixed augmented Train views (0 = no augmentation)")
+    args = parser.parse_args()
+    if args.cache_prefix and args.unfreeze_blocks == 5:
+        parser.error("--cache_prefix needs a frozen prefix (unfreeze_blocks < 5).")
+
+    print(f"=== STARTING PHASE 2 RUN ===")
+    print(f"Model: {args.model.upper()} | Unfrozen Blocks: {args.unfreeze_blocks} | Epochs: {args.epochs}")
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using Hardware: {device}\n")
+
+    datasets, _ = load_split_datasets(args.input, args.hu_norm, args.stream_patches)
+
+    save_name = checkpoint_name(args.model, args.unfreeze_blocks, args.input, args.cache_prefix)
+    loader_args = dict(num_workers=args.num_workers, prefetch_factor=args.prefetch_factor)
+    train_vision_model(vars(args), datasets, device, save_name, loader_args)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -6,12 +6,12 @@ from the hyperparameter sweep and evaluates them on the untouched Test Set.
 It prints a single, clean matrix for your thesis report!
 """
 
+import sys
 import os
 import torch
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from torch.utils.data import Dataset, DataLoader
 import torchvision.models as models
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, roc_auc_score, confusion_matrix, roc_curve, f1_score
@@ -21,30 +21,12 @@ warnings.filterwarnings('ignore')
 
 # --- 1. CONFIGURATION ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
 
-# --- 2. DATASET DEFINITION (TEST ONLY) ---
-class CTPatchDataset(Dataset):
-    def __init__(self, manifest_df, label_encoder):
-        self.df = manifest_df[manifest_df['patch_extracted'] == True].copy()
-        self.df.reset_index(drop=True, inplace=True)
-        self.le = label_encoder
-        
-    def __len__(self):
-        return len(self.df)
-
-    def __getitem__(self, idx):
-        row = self.df.iloc[idx]
-        patch_path = PROJECT_ROOT / row['patch_file_path']
-        patch_array = np.load(patch_path).astype(np.float32)
-        
-        image_tensor = torch.tensor(patch_array)
-        if image_tensor.shape[-1] < 10: 
-            image_tensor = image_tensor.permute(2, 0, 1)
-            
-        label = self.le.transform([row['histology']])[0]
-        label_tensor = torch.tensor(label, dtype=torch.long)
-        return image_tensor, label_tensor
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest
+from utils.datasets import CTPatchDataset
+from utils.loaders import make_loader
+from utils.instrumentation import instrumented, span
 
 # --- 3. MODEL BUILDER ---
 def build_vision_model(model_name, in_channels, num_classes=2):
@@ -99,20 +81,21 @@ def evaluate(model, dataloader, device):
     return acc, auc, f1, sens, spec
 
 # --- 5. MAIN SCRIPT ---
+@instrumented("04_evaluate_vision_vision_sweep")
 def main():
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"Rescue Script Starting... Using Hardware: {device}\n")
 
     # Setup Data
-    df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
+    df = read_manifest()
     df = df[(df['dataset_split'] != 'Excluded') & (df['histology'].isin(['Adenocarcinoma', 'Squamous cell carcinoma']))].copy()
     
     le = LabelEncoder()
     le.fit(df['histology'])
     
     test_df = df[df['dataset_split'] == 'Test']
-    test_dataset = CTPatchDataset(test_df, le)
-    test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False)
+    test_dataset = CTPatchDataset(test_df, le, in_memory=True)
+    test_loader = make_loader(test_dataset, batch_size=16)
     
     in_channels = test_dataset[0][0].shape[0]
     print(f"Loading Test Set... Found {len(test_dataset)} patients.\n")
@@ -130,10 +113,11 @@ def main():
             
             # If the file exists, evaluate it!
             if model_file.exists():
-                model = build_vision_model(arch, in_channels).to(device)
-                model.load_state_dict(torch.load(model_file, map_location=device))
-                
-                acc, auc, f1, sens, spec = evaluate(model, test_loader, device)
+                with span("evaluate_model", items=len(test_dataset), model=arch, unfreeze_blocks=level):
+                    model = build_vision_model(arch, in_channels).to(device)
+                    model.load_state_dict(torch.load(model_file, map_location=device))
+                    
+                    acc, auc, f1, sens, spec = evaluate(model, test_loader, device)
 
                 results.append({
                     "Architecture": arch.upper(),
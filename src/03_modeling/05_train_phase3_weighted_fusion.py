@@ -7,13 +7,13 @@ proportional to their individual baseline AUC scores, giving the
 superior Vision model a mathematically higher impact on the final decision.
 """
 
+import sys
 import os
 import random
 import torch
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from torch.utils.data import Dataset, DataLoader
 import torchvision.models as models
 import torch.nn as nn
 from sklearn.preprocessing import StandardScaler, LabelEncoder
@@ -27,10 +27,15 @@ warnings.filterwarnings('ignore')
 
 # --- 1. CONFIGURATION & SEEDING ---
 PROJECT_ROOT = Path(__file__).parent.parent.parent
-FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
 FILE_CLINICAL = PROJECT_ROOT / "data" / "raw" / "clinical" / "NSCLCR01Radiogenomic_DATA_LABELS_2018-05-22_1500-shifted.csv"
 VISION_WEIGHTS = PROJECT_ROOT / "best_resnet_unfrozen_4.pth"
 
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.manifest import read_manifest
+from utils.datasets import CTPatchDataset
+from utils.loaders import make_loader
+from utils.instrumentation import instrumented
+
 # AUC Scores from Phase 1b and Phase 2
 AUC_CLINICAL = 0.652
 AUC_VISION = 0.757
@@ -46,29 +51,7 @@ def set_seed(seed=42):
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = False
 
-# --- 2. VISION DATASET & BUILDER ---
-class CTPatchDataset(Dataset):
-    def __init__(self, manifest_df, label_encoder):
-        self.df = manifest_df[manifest_df['patch_extracted'] == True].copy()
-        self.df.reset_index(drop=True, inplace=True)
-        self.le = label_encoder
-        
-    def __len__(self):
-        return len(self.df)
-
-    def __getitem__(self, idx):
-        row = self.df.iloc[idx]
-        patch_path = PROJECT_ROOT / row['patch_file_path']
-        patch_array = np.load(patch_path).astype(np.float32)
-        
-        image_tensor = torch.tensor(patch_array)
-        if image_tensor.shape[-1] < 10: 
-            image_tensor = image_tensor.permute(2, 0, 1)
-            
-        label = self.le.transform([row['histology']])[0]
-        label_tensor = torch.tensor(label, dtype=torch.long)
-        return image_tensor, label_tensor
-
+# --- 2. VISION BUILDER ---
 def build_resnet(in_channels, num_classes=2):
     model = models.resnet18()
     original_conv = model.conv1
@@ -79,6 +62,7 @@ def build_resnet(in_channels, num_classes=2):
     return model
 
 # --- 3. MAIN FUSION SCRIPT ---
+@instrumented("05_train_phase3_weighted_fusion")
 def main():
     # Lock the environment!
     set_seed(42)
@@ -88,7 +72,7 @@ def main():
     print(f"Using Hardware: {device}\n")
 
     # 1. Load and Merge Data
-    manifest_df = pd.read_csv(FILE_MANIFEST, sep=';', decimal=',')
+    manifest_df = read_manifest()
     clinical_df = pd.read_csv(FILE_CLINICAL)
     manifest_df = manifest_df[manifest_df['dataset_split'] != 'Excluded'].copy()
     valid_cancers = ['Adenocarcinoma', 'Squamous cell carcinoma']
@@ -130,8 +114,8 @@ def main():
     # --- PILLAR 2: GET VISION PROBABILITIES ---
     print("Loading Phase 2 Champion (ResNet Level 4)...")
     test_df = df[test_mask].copy()
-    test_dataset = CTPatchDataset(test_df, le)
-    test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False) 
+    test_dataset = CTPatchDataset(test_df, le, in_memory=True)
+    test_loader = make_loader(test_dataset, batch_size=16) 
     
     in_channels = test_dataset[0][0].shape[0]
     vision_model = build_resnet(in_channels).to(device)
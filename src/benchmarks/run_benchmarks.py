@@ -0,0 +1,385 @@
+"""
+End-to-End Pipeline Benchmark Suite.
+
+Times every stage of the pipeline on synthetic cohorts of several sizes (see
+generate_synthetic_cohort.py) and compares the throughput against a saved
+baseline:
+
+    stage                unit       what is timed
+    xml_parse            patients   01: parse_xml over all AIM files
+    series_matching      patients   01: find_dicom_folder_for_uid per annotation
+    manifest_creation    patients   02: run()
+    coordinate_mapping   patients   03: run() with a cold DICOM header index
+    series_sorting       slices     04: get_sorted_dicom_series per mapped patient
+    patch_extraction     patients   04: run()
+    dataset_iteration    samples    CTPatchDataset through a DataLoader
+    training_epoch       samples    one ResNet-18 epoch (unfreeze_blocks=1)
+    evaluation           samples    evaluate() of the phase 2 script
+
+Each cohort is measured in a separate process started through the cohort's
+linked `src`, so every stage module resolves PROJECT_ROOT to the cohort and
+the real 'data/' folder is never touched. All numbers are medians over
+`--repeats` runs with a warm page cache; every run is also logged as a span
+(see utils/instrumentation.py) in the cohort's run log.
+
+Usage:
+    python run_benchmarks.py --sizes 10 50 200 --save_baseline
+    python run_benchmarks.py --sizes 10 50 200 --tolerance 0.2   # exit code 1 on regression
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import importlib
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_BENCHMARKS = PROJECT_ROOT / "data" / "benchmarks"
+FILE_BASELINE = DIR_BENCHMARKS / "baseline.json"
+FILE_COHORT_INFO = "synthetic_cohort.json"
+
+sys.path.append(str(PROJECT_ROOT / "src"))
+from utils.instrumentation import span
+
+# Primary unit per stage; the comparison uses the throughput in this unit
+STAGE_UNITS = {
+    'xml_parse': 'patients',
+    'series_matching': 'patients',
+    'manifest_creation': 'patients',
+    'coordinate_mapping': 'patients',
+    'series_sorting': 'slices',
+    'patch_extraction': 'patients',
+    'dataset_iteration': 'samples',
+    'training_epoch': 'samples',
+    'evaluation': 'samples',
+}
+BATCH_SIZE = 16
+
+def load_stage(folder, module_name):
+    """Imports a numbered stage script (e.g. '04_extract_patches') as a module."""
+    sys.path.insert(0, str(PROJECT_ROOT / "src" / folder))
+    return importlib.import_module(module_name)
+
+def time_stage(results, stage, repeats, fn, setup=None):
+    """
+    Runs one stage `repeats` times and stores the median timing.
+
+    Args:
+        results (dict): Result dict of the cohort (updated in place).
+        stage (str): Stage name (key of STAGE_UNITS).
+        repeats (int): Number of timed runs.
+        fn (callable): Runs the stage once and returns (output, counts), where
+            counts maps units ('patients', 'slices', 'samples') to item counts.
+        setup (callable, optional): Called before every run, outside the timing.
+
+    Returns:
+        The output of the last run.
+    """
+    walls = []
+    for r in range(repeats):
+        if setup:
+            setup()
+        with span(f"bench.{stage}", repeat=r) as s:
+            output, counts = fn()
+            s.add_items(counts[STAGE_UNITS[stage]])
+        walls.append(s.record['wall_s'])
+
+    wall = float(np.median(walls))
+    entry = {'unit': STAGE_UNITS[stage], 'wall_s': round(wall, 6), 'runs_s': [round(w, 6) for w in walls]}
+    for unit, count in counts.items():
+        entry[unit] = int(count)
+        entry[f'{unit}_per_s'] = round(count / wall, 3) if wall > 0 else None
+    entry['throughput'] = entry[f"{STAGE_UNITS[stage]}_per_s"]
+    results[stage] = entry
+    print(f"[bench] {stage:<20} {wall:8.3f}s  {entry['throughput'] or 0:10.1f} {entry['unit']}/s")
+    return output
+
+def measure_cohort(repeats, skip_training):
+    """
+    Times all stages on the cohort this script is located in.
+
+    Args:
+        repeats (int): Number of timed runs per stage.
+        skip_training (bool): If True, the dataset/training/evaluation stages are skipped.
+
+    Returns:
+        dict: Stage name -> timing entry.
+    """
+    explore = load_stage("02_data_curation", "01_explore_all_series")
+    create_manifest = load_stage("02_data_curation", "02_create_manifest")
+    mapping = load_stage("02_data_curation", "03_coordinate_mapping_and_qc")
+    extract = load_stage("02_data_curation", "04_extract_patches")
+    from utils.manifest import write_manifest
+    from utils.dicom_index import DIR_HEADER_INDEX
+
+    results = {}
+    xml_files = sorted(explore.DIR_XML.rglob("*.xml"))
+
+    def parse_xmls():
+        parsed = [explore.parse_xml(path) for path in xml_files]
+        return parsed, {'patients': len(parsed)}
+    parsed = time_stage(results, 'xml_parse', repeats, parse_xmls)
+
+    def match_series():
+        slices = 0
+        for patient_id, target_uid in parsed:
+            patient_dir = explore.DIR_DICOM / patient_id
+            if not patient_dir.exists():
+                patient_dir = explore.DIR_DICOM / "NSCLC Radiogenomics" / patient_id
+            _, _, slice_count, _ = explore.find_dicom_folder_for_uid(patient_dir, target_uid)
+            slices += slice_count or 0
+        return None, {'patients': len(parsed), 'slices': slices}
+    time_stage(results, 'series_matching', repeats, match_series)
+
+    def create():
+        df = create_manifest.run()
+        return df, {'patients': len(df)}
+    df = time_stage(results, 'manifest_creation', repeats, create)
+
+    def map_coordinates():
+        out = mapping.run(df.copy())
+        return out, {'patients': int(((df['xml_present'] == True) & (df['qc_pass'] == True)).sum())}
+    df = time_stage(results, 'coordinate_mapping', repeats, map_coordinates,
+                    setup=lambda: shutil.rmtree(DIR_HEADER_INDEX, ignore_errors=True))
+
+    mapped = df[df['coordinate_mapped_successfully'] == True]
+    def sort_series():
+        slices = 0
+        for pid, series_uid in zip(mapped['subject_id'], mapped['chosen_series_uid']):
+            patient_dir = extract.DIR_DICOM / pid
+            if not patient_dir.exists():
+                patient_dir = extract.DIR_DICOM / "NSCLC Radiogenomics" / pid
+            slices += len(extract.get_sorted_dicom_series(patient_dir, str(series_uid).strip()))
+        return None, {'patients': len(mapped), 'slices': slices}
+    time_stage(results, 'series_sorting', repeats, sort_series)
+
+    def extract_patches():
+        out = extract.run(df.copy())
+        n = int(out['patch_extracted'].sum())
+        return out, {'patients': n, 'slices': n * (extract.PATCH_SLICES_Z_PLUS_MINUS * 2 + 1)}
+    df = time_stage(results, 'patch_extraction', repeats, extract_patches)
+
+    # No 05_split_data: tiny cohorts cannot be split stratified, and the
+    # training stages below use all extracted patches anyway
+    write_manifest(df)
+
+    if not skip_training:
+        measure_training(results, df, repeats)
+    return results
+
+def measure_training(results, df, repeats):
+    """Times dataset iteration, one training epoch and evaluation on all extracted patches."""
+    import torch
+    import torch.nn as nn
+    import torch.optim as optim
+    from utils.loaders import make_loader
+    from sklearn.preprocessing import LabelEncoder
+    phase2 = load_stage("03_modeling", "03_train_phase2_vision_only")
+
+    df = df[df['histology'].isin(['Adenocarcinoma', 'Squamous cell carcinoma'])]
+    le = LabelEncoder().fit(['Adenocarcinoma', 'Squamous cell carcinoma'])
+    dataset = phase2.CTPatchDataset(df, le, in_memory=True)
+    if len(dataset) == 0:
+        print("[bench] No extracted patches - training stages skipped.")
+        return
+
+    phase2.set_seed(42)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    loader = make_loader(dataset, BATCH_SIZE, shuffle=True)
+    eval_loader = make_loader(dataset, BATCH_SIZE)
+
+    def iterate():
+        n = sum(images.size(0) for images, _ in loader)
+        return None, {'samples': n}
+    time_stage(results, 'dataset_iteration', repeats, iterate)
+
+    model = phase2.build_vision_model('resnet', 1, dataset[0][0].shape[0]).to(device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam([p for p in model.parameters() if p.requires_grad], lr=0.001)
+
+    def train_epoch():
+        model.train()
+        n = 0
+        for images, labels in loader:
+            images, labels = images.to(device), labels.to(device)
+            optimizer.zero_grad()
+            loss = criterion(model(images), labels)
+            loss.backward()
+            optimizer.step()
+            n += images.size(0)
+        return None, {'samples': n}
+    time_stage(results, 'training_epoch', repeats, train_epoch)
+
+    def evaluate():
+        phase2.evaluate(model, eval_loader, device)
+        return None, {'samples': len(dataset)}
+    time_stage(results, 'evaluation', repeats, evaluate)
+
+def prepare_cohort(n_patients, work_dir, matrix, slices, seed):
+    """
+    Generates the synthetic cohort of one size (reused if the parameters match).
+
+    Returns:
+        Path: The cohort directory.
+    """
+    cohort_dir = work_dir / f"cohort_{n_patients}_{matrix}px_{slices}sl_seed{seed}"
+    info_file = cohort_dir / FILE_COHORT_INFO
+    if info_file.exists():
+        return cohort_dir
+    if cohort_dir.exists():
+        shutil.rmtree(cohort_dir)  # Incomplete earlier generation
+
+    subprocess.run([sys.executable, str(PROJECT_ROOT / "src" / "benchmarks" / "generate_synthetic_cohort.py"),
+                    '--out', str(cohort_dir), '--patients', str(n_patients), '--matrix', str(matrix),
+                    '--slices', str(slices), '--seed', str(seed)], check=True)
+    return cohort_dir
+
+def run_cohort(cohort_dir, repeats, skip_training, run_id):
+    """
+    Measures one cohort in a separate process started through the cohort's linked `src`.
+
+    Returns:
+        dict: Stage name -> timing entry.
+    """
+    result_file = cohort_dir / "data" / "processed" / "benchmark_result.json"
+    cmd = [sys.executable, str(cohort_dir / "src" / "benchmarks" / "run_benchmarks.py"),
+           '--measure', '--result_file', str(result_file), '--repeats', str(repeats)]
+    if skip_training:
+        cmd.append('--skip_training')
+    # Stage output (progress bars, prints) is discarded; only the summary lines are shown
+    proc = subprocess.run(cmd, env=dict(os.environ, NSCLC_RUN_ID=run_id),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    print("\n".join(line for line in proc.stdout.splitlines() if line.startswith("[bench]")))
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise RuntimeError(f"Benchmark of {cohort_dir.name} failed (exit code {proc.returncode})")
+    with open(result_file) as f:
+        return json.load(f)
+
+def compare(current, baseline, tolerance):
+    """
+    Compares the throughput of every stage and cohort size with the baseline.
+
+    Args:
+        current (dict): Results of this run.
+        baseline (dict): Saved baseline results.
+        tolerance (float): Allowed relative slowdown (0.2 = 20%).
+
+    Returns:
+        list of dicts: One row per stage and size present in both; rows with
+        'regression' True are slower than the baseline by more than the tolerance.
+    """
+    rows = []
+    for size, stages in current['sizes'].items():
+        for stage, entry in stages.items():
+            base = baseline['sizes'].get(size, {}).get(stage)
+            if not base or not base.get('throughput') or not entry.get('throughput'):
+                continue
+            ratio = entry['throughput'] / base['throughput']
+            rows.append({
+                'size': int(size), 'stage': stage, 'unit': entry['unit'],
+                'baseline': base['throughput'], 'current': entry['throughput'],
+                'change': ratio - 1.0, 'regression': ratio < 1.0 - tolerance,
+            })
+    return rows
+
+def print_comparison(rows, tolerance):
+    """Prints the comparison table and returns the number of regressions."""
+    print("\n" + "="*85)
+    print(f"COMPARISON WITH BASELINE (tolerance: -{tolerance * 100:.0f}% throughput)")
+    print("="*85)
+    print(f"{'size':>6}  {'stage':<20} {'baseline':>12} {'current':>12} {'unit':<10} {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row['regression'] else ""
+        print(f"{row['size']:>6}  {row['stage']:<20} {row['baseline']:>12.1f} {row['current']:>12.1f} "
+              f"{row['unit'] + '/s':<10} {row['change'] * 100:>+7.1f}%{flag}")
+    return sum(row['regression'] for row in rows)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100], help="Cohort sizes (patients)")
+    parser.add_argument('--repeats', type=int, default=3, help="Timed runs per stage (median is reported)")
+    parser.add_argument('--matrix', type=int, default=256, help="Image matrix of the synthetic cohorts")
+    parser.add_argument('--slices', type=int, default=80, help="Slices of the thin series")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work_dir', type=str, default=str(DIR_BENCHMARKS / "cohorts"))
+    parser.add_argument('--results_dir', type=str, default=str(DIR_BENCHMARKS))
+    parser.add_argument('--baseline', type=str, default=str(FILE_BASELINE))
+    parser.add_argument('--save_baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative throughput loss")
+    parser.add_argument('--skip_training', action='store_true', help="Skip dataset/training/evaluation stages")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result_file', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Never run stages against a real project: they overwrite 'data/processed'
+        if not (PROJECT_ROOT / FILE_COHORT_INFO).exists():
+            sys.exit(f"ERROR: {PROJECT_ROOT} is not a synthetic cohort (no {FILE_COHORT_INFO}).")
+        results = measure_cohort(args.repeats, args.skip_training)
+        with open(args.result_file, 'w') as f:
+            json.dump(results, f, indent=2)
+        return
+
+    run_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    work_dir = Path(args.work_dir).absolute()
+    current = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'host': platform.node(), 'platform': platform.platform(),
+            'python': platform.python_version(), 'cpu_count': os.cpu_count(),
+            'repeats': args.repeats, 'matrix': args.matrix, 'slices': args.slices, 'seed': args.seed,
+        },
+        'sizes': {},
+    }
+
+    start = time.time()
+    for n_patients in args.sizes:
+        cohort_dir = prepare_cohort(n_patients, work_dir, args.matrix, args.slices, args.seed)
+        print(f"\n--- Cohort: {n_patients} patients ({cohort_dir.name}) ---")
+        current['sizes'][str(n_patients)] = run_cohort(cohort_dir, args.repeats, args.skip_training,
+                                                       f"bench_{run_stamp}")
+
+    results_dir = Path(args.results_dir)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    result_path = results_dir / f"results_{run_stamp}.json"
+    with open(result_path, 'w') as f:
+        json.dump(current, f, indent=2)
+
+    print("\n" + "="*50)
+    print(f"BENCHMARKS COMPLETE ({time.time() - start:.1f}s)")
+    print("="*50)
+    print(f"Results saved to: {result_path}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(result_path, baseline_path)
+        print(f"Baseline saved to: {baseline_path}")
+        return
+
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}. Run with --save_baseline to create one.")
+        return
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if any(baseline['meta'].get(k) != current['meta'][k] for k in ('matrix', 'slices', 'seed')):
+        print("WARNING: Baseline was recorded with a different cohort configuration.")
+    n_regressions = print_comparison(compare(current, baseline, args.tolerance), args.tolerance)
+    if n_regressions:
+        print(f"\n{n_regressions} stage(s) slower than the baseline beyond the tolerance.")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
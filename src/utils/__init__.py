@@ -0,0 +1,7 @@
+"""
+Shared helpers for the NSCLC curation and modeling scripts.
+
+The numbered scripts in `src/` stay runnable on their own. Code that more than
+one stage needs (volume caching, datasets, ...) lives in this package and is
+imported after adding `src/` to `sys.path`.
+"""
@@ -0,0 +1,110 @@
+"""
+Batched Tensor-Level Augmentation.
+
+`BatchAugment` applies the training augmentation of the vision models
+(horizontal/vertical flips and a random rotation, as the former torchvision
+`RandomHorizontalFlip`/`RandomVerticalFlip`/`RandomRotation(15)` pipeline) to a
+whole `(B, C, H, W)` batch at once:
+
+- flips are boolean masks over the batch, turned into per-sample signs of the
+  sampling matrix (a flip is a mirrored axis, so no separate copy is needed),
+- rotations use a per-sample angle in the same matrix,
+
+so the whole augmentation is one `affine_grid`/`grid_sample` call
+(nearest-neighbour sampling and zero fill, like `RandomRotation`). The result
+matches flipping, then rotating each sample with torchvision up to
+nearest-neighbour rounding ties at pixel boundaries: with the same angles and
+flips, about 1e-5 of the pixels take a neighbouring value (flips, 0 and 90
+degree rotations are identical).
+
+Randomness contract: every batch draws its flip masks and angles with three
+`torch.rand` calls, in the main process, from the global torch RNG (as seeded
+by `set_seed`) or from an explicit `generator`. Runs are therefore
+reproducible and independent of the number of loader workers (see
+`utils.loaders`).
+"""
+
+import math
+import torch
+import torch.nn.functional as F
+
+# --- CONFIGURATION ---
+DEFAULT_FLIP_P = 0.5
+DEFAULT_DEGREES = 15.0
+
+def augmentation_thetas(angles_deg, hflip=None, vflip=None):
+    """
+    Builds the `affine_grid` matrices of (optional) flips followed by a rotation.
+
+    Args:
+        angles_deg (torch.Tensor): (B,) counter-clockwise angles in degrees.
+        hflip (torch.Tensor, optional): (B,) bool mask of horizontal flips.
+        vflip (torch.Tensor, optional): (B,) bool mask of vertical flips.
+
+    Returns:
+        torch.Tensor: (B, 2, 3) affine matrices (output -> input coordinates).
+    """
+    radians = angles_deg * (math.pi / 180.0)
+    cos, sin = torch.cos(radians), torch.sin(radians)
+    zeros = torch.zeros_like(cos)
+    thetas = torch.stack([torch.stack([cos, -sin, zeros], dim=1),
+                          torch.stack([sin, cos, zeros], dim=1)], dim=1)
+    # Sampling the flipped image at p is sampling the image at the mirrored p
+    if hflip is not None:
+        thetas[:, 0] *= torch.where(hflip, -1.0, 1.0).to(thetas.dtype)[:, None]
+    if vflip is not None:
+        thetas[:, 1] *= torch.where(vflip, -1.0, 1.0).to(thetas.dtype)[:, None]
+    return thetas
+
+def augment_batch(images, angles_deg, hflip=None, vflip=None, mode='nearest'):
+    """
+    Flips and rotates every image of a batch with its own parameters in one `grid_sample` call.
+
+    Args:
+        images (torch.Tensor): (B, C, H, W) float batch.
+        angles_deg (torch.Tensor): (B,) counter-clockwise angles in degrees.
+        hflip (torch.Tensor, optional): (B,) bool mask of horizontal flips.
+        vflip (torch.Tensor, optional): (B,) bool mask of vertical flips.
+        mode (str): 'nearest' (as `RandomRotation`) or 'bilinear'.
+
+    Returns:
+        torch.Tensor: The augmented batch; pixels rotated in from outside are 0.
+    """
+    thetas = augmentation_thetas(angles_deg, hflip, vflip).to(images.device, images.dtype)
+    if images.shape[-1] != images.shape[-2]:
+        # affine_grid works in normalized coordinates: rescale for non-square images
+        aspect = images.shape[-1] / images.shape[-2]
+        thetas[:, 0, 1] /= aspect
+        thetas[:, 1, 0] *= aspect
+    grid = F.affine_grid(thetas, list(images.shape), align_corners=False)
+    return F.grid_sample(images, grid, mode=mode, padding_mode='zeros', align_corners=False)
+
+class BatchAugment:
+    """
+    Random flips and rotation for a whole batch.
+
+    Args:
+        p_hflip (float): Probability of a horizontal flip per sample.
+        p_vflip (float): Probability of a vertical flip per sample.
+        degrees (float): Angles are drawn uniformly from [-degrees, degrees].
+        mode (str): Interpolation of the rotation ('nearest' or 'bilinear').
+        generator (torch.Generator, optional): RNG for the draws (default: global torch RNG).
+    """
+    def __init__(self, p_hflip=DEFAULT_FLIP_P, p_vflip=DEFAULT_FLIP_P, degrees=DEFAULT_DEGREES,
+                 mode='nearest', generator=None):
+        self.p_hflip = p_hflip
+        self.p_vflip = p_vflip
+        self.degrees = degrees
+        self.mode = mode
+        self.generator = generator
+
+    def sample_params(self, batch_size):
+        """Draws the per-sample flip masks and rotation angles of one batch."""
+        hflip = torch.rand(batch_size, generator=self.generator) < self.p_hflip
+        vflip = torch.rand(batch_size, generator=self.generator) < self.p_vflip
+        angles = (torch.rand(batch_size, generator=self.generator) * 2 - 1) * self.degrees
+        return hflip, vflip, angles
+
+    def __call__(self, images):
+        hflip, vflip, angles = self.sample_params(images.shape[0])
+        return augment_batch(images, angles, hflip, vflip, self.mode)
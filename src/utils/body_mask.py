@@ -0,0 +1,103 @@
+"""
+Vectorized Body and Lung Mask Computation.
+
+Most voxels of a chest CT are air or the scanner table outside the patient.
+The body is found by HU thresholding, 3D connected component labeling and
+keeping the largest component (the table and noise form smaller, separate
+components). Holes are filled slice by slice so the lungs are inside the body
+mask. The lungs are the low-density voxels inside the filled body, again
+reduced to their largest components.
+
+All steps are whole-array NumPy/SciPy operations; no Python loop touches
+individual voxels.
+"""
+
+import numpy as np
+from scipy import ndimage
+
+BODY_THRESHOLD_HU = -500
+LUNG_THRESHOLD_HU = -320
+
+def largest_components(mask, n_keep=1):
+    """
+    Keeps the n largest 3D connected components of a binary mask.
+
+    Args:
+        mask (numpy.ndarray): Boolean (Z, Y, X) mask.
+        n_keep (int): Number of components to keep.
+
+    Returns:
+        numpy.ndarray: Boolean mask with only the largest components.
+    """
+    labels, n_labels = ndimage.label(mask)
+    if n_labels == 0:
+        return mask
+
+    sizes = np.bincount(labels.ravel())
+    sizes[0] = 0  # Background
+    keep = np.argsort(sizes)[::-1][:n_keep]
+    keep = keep[sizes[keep] > 0]
+    return np.isin(labels, keep)
+
+def compute_body_mask(volume):
+    """
+    Computes the patient body mask of a HU volume.
+
+    Args:
+        volume (numpy.ndarray): The (Z, Y, X) int16 HU volume.
+
+    Returns:
+        numpy.ndarray: Boolean body mask (lungs included).
+    """
+    body = largest_components(np.asarray(volume) > BODY_THRESHOLD_HU)
+
+    # Fill the lungs and airways in every axial slice (2D structure only)
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = ndimage.generate_binary_structure(2, 1)
+    return ndimage.binary_fill_holes(body, structure=structure)
+
+def compute_lung_mask(volume, body_mask):
+    """
+    Computes the lung mask as low-density voxels inside the body.
+
+    Args:
+        volume (numpy.ndarray): The (Z, Y, X) int16 HU volume.
+        body_mask (numpy.ndarray): Output of `compute_body_mask`.
+
+    Returns:
+        numpy.ndarray: Boolean lung mask (the two largest components, as
+        the left and right lung may or may not be connected).
+    """
+    lungs = body_mask & (np.asarray(volume) < LUNG_THRESHOLD_HU)
+    return largest_components(lungs, n_keep=2)
+
+def mask_bbox(mask, margin=0):
+    """
+    Returns the bounding box of a mask, enlarged by a margin.
+
+    Args:
+        mask (numpy.ndarray): Boolean (Z, Y, X) mask.
+        margin (int): Voxels added on every side (clipped to the volume).
+
+    Returns:
+        tuple: (start, stop) lists of three ints each. The full volume if the
+        mask is empty.
+    """
+    if not mask.any():
+        return [0, 0, 0], list(mask.shape)
+
+    start, stop = [], []
+    for axis in range(3):
+        other = tuple(a for a in range(3) if a != axis)
+        present = np.flatnonzero(mask.any(axis=other))
+        start.append(max(int(present[0]) - margin, 0))
+        stop.append(min(int(present[-1]) + 1 + margin, mask.shape[axis]))
+    return start, stop
+
+def pack_mask(mask):
+    """Bit-packs a boolean mask (1 bit/voxel) for storage."""
+    return np.packbits(mask, axis=-1)
+
+def unpack_mask(packed, shape):
+    """Restores a boolean mask written by `pack_mask`."""
+    return np.unpackbits(packed, axis=-1, count=shape[-1]).astype(bool)
@@ -0,0 +1,191 @@
+"""
+Shared PyTorch Datasets for the CT patch stores.
+
+`CTPatchDataset` serves the 2.5D HU patches written by `04_extract_patches.py`
+as `(C, H, W)` float32 tensors. With `in_memory=True` the split is decoded
+once into a single contiguous tensor (plus an int64 label tensor), so
+`__getitem__` is pure indexing and `__getitems__` gathers a whole batch in one
+indexing call. Loaders over it pass `collate_fn=collate_batch`, which hands
+the gathered batch through without per-sample copies.
+
+`CTVolumeDataset` serves the true 3D patches written by
+`04_extract_patches.py --mode 3d` as `(1, D, H, W)` float32 tensors. Patches are
+opened as memory maps and only kept in RAM up to an explicit byte budget, so
+iterating an epoch never needs more memory than the budget plus one batch.
+
+`WindowStoreDataset` serves the multi-window uint8 channels built by
+`06_build_window_channels.py` (7xK channels per patch). Dequantization and
+the optional per-channel train normalization are applied as one fused
+scale/shift.
+"""
+
+import numpy as np
+import torch
+from pathlib import Path
+from torch.utils.data import Dataset
+
+from utils.patch_store import load_window_store, dequantization_params, dequantize, DIR_WINDOW_STORE
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+def collate_batch(batch):
+    """Collate function for datasets whose `__getitems__` already returns a batch."""
+    return batch
+
+def load_hu_patch(path):
+    """Loads one 2.5D HU patch as a float32 `(C, H, W)` tensor (channels-last files are permuted)."""
+    image_tensor = torch.from_numpy(np.load(path).astype(np.float32))
+    if image_tensor.shape[-1] < 10:
+        image_tensor = image_tensor.permute(2, 0, 1)
+    return image_tensor
+
+class CTPatchDataset(Dataset):
+    """
+    Dataset of 2.5D HU patches, streamed from disk or held as one tensor.
+
+    Args:
+        manifest_df (pandas.DataFrame): Manifest rows (e.g. one split).
+        label_encoder (sklearn.preprocessing.LabelEncoder): Fitted histology encoder.
+        transform (callable, optional): Applied to each `(C, H, W)` tensor.
+        hu_stats (dict, optional): Cohort constants from `07_cohort_intensity_stats.py`.
+            If given, patches are standardized with 'hu_mean'/'hu_std'.
+        in_memory (bool): Decode the whole split once into a contiguous
+            `(N, C, H, W)` float32 tensor (normalization applied at load time).
+
+    Batches come from `__getitems__` in both modes, so DataLoaders over this
+    dataset must use `collate_fn=dataset.collate_fn` (`collate_batch`).
+    """
+    collate_fn = staticmethod(collate_batch)
+
+    def __init__(self, manifest_df, label_encoder, transform=None, hu_stats=None, in_memory=False):
+        self.df = manifest_df[manifest_df['patch_extracted'] == True].copy()
+        self.df.reset_index(drop=True, inplace=True)
+        self.le = label_encoder
+        self.transform = transform
+        self.hu_stats = hu_stats
+
+        self.paths = [PROJECT_ROOT / p for p in self.df['patch_file_path']]
+        self.labels = torch.as_tensor(self.le.transform(self.df['histology']), dtype=torch.long)
+
+        self.images = None
+        if in_memory and len(self.paths) > 0:
+            first = self._load_patch(0)
+            self.images = torch.empty((len(self.paths),) + tuple(first.shape), dtype=torch.float32)
+            self.images[0] = first
+            for idx in range(1, len(self.paths)):
+                self.images[idx] = self._load_patch(idx)
+
+    def __len__(self):
+        return len(self.df)
+
+    def _load_patch(self, idx):
+        image_tensor = load_hu_patch(self.paths[idx])
+        if self.hu_stats:
+            image_tensor = (image_tensor - self.hu_stats['hu_mean']) / self.hu_stats['hu_std']
+        return image_tensor
+
+    def __getitem__(self, idx):
+        image_tensor = self.images[idx] if self.images is not None else self._load_patch(idx)
+
+        if self.transform:
+            image_tensor = self.transform(image_tensor)
+
+        return image_tensor, self.labels[idx]
+
+    def __getitems__(self, indices):
+        """Returns a whole batch `(images (B, C, H, W), labels (B,))` for `collate_batch`."""
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        if self.images is not None and not self.transform:
+            images = self.images[indices]
+        else:
+            # Per-sample path keeps the random transform parameters per patch
+            images = torch.stack([self[int(idx)][0] for idx in indices])
+        return images, self.labels[indices]
+
+class CTVolumeDataset(Dataset):
+    """
+    Dataset of cubic 3D CT patches with a bounded in-RAM cache.
+
+    Args:
+        manifest_df (pandas.DataFrame): Manifest rows (e.g. one split).
+        label_encoder (sklearn.preprocessing.LabelEncoder): Fitted histology encoder.
+        transform (callable, optional): Applied to each `(1, D, H, W)` tensor.
+        cache_budget_mb (float): Maximum RAM used to keep decoded patches.
+            Patches beyond the budget are re-read from their memory map.
+    """
+    def __init__(self, manifest_df, label_encoder, transform=None, cache_budget_mb=256):
+        self.df = manifest_df[manifest_df['patch_3d_extracted'] == True].copy()
+        self.df.reset_index(drop=True, inplace=True)
+        self.le = label_encoder
+        self.transform = transform
+
+        self.paths = [PROJECT_ROOT / p for p in self.df['patch_3d_file_path']]
+        self.labels = torch.as_tensor(self.le.transform(self.df['histology']), dtype=torch.long)
+
+        self.cache_budget_bytes = int(cache_budget_mb * 1024 * 1024)
+        self.cache_bytes = 0
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def _load_patch(self, idx):
+        if idx in self.cache:
+            return self.cache[idx]
+
+        patch = np.load(self.paths[idx], mmap_mode='r')
+        patch_tensor = torch.from_numpy(np.asarray(patch, dtype=np.float32)).unsqueeze(0)
+
+        if self.cache_bytes + patch_tensor.nbytes <= self.cache_budget_bytes:
+            self.cache[idx] = patch_tensor
+            self.cache_bytes += patch_tensor.nbytes
+        return patch_tensor
+
+    def __getitem__(self, idx):
+        image_tensor = self._load_patch(idx)
+
+        if self.transform:
+            image_tensor = self.transform(image_tensor)
+
+        return image_tensor, self.labels[idx]
+
+class WindowStoreDataset(Dataset):
+    """
+    Dataset over the precomputed multi-window uint8 channel store.
+
+    Args:
+        manifest_df (pandas.DataFrame): Manifest rows (e.g. one split).
+        label_encoder (sklearn.preprocessing.LabelEncoder): Fitted histology encoder.
+        transform (callable, optional): Applied to each `(7*K, H, W)` tensor.
+        channel_stats (dict, optional): Train-split statistics from
+            `load_or_compute_channel_stats`. If given, channels are standardized.
+        store_dir (Path): Directory of the window store.
+    """
+    def __init__(self, manifest_df, label_encoder, transform=None, channel_stats=None, store_dir=DIR_WINDOW_STORE):
+        channels, index, windows = load_window_store(store_dir)
+        if channels is None:
+            raise FileNotFoundError(f"No window store found in {store_dir}. Run 06_build_window_channels.py first.")
+
+        df = manifest_df[manifest_df['patch_extracted'] == True]
+        self.df = df.merge(index, on='subject_id', how='inner').reset_index(drop=True)
+        self.le = label_encoder
+        self.transform = transform
+        self.windows = windows
+
+        self.channels = channels
+        self.rows = self.df['store_row'].to_numpy()
+        self.labels = torch.as_tensor(self.le.transform(self.df['histology']), dtype=torch.long)
+        self.scale, self.shift = dequantization_params(channel_stats)
+
+    def __len__(self):
+        return len(self.df)
+
+    def __getitem__(self, idx):
+        patch_uint8 = torch.from_numpy(np.array(self.channels[self.rows[idx]]))
+        image_tensor = dequantize(patch_uint8, self.scale, self.shift)
+
+        if self.transform:
+            image_tensor = self.transform(image_tensor)
+
+        return image_tensor, self.labels[idx]
@@ -0,0 +1,158 @@
+"""
+Per-Patient DICOM Header Index.
+
+Several curation stages used to locate one slice by walking a patient's DICOM
+tree and reading file headers until the right SOPInstanceUID turned up. This
+module reads the headers of a patient exactly once (only the few tags the
+pipeline needs) and caches them as a small Parquet table per patient:
+
+    series_uid | sop_uid | path | rows | columns | z | instance_number
+
+The cache of a patient is rebuilt automatically when any directory of its
+DICOM tree is newer than the cached table. Joining the manifest against the
+index gives the Rows/Columns and file path of every target slice at once, so
+all per-slice checks can be vectorized across the cohort.
+"""
+
+import os
+import pandas as pd
+import pydicom
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.manifest import atomic_write
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_DICOM = PROJECT_ROOT / "data" / "raw" / "dicom"
+DIR_HEADER_INDEX = PROJECT_ROOT / "data" / "processed" / "dicom_index"
+
+INDEX_COLUMNS = ['series_uid', 'sop_uid', 'path', 'rows', 'columns', 'z', 'instance_number']
+HEADER_TAGS = ['SeriesInstanceUID', 'SOPInstanceUID', 'Rows', 'Columns',
+               'ImagePositionPatient', 'InstanceNumber']
+
+def clean_uid(uid):
+    """Removes null bytes and whitespace from a DICOM UID."""
+    if uid is None: return None
+    return str(uid).strip().replace('\x00', '')
+
+def find_patient_dir(pid, dicom_dir=DIR_DICOM):
+    """
+    Resolves the DICOM folder of a patient.
+
+    Args:
+        pid (str): The patient ID.
+        dicom_dir (Path): Root of the DICOM tree.
+
+    Returns:
+        Path or None: The patient folder (top level or inside 'NSCLC Radiogenomics').
+    """
+    for candidate in [Path(dicom_dir) / pid, Path(dicom_dir) / "NSCLC Radiogenomics" / pid]:
+        if candidate.is_dir():
+            return candidate
+    return None
+
+def get_index_path(pid, index_dir=DIR_HEADER_INDEX):
+    """Returns the path of the cached header index of a patient."""
+    return Path(index_dir) / f"{pid}.parquet"
+
+def scan_patient_headers(patient_dir):
+    """
+    Reads the index tags of every DICOM file below a patient folder.
+
+    Args:
+        patient_dir (Path): The patient folder.
+
+    Returns:
+        pandas.DataFrame: One row per readable file with the INDEX_COLUMNS.
+        Paths are stored relative to the project root.
+    """
+    records = []
+    for root_dir, dirs, files in os.walk(patient_dir):
+        for f in files:
+            if not f.endswith('.dcm'):
+                continue
+            dcm_path = Path(root_dir) / f
+            try:
+                ds = pydicom.dcmread(dcm_path, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+                records.append({
+                    'series_uid': clean_uid(ds.SeriesInstanceUID),
+                    'sop_uid': clean_uid(ds.SOPInstanceUID),
+                    'path': os.path.relpath(dcm_path, PROJECT_ROOT),
+                    'rows': int(ds.Rows) if 'Rows' in ds else None,
+                    'columns': int(ds.Columns) if 'Columns' in ds else None,
+                    'z': float(ds.ImagePositionPatient[2]) if 'ImagePositionPatient' in ds else None,
+                    'instance_number': int(ds.InstanceNumber) if 'InstanceNumber' in ds else None,
+                })
+            except Exception:
+                continue
+
+    df = pd.DataFrame(records, columns=INDEX_COLUMNS)
+    df['rows'] = df['rows'].astype('Int64')
+    df['columns'] = df['columns'].astype('Int64')
+    df['z'] = df['z'].astype('float64')
+    df['instance_number'] = df['instance_number'].astype('Int64')
+    return df
+
+def index_is_fresh(index_path, patient_dir):
+    """Returns True if no directory of the patient tree is newer than the cached index."""
+    if not index_path.exists():
+        return False
+    index_mtime = index_path.stat().st_mtime_ns
+    for root_dir, dirs, files in os.walk(patient_dir):
+        if os.stat(root_dir).st_mtime_ns > index_mtime:
+            return False
+    return True
+
+def load_patient_index(pid, dicom_dir=DIR_DICOM, index_dir=DIR_HEADER_INDEX, rebuild=False):
+    """
+    Loads the header index of a patient, scanning the DICOM tree if needed.
+
+    Args:
+        pid (str): The patient ID.
+        dicom_dir (Path): Root of the DICOM tree.
+        index_dir (Path): Directory of the cached index tables.
+        rebuild (bool): If True, the headers are re-read even if the cache is fresh.
+
+    Returns:
+        pandas.DataFrame: The INDEX_COLUMNS plus 'subject_id' (empty if the
+        patient has no DICOM folder).
+    """
+    patient_dir = find_patient_dir(pid, dicom_dir)
+    if patient_dir is None:
+        df = pd.DataFrame(columns=INDEX_COLUMNS)
+    else:
+        index_path = get_index_path(pid, index_dir)
+        if not rebuild and index_is_fresh(index_path, patient_dir):
+            df = pd.read_parquet(index_path)
+        else:
+            df = scan_patient_headers(patient_dir)
+            atomic_write(index_path, lambda tmp: df.to_parquet(tmp, index=False))
+    df.insert(0, 'subject_id', pid)
+    return df
+
+def build_header_index(pids, dicom_dir=DIR_DICOM, index_dir=DIR_HEADER_INDEX, workers=1):
+    """
+    Loads (and where needed builds) the header index of many patients.
+
+    Args:
+        pids (list of str): The patient IDs.
+        dicom_dir (Path): Root of the DICOM tree.
+        index_dir (Path): Directory of the cached index tables.
+        workers (int): Number of processes used for scanning.
+
+    Returns:
+        pandas.DataFrame: The concatenated index of all patients.
+    """
+    pids = list(dict.fromkeys(pids))
+    if workers > 1 and len(pids) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(load_patient_index, pids,
+                                   [dicom_dir] * len(pids), [index_dir] * len(pids)))
+    else:
+        frames = [load_patient_index(pid, dicom_dir, index_dir) for pid in pids]
+
+    frames = [f for f in frames if len(f) > 0]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=['subject_id'] + INDEX_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,337 @@
+"""
+Lightweight Per-Stage Performance Instrumentation.
+
+Every curation and modeling stage wraps its work in `span`s (stages via the
+`instrumented` decorator on `main()`, sub-steps via `with span(...)`). Each
+finished span records:
+
+- wall time and CPU time (own process, plus reaped worker processes where
+  the Unix `resource` module exists; None on Windows),
+- files opened (counted by a `sys.addaudithook` 'open' hook),
+- bytes read (`rchar`/`read_bytes` from /proc/self/io, Linux only),
+- memory: the peak RSS within the span (`peak_rss_mb`, Linux only: the
+  VmHWM high-water mark of /proc/self/status is reset when a span starts),
+  the RSS at its end (`rss_mb`) and the lifetime peak of the process
+  (`process_peak_rss_mb`, which later spans of a long run inherit),
+- an optional item count (patients, slices, batches, ...).
+
+Records are appended as JSON lines to 'data/processed/run_logs/<run_id>.jsonl'.
+All stages launched with the same `NSCLC_RUN_ID` environment variable (e.g. a
+full rebuild) share one log. A log converts to the Chrome trace format
+(chrome://tracing, Perfetto) with:
+
+    python src/utils/instrumentation.py data/processed/run_logs/<run_id>.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import threading
+from pathlib import Path
+from datetime import datetime
+
+try:
+    import resource  # Unix only: child CPU time and the lifetime peak RSS
+except ImportError:
+    resource = None
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_RUN_LOGS = PROJECT_ROOT / "data" / "processed" / "run_logs"
+ENV_RUN_ID = "NSCLC_RUN_ID"
+FILE_PROC_IO = Path("/proc/self/io")
+FILE_PROC_STATUS = Path("/proc/self/status")
+FILE_PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+_state = threading.local()
+_files_opened = [0]
+_hook_installed = [False]
+_counting = [True]  # Paused while the instrumentation itself touches files
+_process_peak_mb = [0.0]  # Lifetime peak kept across VmHWM resets (which also reset ru_maxrss)
+
+def _audit_hook(event, args):
+    """Counts every file open of the process."""
+    if event == 'open' and _counting[0]:
+        _files_opened[0] += 1
+
+def get_run_id():
+    """Returns the run ID shared by all stages of one run (set on first use)."""
+    if ENV_RUN_ID not in os.environ:
+        os.environ[ENV_RUN_ID] = f"{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}"
+    return os.environ[ENV_RUN_ID]
+
+def get_log_path():
+    """Returns the JSON-lines log of the current run."""
+    return DIR_RUN_LOGS / f"{get_run_id()}.jsonl"
+
+def read_io_counters():
+    """
+    Reads the I/O counters of the process.
+
+    Returns:
+        tuple: (bytes read by syscalls, bytes read from storage), or (None, None)
+        where /proc/self/io is not available.
+    """
+    _counting[0] = False
+    try:
+        counters = dict(line.split(': ') for line in FILE_PROC_IO.read_text().splitlines())
+        return int(counters['rchar']), int(counters['read_bytes'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+    finally:
+        _counting[0] = True
+
+def read_memory_mb():
+    """
+    Reads the current and the peak resident set size of the process.
+
+    Returns:
+        tuple: (VmRSS, VmHWM) in MB, or (None, None) where /proc/self/status
+        is not available. VmHWM is the peak since the last `reset_peak_rss`.
+    """
+    _counting[0] = False
+    try:
+        fields = dict(line.split(':', 1) for line in FILE_PROC_STATUS.read_text().splitlines() if ':' in line)
+        return int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+    finally:
+        _counting[0] = True
+
+def reset_peak_rss():
+    """Resets the peak RSS (VmHWM) of the process to its current RSS; returns False where unsupported."""
+    _counting[0] = False
+    try:
+        FILE_PROC_CLEAR_REFS.write_text('5')
+        return True
+    except OSError:
+        return False
+    finally:
+        _counting[0] = True
+
+def process_peak_rss_mb():
+    """Returns the lifetime peak resident set size of the process in MB (None where unavailable)."""
+    if resource is None:
+        return _process_peak_mb[0] or None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    peak = peak / (1024 ** 2) if sys.platform == 'darwin' else peak / 1024
+    return max(peak, _process_peak_mb[0])
+
+def snapshot():
+    """Returns the current values of all counters."""
+    rchar, read_bytes = read_io_counters()
+    return {
+        'wall': time.perf_counter(),
+        'cpu': time.process_time(),
+        'child_cpu': sum(resource.getrusage(resource.RUSAGE_CHILDREN)[:2]) if resource is not None else None,
+        'files': _files_opened[0],
+        'rchar': rchar,
+        'read_bytes': read_bytes,
+    }
+
+class span:
+    """
+    Context manager that measures one stage or sub-step.
+
+    Usage:
+        with span("extract_patches") as s:
+            for patient in patients:
+                ...
+                s.add_items(1)
+
+    Args:
+        name (str): The name shown in the log and the trace.
+        items (int): Initial item count.
+        report (bool): If True, a one-line summary is printed when the span ends.
+        **attrs: Extra JSON-serializable fields stored with the record.
+    """
+    def __init__(self, name, items=0, report=False, **attrs):
+        self.name = name
+        self.items = items
+        self.report = report
+        self.attrs = attrs
+        self.record = None
+        self.peak_mb = None
+
+    def add_items(self, n=1):
+        """Adds to the number of processed items."""
+        self.items += n
+
+    def __enter__(self):
+        if not _hook_installed[0]:
+            sys.addaudithook(_audit_hook)
+            _hook_installed[0] = True
+        stack = getattr(_state, 'stack', None)
+        if stack is None:
+            stack = _state.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        # The reset below clears the high-water mark: keep the peak so far for the
+        # enclosing span and the process
+        hwm_mb = read_memory_mb()[1]
+        if stack:
+            stack[-1].peak_mb = max_or_none(stack[-1].peak_mb, hwm_mb)
+        _process_peak_mb[0] = max_or_none(_process_peak_mb[0], hwm_mb)
+        self.peak_tracked = reset_peak_rss()
+        stack.append(self)
+        self.ts_us = time.time_ns() // 1000
+        self.start = snapshot()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = snapshot()
+        _state.stack.pop()
+        rss_mb, hwm_mb = read_memory_mb()
+        peak_mb = max_or_none(self.peak_mb, hwm_mb) if self.peak_tracked else None
+        _process_peak_mb[0] = max_or_none(_process_peak_mb[0], hwm_mb)
+        process_peak = process_peak_rss_mb()
+
+        def delta(key):
+            if self.start[key] is None or end[key] is None:
+                return None
+            return end[key] - self.start[key]
+
+        self.record = {
+            'run_id': get_run_id(),
+            'name': self.name,
+            'parent': self.parent,
+            'depth': self.depth,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'ts_us': self.ts_us,
+            'wall_s': round(delta('wall'), 6),
+            'cpu_s': round(delta('cpu'), 6),
+            'child_cpu_s': round(delta('child_cpu'), 6) if resource is not None else None,
+            'files_opened': delta('files'),
+            'bytes_read': delta('rchar'),
+            'disk_bytes_read': delta('read_bytes'),
+            'peak_rss_mb': round(peak_mb, 1) if peak_mb is not None else None,
+            'rss_mb': round(rss_mb, 1) if rss_mb is not None else None,
+            'process_peak_rss_mb': round(process_peak, 1) if process_peak is not None else None,
+            'items': self.items,
+            'status': 'error' if exc_type is not None else 'ok',
+        }
+        if self.attrs:
+            self.record['attrs'] = self.attrs
+        write_record(self.record)
+
+        if self.report:
+            print(format_record(self.record))
+        return False
+
+def max_or_none(a, b):
+    """Returns the larger of two optional values."""
+    if a is None or b is None:
+        return b if a is None else a
+    return max(a, b)
+
+def count_items(n=1):
+    """Adds to the item count of the innermost open span (no-op outside spans)."""
+    stack = getattr(_state, 'stack', None)
+    if stack:
+        stack[-1].add_items(n)
+
+def instrumented(name):
+    """
+    Decorator that runs a stage's `main()` inside a top-level span.
+
+    Args:
+        name (str): The stage name.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, report=True):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write_record(record):
+    """Appends one record to the JSON-lines log of the run."""
+    log_path = get_log_path()
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    _counting[0] = False
+    try:
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+    finally:
+        _counting[0] = True
+
+def format_record(record):
+    """Formats a record as a one-line summary."""
+    cpu = record['cpu_s'] + (record['child_cpu_s'] or 0.0)
+    parts = [f"{record['wall_s']:.2f}s wall", f"{cpu:.2f}s CPU", f"{record['files_opened']} files"]
+    if record['bytes_read'] is not None:
+        parts.append(f"{record['bytes_read'] / 1024 ** 2:.1f} MB read")
+    if record.get('peak_rss_mb') is not None:
+        parts.append(f"peak RSS {record['peak_rss_mb']:.0f} MB")
+    elif record.get('process_peak_rss_mb') is not None:
+        parts.append(f"process peak RSS {record['process_peak_rss_mb']:.0f} MB")
+    if record['items']:
+        parts.append(f"{record['items']} items")
+    return f"[perf] {record['name']}: " + ", ".join(parts)
+
+def read_run_log(log_path):
+    """Reads all records of a JSON-lines run log."""
+    with open(log_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def export_chrome_trace(log_path, trace_path=None):
+    """
+    Converts a run log into the Chrome trace event format.
+
+    Every span becomes a complete ('X') event; all measured counters are
+    shown as its arguments.
+
+    Args:
+        log_path (Path): The JSON-lines run log.
+        trace_path (Path, optional): Output file (default: '<log>.trace.json').
+
+    Returns:
+        Path: The written trace file.
+    """
+    log_path = Path(log_path)
+    trace_path = Path(trace_path) if trace_path else log_path.with_suffix('.trace.json')
+
+    events = []
+    for record in read_run_log(log_path):
+        args = {k: v for k, v in record.items()
+                if k not in ('name', 'pid', 'tid', 'ts_us', 'wall_s', 'run_id')}
+        events.append({
+            'name': record['name'],
+            'cat': record['parent'] or 'stage',
+            'ph': 'X',
+            'ts': record['ts_us'],
+            'dur': int(record['wall_s'] * 1e6),
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': args,
+        })
+    with open(trace_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return trace_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a run log as a Chrome trace")
+    parser.add_argument('log', type=str, nargs='?', default=None,
+                        help="Run log (.jsonl); default: the most recent one")
+    parser.add_argument('--out', type=str, default=None)
+    args = parser.parse_args()
+
+    log_path = args.log
+    if log_path is None:
+        logs = sorted(DIR_RUN_LOGS.glob("*.jsonl"), key=lambda p: p.stat().st_mtime)
+        if not logs:
+            print(f"ERROR: No run logs found in {DIR_RUN_LOGS}.")
+            return
+        log_path = logs[-1]
+
+    trace_path = export_chrome_trace(log_path, args.out)
+    print(f"Trace written: {trace_path}")
+
+if __name__ == "__main__":
+    main()
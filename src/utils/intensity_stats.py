@@ -0,0 +1,142 @@
+"""
+Streaming Hounsfield Unit Histograms and Intensity Statistics.
+
+Instead of flattening a volume and binning it through matplotlib, every cached
+HU volume is streamed in slabs of a few slices. Each slab is clipped to the
+histogram range, offset to non-negative integers and counted with
+`np.bincount`, so the histogram is exact and the extra memory is one slab.
+
+Per-series histograms can be summed to obtain the cohort histogram, from
+which the normalization constants for training (mean, std, percentiles) are
+derived.
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+FILE_INTENSITY_STATS = PROJECT_ROOT / "data" / "processed" / "hu_intensity_stats.parquet"
+
+# Integer HU bins; values outside are counted in the edge bins
+HIST_MIN_HU = -1024
+HIST_MAX_HU = 3071
+N_BINS = HIST_MAX_HU - HIST_MIN_HU + 1
+CHUNK_SLICES = 16
+
+COHORT_ROW = '__cohort__'
+
+def volume_histogram(volume, chunk_slices=CHUNK_SLICES):
+    """
+    Computes the integer HU histogram and exact moments of a volume.
+
+    Args:
+        volume (numpy.ndarray): The (Z, Y, X) int16 HU volume (may be a memory map).
+        chunk_slices (int): Number of slices streamed per step.
+
+    Returns:
+        dict: 'histogram' (int64 array of N_BINS counts), 'n_voxels', 'hu_min',
+        'hu_max', 'hu_sum' and 'hu_sum_sq' (exact, from the raw values).
+    """
+    histogram = np.zeros(N_BINS, dtype=np.int64)
+    hu_min, hu_max = np.iinfo(np.int16).max, np.iinfo(np.int16).min
+    hu_sum, hu_sum_sq = 0, 0
+
+    for start in range(0, volume.shape[0], chunk_slices):
+        slab = np.asarray(volume[start:start + chunk_slices])
+        hu_min = min(hu_min, int(slab.min()))
+        hu_max = max(hu_max, int(slab.max()))
+        hu_sum += int(slab.sum(dtype=np.int64))
+        hu_sum_sq += float(np.square(slab, dtype=np.float64).sum())
+
+        offset = np.clip(slab, HIST_MIN_HU, HIST_MAX_HU).astype(np.int16) - np.int16(HIST_MIN_HU)
+        histogram += np.bincount(offset.ravel(), minlength=N_BINS)
+
+    return {
+        'histogram': histogram,
+        'n_voxels': int(volume.size),
+        'hu_min': hu_min,
+        'hu_max': hu_max,
+        'hu_sum': float(hu_sum),
+        'hu_sum_sq': hu_sum_sq,
+    }
+
+def histogram_percentile(histogram, q):
+    """
+    Reads a percentile off an integer HU histogram.
+
+    Args:
+        histogram (numpy.ndarray): Counts per HU bin.
+        q (float): Percentile in [0, 100].
+
+    Returns:
+        int: The HU value at the percentile.
+    """
+    cumulative = np.cumsum(histogram)
+    target = q / 100.0 * cumulative[-1]
+    return int(np.searchsorted(cumulative, target, side='left') + HIST_MIN_HU)
+
+def summarize(partial):
+    """
+    Turns a (merged) partial result into one row of the statistics table.
+
+    Args:
+        partial (dict): Output of `volume_histogram` (or a sum of several).
+
+    Returns:
+        dict: Table row with moments, percentiles and the histogram.
+    """
+    n = max(partial['n_voxels'], 1)
+    mean = partial['hu_sum'] / n
+    std = float(np.sqrt(max(partial['hu_sum_sq'] / n - mean ** 2, 0.0)))
+    return {
+        'n_voxels': partial['n_voxels'],
+        'hu_min': partial['hu_min'],
+        'hu_max': partial['hu_max'],
+        'hu_mean': mean,
+        'hu_std': std,
+        'hu_p005': histogram_percentile(partial['histogram'], 0.5),
+        'hu_p995': histogram_percentile(partial['histogram'], 99.5),
+        'histogram': partial['histogram'].tolist(),
+    }
+
+def merge_partials(partials):
+    """
+    Merges per-series partial results into one cohort-wide result.
+
+    Args:
+        partials (list of dict): Outputs of `volume_histogram`.
+
+    Returns:
+        dict: The summed histogram and moments, with global min/max.
+    """
+    return {
+        'histogram': np.sum([p['histogram'] for p in partials], axis=0),
+        'n_voxels': sum(p['n_voxels'] for p in partials),
+        'hu_min': min(p['hu_min'] for p in partials),
+        'hu_max': max(p['hu_max'] for p in partials),
+        'hu_sum': sum(p['hu_sum'] for p in partials),
+        'hu_sum_sq': sum(p['hu_sum_sq'] for p in partials),
+    }
+
+def load_normalization_constants(stats_path=FILE_INTENSITY_STATS):
+    """
+    Reads the cohort-wide normalization constants for training.
+
+    Args:
+        stats_path (Path): The Parquet table written by 07_cohort_intensity_stats.py.
+
+    Returns:
+        dict or None: 'hu_mean', 'hu_std', 'hu_p005' and 'hu_p995' of the
+        cohort, or None if the statistics have not been computed yet.
+    """
+    if not Path(stats_path).exists():
+        return None
+
+    columns = ['series_uid', 'hu_mean', 'hu_std', 'hu_p005', 'hu_p995']
+    df = pd.read_parquet(stats_path, columns=columns)
+    cohort = df[df['series_uid'] == COHORT_ROW]
+    if len(cohort) == 0:
+        return None
+    return cohort.iloc[0][columns[1:]].to_dict()
@@ -0,0 +1,208 @@
+"""
+Shared DataLoader Factory for the Modeling Scripts.
+
+`make_loader` builds every DataLoader of 03_modeling with the same knobs:
+`num_workers`, `persistent_workers` and `prefetch_factor`, so decoding and
+batch gathering overlap with the model step instead of running back-to-back
+on one core.
+
+Reproducibility contract (compatible with `set_seed(42)`):
+
+- The shuffle order comes from a dedicated sampler generator and the worker
+  base seeds from a second one, both seeded once when the loader is built
+  (from `seed`, or drawn from the global torch RNG as seeded by `set_seed`).
+  Iterating never touches the global RNG, whatever the number of workers
+  and whether they persist across epochs. Each worker seeds
+  `random`/`numpy` from its torch seed (`seed_worker`).
+- Random augmentation is applied in the main process, batch by batch
+  (`batch_transform=`, e.g. `utils.augment.BatchAugment`, or a per-sample
+  `transform=` in sample order), never inside the workers. Worker scheduling
+  therefore cannot change which random parameters a sample receives, and the
+  batches are bit-identical to the single-process order.
+- `get_loader_rng_state`/`set_loader_rng_state` save and restore both
+  generators, so a run resumed from a checkpoint continues the same order.
+
+Datasets holding their split as one in-RAM tensor (`CTPatchDataset` with
+`in_memory=True`) are moved to shared memory before the workers start, so
+the workers read the same pages instead of receiving copies.
+
+Self-test (batches with N workers vs. single process, train split):
+
+    python src/utils/loaders.py --workers 4
+"""
+
+import os
+import sys
+import random
+import argparse
+import functools
+import numpy as np
+import torch
+from pathlib import Path
+from torch.utils.data import DataLoader, RandomSampler
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DEFAULT_NUM_WORKERS = min(4, max(0, (os.cpu_count() or 1) - 1))
+DEFAULT_PREFETCH_FACTOR = 2
+
+def seed_worker(worker_id):
+    """Seeds `random` and `numpy` of a loader worker from its torch seed (base seed + worker id)."""
+    worker_seed = torch.initial_seed() % 2 ** 32
+    np.random.seed(worker_seed)
+    random.seed(worker_seed)
+
+def share_dataset_memory(dataset):
+    """Moves the in-RAM tensors of a dataset (if any) to shared memory; returns True if it did."""
+    shared = False
+    for name in ('images', 'labels'):
+        tensor = getattr(dataset, name, None)
+        if isinstance(tensor, torch.Tensor):
+            tensor.share_memory_()
+            shared = True
+    return shared
+
+def apply_per_sample(transform, images):
+    """Applies a per-sample transform to every image of a batch, in sample order."""
+    return torch.stack([transform(image) for image in images])
+
+class TransformingLoader:
+    """
+    Iterates a DataLoader and augments each batch in the main process.
+
+    Args:
+        loader (torch.utils.data.DataLoader): Loader yielding (images, labels).
+        batch_transform (callable): Applied to each (B, C, H, W) image batch.
+    """
+    def __init__(self, loader, batch_transform):
+        self.loader = loader
+        self.batch_transform = batch_transform
+        self.dataset = loader.dataset
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for images, labels in self.loader:
+            yield self.batch_transform(images), labels
+
+def make_loader(dataset, batch_size, shuffle=False, transform=None, batch_transform=None, num_workers=0,
+                persistent_workers=True, prefetch_factor=DEFAULT_PREFETCH_FACTOR, seed=None, pin_memory=None):
+    """
+    Builds a DataLoader with worker, prefetch and seeding settings of the pipeline.
+
+    Args:
+        dataset (torch.utils.data.Dataset): The dataset (its `collate_fn` attribute is used if present).
+        batch_size (int): Samples per batch.
+        shuffle (bool): Reshuffle every epoch.
+        transform (callable, optional): Augmentation applied per sample in the main process.
+        batch_transform (callable, optional): Augmentation applied to whole batches in the main process.
+        num_workers (int): Loader worker processes (0 = load in the main process).
+        persistent_workers (bool): Keep the workers alive between epochs.
+        prefetch_factor (int): Batches loaded in advance by each worker.
+        seed (int, optional): Seed of the sampler and worker generators. None
+            draws it once from the global RNG (as seeded by `set_seed`).
+        pin_memory (bool, optional): Pin batches for GPU transfer (default: if CUDA is available).
+
+    Returns:
+        DataLoader or TransformingLoader: Iterable of (images, labels) batches.
+    """
+    if num_workers > 0:
+        share_dataset_memory(dataset)
+    if seed is None:
+        seed = int(torch.randint(0, 2 ** 62, ()).item())
+    sampler = RandomSampler(dataset, generator=torch.Generator().manual_seed(seed)) if shuffle else None
+
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        sampler=sampler,
+        num_workers=num_workers,
+        collate_fn=getattr(dataset, 'collate_fn', None),
+        pin_memory=torch.cuda.is_available() if pin_memory is None else pin_memory,
+        worker_init_fn=seed_worker,
+        generator=torch.Generator().manual_seed(seed + 1),
+        persistent_workers=persistent_workers and num_workers > 0,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+    )
+    if transform is not None:
+        batch_transform = functools.partial(apply_per_sample, transform)
+    if batch_transform is not None:
+        return TransformingLoader(loader, batch_transform)
+    return loader
+
+def get_loader_rng_state(loader):
+    """
+    Returns the generator states of a `make_loader` loader (to resume training mid-run).
+
+    Returns:
+        dict: 'sampler' (shuffle order, None if not shuffled) and 'loader' (worker base seeds).
+    """
+    loader = getattr(loader, 'loader', loader)
+    sampler_generator = getattr(loader.sampler, 'generator', None)
+    return {'sampler': sampler_generator.get_state() if sampler_generator is not None else None,
+            'loader': loader.generator.get_state()}
+
+def set_loader_rng_state(loader, state):
+    """Restores the generator states from `get_loader_rng_state`; the next epoch continues the saved order."""
+    loader = getattr(loader, 'loader', loader)
+    if state['sampler'] is not None:
+        loader.sampler.generator.set_state(state['sampler'])
+    loader.generator.set_state(state['loader'])
+
+def loader_batches(dataset, batch_size, batch_transform=None, num_workers=0, epochs=2, seed=42):
+    """
+    Collects the batches of a few shuffled epochs after seeding the global RNG with `seed`.
+
+    Returns:
+        list: (images, labels) tensors of every batch, in iteration order.
+    """
+    torch.manual_seed(seed)
+    loader = make_loader(dataset, batch_size, shuffle=True, batch_transform=batch_transform,
+                         num_workers=num_workers, pin_memory=False)
+    return [(images.clone(), labels.clone()) for _ in range(epochs) for images, labels in loader]
+
+def check_bit_identical(dataset, batch_size, batch_transform=None, num_workers=2, epochs=2, seed=42):
+    """
+    Verifies that a multi-worker loader yields exactly the single-process batches.
+
+    Returns:
+        bool: True if all batches of all epochs are bit-identical.
+    """
+    reference = loader_batches(dataset, batch_size, batch_transform, 0, epochs, seed)
+    candidate = loader_batches(dataset, batch_size, batch_transform, num_workers, epochs, seed)
+    return len(reference) == len(candidate) and all(
+        torch.equal(ri, ci) and torch.equal(rl, cl) for (ri, rl), (ci, cl) in zip(reference, candidate))
+
+def main():
+    """Runs the bit-identity self-test on the train split of the manifest."""
+    parser = argparse.ArgumentParser(description="Self-test: multi-worker batches vs. single-process order")
+    parser.add_argument('--workers', type=int, default=max(DEFAULT_NUM_WORKERS, 2))
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--stream_patches', action='store_true', help="Test the disk-streaming dataset mode")
+    args = parser.parse_args()
+
+    sys.path.append(str(PROJECT_ROOT / "src"))
+    from sklearn.preprocessing import LabelEncoder
+    from utils.manifest import read_manifest
+    from utils.datasets import CTPatchDataset
+    from utils.augment import BatchAugment
+
+    df = read_manifest()
+    df = df[df['histology'].isin(['Adenocarcinoma', 'Squamous cell carcinoma'])]
+    le = LabelEncoder().fit(df['histology'])
+    dataset = CTPatchDataset(df[df['dataset_split'] == 'Train'], le, in_memory=not args.stream_patches)
+    if len(dataset) == 0:
+        print("ERROR: No extracted Train patches found.")
+        sys.exit(1)
+
+    augment = BatchAugment()
+    print(f"Comparing {args.epochs} shuffled epochs of {len(dataset)} patches: 0 vs. {args.workers} workers...")
+
+    identical = check_bit_identical(dataset, args.batch_size, augment, args.workers, args.epochs)
+    print("PASS: batches are bit-identical." if identical else "FAIL: batches differ.")
+    sys.exit(0 if identical else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Typed Columnar Manifest Storage.
+
+The manifest used to live in 'manifest.csv' (`sep=';', decimal=','`) and was
+re-parsed by every script, so booleans such as `patch_extracted` or
+`coordinate_mapped_successfully` came back as strings or objects depending on
+their content. The manifest is now stored as a Parquet file with an explicit
+schema:
+
+- every write coerces the known columns to their declared dtypes,
+- writes are atomic (temporary file + fsync + rename), so a crash mid-write
+  can never leave a corrupt manifest behind,
+- 'manifest.csv' is still written next to it, but only as a human-readable
+  export; no script reads it anymore.
+
+Reading is a columnar Parquet read (optionally of only a few columns), which
+is near-free compared to parsing the CSV.
+"""
+
+import os
+import pandas as pd
+from pathlib import Path
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+FILE_MANIFEST = PROJECT_ROOT / "data" / "processed" / "manifest.parquet"
+FILE_MANIFEST_CSV = PROJECT_ROOT / "data" / "processed" / "manifest.csv"
+
+# Explicit schema of all known manifest columns. Flags are plain bool (NA ->
+# False) so that filters like `df['patch_extracted'] == True` keep working.
+MANIFEST_SCHEMA = {
+    'subject_id': 'string',
+    'histology': 'string',
+    'xml_present': 'bool',
+    'chosen_series_uid': 'string',
+    'selection_reason': 'string',
+    'slice_thickness': 'float64',
+    'spacing_between_slices': 'float64',
+    'pixel_spacing_x': 'float64',
+    'pixel_spacing_y': 'float64',
+    'reconstruction_kernel': 'string',
+    'series_description': 'string',
+    'slice_count': 'Int64',
+    'qc_pass': 'bool',
+    'sop_instance_uid': 'string',
+    'x_raw': 'float64',
+    'y_raw': 'float64',
+    'x_pixel': 'Int64',
+    'y_pixel': 'Int64',
+    'coordinate_mapped_successfully': 'bool',
+    'patch_size_xy': 'Int64',
+    'patch_slices_z': 'Int64',
+    'patch_extracted': 'bool',
+    'patch_file_path': 'string',
+    'patch_3d_size': 'Int64',
+    'patch_3d_spacing_mm': 'float64',
+    'patch_3d_extracted': 'bool',
+    'patch_3d_file_path': 'string',
+    'dataset_split': 'string',
+}
+
+BOOL_STRINGS = {'true': True, 'false': False}
+
+def parse_bool(value, column=None):
+    """
+    Parses one flag value of a manifest column ('True'/'False' strings from the CSV era).
+
+    Raises:
+        ValueError: For strings other than 'true'/'false' (case-insensitive),
+            which would otherwise all become True.
+    """
+    if not isinstance(value, str):
+        return value
+    text = value.strip().lower()
+    if text == '':
+        return pd.NA
+    if text not in BOOL_STRINGS:
+        raise ValueError(f"Manifest column '{column}' has a non-boolean value: {value!r}")
+    return BOOL_STRINGS[text]
+
+def coerce_manifest(df):
+    """
+    Casts all known manifest columns to their schema dtypes.
+
+    Unknown columns are kept with their inferred dtype. Flag columns accept
+    bools, NA (-> False) and the strings 'True'/'False'.
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+
+    Returns:
+        pandas.DataFrame: A typed copy of the manifest.
+    """
+    df = df.copy()
+    for column, dtype in MANIFEST_SCHEMA.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'bool':
+            values = df[column]
+            if pd.api.types.is_string_dtype(values) or values.dtype == object:
+                values = values.map(lambda v: parse_bool(v, column), na_action='ignore')
+            df[column] = values.fillna(False).astype(bool)
+        elif dtype == 'string':
+            df[column] = df[column].astype('string')
+        else:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+    return df
+
+def atomic_write(path, write_fn):
+    """
+    Writes a file atomically via a temporary file and `os.replace`.
+
+    Args:
+        path (Path): The final file path.
+        write_fn (callable): Called with the temporary path; must write the file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    write_fn(tmp_path)
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def write_manifest(df, path=FILE_MANIFEST, export_csv=True):
+    """
+    Writes the typed manifest atomically (and optionally the CSV export).
+
+    Args:
+        df (pandas.DataFrame): The manifest.
+        path (Path): Target Parquet file.
+        export_csv (bool): If True, also writes 'manifest.csv' for humans.
+
+    Returns:
+        pandas.DataFrame: The typed manifest that was written.
+    """
+    df = coerce_manifest(df)
+    atomic_write(path, lambda tmp: df.to_parquet(tmp, index=False))
+    if export_csv:
+        atomic_write(FILE_MANIFEST_CSV, lambda tmp: df.to_csv(tmp, index=False, sep=';', decimal=','))
+    return df
+
+def read_manifest(path=FILE_MANIFEST, columns=None):
+    """
+    Reads the typed manifest.
+
+    If only the legacy 'manifest.csv' exists, it is parsed once and coerced to
+    the schema, so old processed folders keep working.
+
+    Args:
+        path (Path): The Parquet file.
+        columns (list of str, optional): Read only these columns.
+
+    Returns:
+        pandas.DataFrame: The typed manifest.
+    """
+    path = Path(path)
+    if path.exists():
+        return pd.read_parquet(path, columns=columns)
+
+    df = coerce_manifest(pd.read_csv(FILE_MANIFEST_CSV, sep=';', decimal=','))
+    return df[columns] if columns else df
+
+def manifest_exists(path=FILE_MANIFEST):
+    """Returns True if a manifest (Parquet or legacy CSV) is available."""
+    return Path(path).exists() or FILE_MANIFEST_CSV.exists()
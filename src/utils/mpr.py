@@ -0,0 +1,123 @@
+"""
+Multi-Planar Reconstruction (MPR) and Slab MIP from the Volume Cache.
+
+The HU volume cache (see `utils.volume_cache`) stores every series as a
+(Z, Y, X) int16 array sorted head to toe. Axial, coronal and sagittal planes
+are then plain basic-indexing views of the memory map (`volume[z]`,
+`volume[:, y]`, `volume[:, :, x]`): no copy is made, and only the pages of
+the requested crop are ever read. A slab maximum-intensity projection (MIP)
+reduces a thin box of such a view, so it touches the slab and nothing else.
+
+All positions are given in full-series coordinates (manifest x_pixel/y_pixel
+and the SOPInstanceUID of the annotated slice); the cache `offset` of body
+cropped volumes is subtracted here.
+"""
+
+import numpy as np
+
+# --- CONFIGURATION ---
+PLANES = ('axial', 'coronal', 'sagittal')
+PLANE_AXIS = {'axial': 0, 'coronal': 1, 'sagittal': 2}
+
+def lesion_center(meta, sop_uid, x_pixel, y_pixel):
+    """
+    Converts an annotated lesion position into stored-volume voxel indices.
+
+    Args:
+        meta (dict): Metadata of the cached series.
+        sop_uid (str): The SOPInstanceUID of the annotated slice.
+        x_pixel (int): Column of the lesion in the full slice.
+        y_pixel (int): Row of the lesion in the full slice.
+
+    Returns:
+        tuple: (z, y, x) indices into the stored (possibly cropped) volume,
+        clipped to its bounds.
+    """
+    full = (meta['sop_uids'].index(sop_uid), int(y_pixel), int(x_pixel))
+    return tuple(int(np.clip(c - o, 0, s - 1)) for c, o, s in zip(full, meta['offset'], meta['shape']))
+
+def crop_bounds(center, half_extent, shape):
+    """Returns (start, stop) per axis of a box around `center`, clipped to the volume."""
+    return [(max(c - h, 0), min(c + h + 1, s)) for c, h, s in zip(center, half_extent, shape)]
+
+def half_extent_voxels(meta, half_size_mm):
+    """Converts a half box size in mm into voxels per axis (Z, Y, X)."""
+    spacing = (meta['slice_spacing'], meta['pixel_spacing'][0], meta['pixel_spacing'][1])
+    return tuple(max(1, int(round(half_size_mm / s))) for s in spacing)
+
+def plane_view(volume, plane, center, bounds):
+    """
+    Returns the cropped plane through `center` as a view of the volume.
+
+    Args:
+        volume (numpy.ndarray): The (Z, Y, X) volume (memory map).
+        plane (str): 'axial', 'coronal' or 'sagittal'.
+        center (tuple): (z, y, x) voxel indices of the plane position.
+        bounds (list): (start, stop) per axis from `crop_bounds`.
+
+    Returns:
+        numpy.ndarray: 2D view; rows are Y (axial) or Z (coronal, sagittal).
+    """
+    index = [slice(a, b) for a, b in bounds]
+    index[PLANE_AXIS[plane]] = center[PLANE_AXIS[plane]]
+    return volume[tuple(index)]
+
+def slab_mip(volume, plane, center, bounds, half_slab):
+    """
+    Computes the maximum-intensity projection of a thin slab around a plane.
+
+    Args:
+        volume (numpy.ndarray): The (Z, Y, X) volume (memory map).
+        plane (str): 'axial', 'coronal' or 'sagittal'.
+        center (tuple): (z, y, x) voxel indices of the slab center.
+        bounds (list): (start, stop) per axis from `crop_bounds`.
+        half_slab (int): Half slab thickness in voxels along the plane normal.
+
+    Returns:
+        numpy.ndarray: The 2D MIP (int16), same layout as `plane_view`.
+    """
+    axis = PLANE_AXIS[plane]
+    index = [slice(a, b) for a, b in bounds]
+    c = center[axis]
+    index[axis] = slice(max(c - half_slab, 0), min(c + half_slab + 1, volume.shape[axis]))
+    return volume[tuple(index)].max(axis=axis)
+
+def plane_aspect(meta, plane):
+    """Returns the display aspect (row spacing / column spacing) of a plane."""
+    row_spacing, col_spacing = meta['pixel_spacing']
+    if plane == 'axial':
+        return row_spacing / col_spacing
+    return meta['slice_spacing'] / (col_spacing if plane == 'coronal' else row_spacing)
+
+def lesion_mpr(volume, meta, sop_uid, x_pixel, y_pixel, half_size_mm=40.0, slab_mm=10.0):
+    """
+    Builds the axial/coronal/sagittal planes and slab MIPs around a lesion.
+
+    Args:
+        volume (numpy.ndarray): The cached (Z, Y, X) HU volume (memory map).
+        meta (dict): Metadata of the cached series.
+        sop_uid (str): The SOPInstanceUID of the annotated slice.
+        x_pixel (int): Column of the lesion in the full slice.
+        y_pixel (int): Row of the lesion in the full slice.
+        half_size_mm (float): Half size of the square field of view in mm.
+        slab_mm (float): Total MIP slab thickness in mm.
+
+    Returns:
+        dict: Per plane a dict with 'view' (2D view), 'mip' (2D array),
+        'aspect' and 'marker' (row, column of the lesion inside the crop).
+    """
+    center = lesion_center(meta, sop_uid, x_pixel, y_pixel)
+    bounds = crop_bounds(center, half_extent_voxels(meta, half_size_mm), volume.shape)
+    half_slab = half_extent_voxels(meta, slab_mm / 2)
+
+    result = {}
+    for plane in PLANES:
+        axis = PLANE_AXIS[plane]
+        in_plane = [a for a in range(3) if a != axis]
+        result[plane] = {
+            'view': plane_view(volume, plane, center, bounds),
+            'mip': slab_mip(volume, plane, center, bounds, half_slab[axis]),
+            'aspect': plane_aspect(meta, plane),
+            'marker': tuple(center[a] - bounds[a][0] for a in in_plane),
+        }
+    return result
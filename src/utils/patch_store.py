@@ -0,0 +1,231 @@
+"""
+Multi-Window uint8 Patch Store.
+
+The CNN used to receive raw HU floats, although the exploration scripts show
+that the lung (L-600/W1500) and mediastinal (L50/W350) windows carry
+different information. This module precomputes a configurable set of windows
+for every 2.5D patch and stores them as uint8 channels (1 byte/voxel) in one
+contiguous memory-mapped array:
+
+    data/processed/window_store/
+    ├── channels_uint8.npy   # (N, K*7, 128, 128), window-major channel order
+    ├── index.csv            # subject_id -> row in channels_uint8.npy
+    ├── windows.json         # the K (name, center, width) windows
+    └── channel_stats.json   # per-channel train mean/std (Welford, cached)
+
+Training then only has to dequantize (uint8 -> float32); the windowing itself
+is no longer part of the training loop. The per-channel normalization is
+folded into the dequantization as one scale/shift (see `dequantize`).
+"""
+
+import os
+import json
+import hashlib
+import torch
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from utils.windowing import render_windows
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_WINDOW_STORE = PROJECT_ROOT / "data" / "processed" / "window_store"
+
+FILE_CHANNELS = "channels_uint8.npy"
+FILE_INDEX = "index.csv"
+FILE_WINDOWS = "windows.json"
+FILE_CHANNEL_STATS = "channel_stats.json"
+
+def patch_to_int16(patch):
+    """
+    Rounds a stored HU patch (float64 for 2.5D patches) to int16.
+
+    Args:
+        patch (numpy.ndarray): The HU patch.
+
+    Returns:
+        numpy.ndarray: The patch as int16, clipped to the int16 range.
+    """
+    if patch.dtype == np.int16:
+        return patch
+    return np.clip(np.rint(patch), -32768, 32767).astype(np.int16)
+
+def build_window_store(manifest_df, windows, store_dir=DIR_WINDOW_STORE):
+    """
+    Windows every extracted 2.5D patch and writes the uint8 channel store.
+
+    Patches are processed one at a time and written straight into an
+    `open_memmap` file, so the peak memory is one patch. The files are
+    written under temporary names and renamed at the end.
+
+    Args:
+        manifest_df (pandas.DataFrame): The manifest (rows with
+            `patch_extracted == True` are stored).
+        windows (list of tuples): (name, center, width) per window.
+        store_dir (Path): Output directory of the store.
+
+    Returns:
+        pandas.DataFrame: The store index (subject_id, store_row).
+    """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    rows = manifest_df[manifest_df['patch_extracted'] == True]
+    window_params = [(center, width) for _, center, width in windows]
+
+    first = np.load(PROJECT_ROOT / rows.iloc[0]['patch_file_path'], mmap_mode='r')
+    n_slices, height, width = first.shape
+
+    tmp_path = store_dir / f"{FILE_CHANNELS}.tmp.npy"
+    channels = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                         shape=(len(rows), len(windows) * n_slices, height, width))
+    for i, patch_path in enumerate(rows['patch_file_path']):
+        patch_hu = patch_to_int16(np.load(PROJECT_ROOT / patch_path))
+        # (K, n_slices, H, W) -> channel k * n_slices + s
+        channels[i] = render_windows(patch_hu, window_params).reshape(-1, height, width)
+    channels.flush()
+    del channels
+    os.replace(tmp_path, store_dir / FILE_CHANNELS)
+
+    index = pd.DataFrame({'subject_id': rows['subject_id'].values, 'store_row': np.arange(len(rows))})
+    index.to_csv(store_dir / FILE_INDEX, index=False)
+    with open(store_dir / FILE_WINDOWS, 'w') as f:
+        json.dump([{'name': n, 'center': c, 'width': w} for n, c, w in windows], f, indent=2)
+
+    return index
+
+def load_window_store(store_dir=DIR_WINDOW_STORE, mmap=True):
+    """
+    Opens the uint8 channel store.
+
+    Args:
+        store_dir (Path): Directory of the store.
+        mmap (bool): If True, the channel array is opened as a read-only memory map.
+
+    Returns:
+        tuple: (channels, index, windows). Returns (None, None, None) if the
+        store has not been built yet.
+    """
+    store_dir = Path(store_dir)
+    if not (store_dir / FILE_CHANNELS).exists():
+        return None, None, None
+
+    channels = np.load(store_dir / FILE_CHANNELS, mmap_mode='r' if mmap else None)
+    index = pd.read_csv(store_dir / FILE_INDEX)
+    with open(store_dir / FILE_WINDOWS) as f:
+        windows = json.load(f)
+    return channels, index, windows
+
+def compute_channel_stats(channels, rows):
+    """
+    Computes per-channel mean and std over store rows in a single pass.
+
+    Uses Welford's streaming algorithm in its batched form (Chan et al.):
+    each patch contributes its per-channel count, mean and sum of squared
+    deviations, which are merged into the running totals. Only one patch is
+    converted to float at a time, and the merge is numerically stable even
+    for millions of voxels.
+
+    Args:
+        channels (numpy.ndarray): The (N, C, H, W) uint8 store (memory map).
+        rows (array-like): Store rows to include (e.g. the Train split).
+
+    Returns:
+        tuple: (mean, std) as float64 arrays of shape (C,), in dequantized
+        units (uint8 / 255).
+    """
+    n_channels = channels.shape[1]
+    count = 0
+    mean = np.zeros(n_channels, dtype=np.float64)
+    m2 = np.zeros(n_channels, dtype=np.float64)
+
+    for row in rows:
+        patch = np.asarray(channels[row], dtype=np.float64).reshape(n_channels, -1) / 255.0
+        n_b = patch.shape[1]
+        mean_b = patch.mean(axis=1)
+        m2_b = np.square(patch - mean_b[:, None]).sum(axis=1)
+
+        delta = mean_b - mean
+        total = count + n_b
+        mean += delta * n_b / total
+        m2 += m2_b + np.square(delta) * count * n_b / total
+        count = total
+
+    std = np.sqrt(m2 / max(count, 1))
+    return mean, std
+
+def load_or_compute_channel_stats(train_subjects, store_dir=DIR_WINDOW_STORE):
+    """
+    Returns the train-split channel statistics, computing them on first use.
+
+    The statistics are cached in `channel_stats.json` next to the store,
+    together with a hash of the train subjects and the store file, so they
+    are recomputed automatically after a new split or a rebuilt store.
+
+    Args:
+        train_subjects (iterable of str): Subject IDs of the Train split.
+        store_dir (Path): Directory of the store.
+
+    Returns:
+        dict: 'mean' and 'std' lists (one value per channel).
+    """
+    store_dir = Path(store_dir)
+    channels, index, _ = load_window_store(store_dir)
+
+    channels_stat = os.stat(store_dir / FILE_CHANNELS)
+    key_source = ','.join(sorted(str(s) for s in train_subjects))
+    key_source += f"|{channels_stat.st_size}|{channels_stat.st_mtime_ns}"
+    cache_key = hashlib.sha1(key_source.encode()).hexdigest()
+
+    stats_path = store_dir / FILE_CHANNEL_STATS
+    if stats_path.exists():
+        with open(stats_path) as f:
+            cached = json.load(f)
+        if cached.get('key') == cache_key:
+            return cached
+
+    rows = index[index['subject_id'].isin(set(train_subjects))]['store_row'].to_numpy()
+    mean, std = compute_channel_stats(channels, rows)
+    stats = {'key': cache_key, 'n_patches': int(len(rows)), 'mean': mean.tolist(), 'std': std.tolist()}
+    with open(stats_path, 'w') as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+def dequantization_params(channel_stats=None):
+    """
+    Folds dequantization and normalization into one scale/shift per channel.
+
+    `(q / 255 - mean) / std == q * scale + shift` with
+    `scale = 1 / (255 * std)` and `shift = -mean / std`.
+
+    Args:
+        channel_stats (dict, optional): Output of `load_or_compute_channel_stats`.
+            Without statistics, the result is a plain dequantization to [0, 1].
+
+    Returns:
+        tuple: (scale, shift) float32 tensors of shape (C, 1, 1), or scalar
+        tensors if no statistics are given.
+    """
+    if channel_stats is None:
+        return torch.tensor(1.0 / 255.0), torch.tensor(0.0)
+
+    mean = torch.tensor(channel_stats['mean'], dtype=torch.float64)
+    std = torch.tensor(channel_stats['std'], dtype=torch.float64).clamp_min(1e-6)
+    scale = (1.0 / (255.0 * std)).float().view(-1, 1, 1)
+    shift = (-mean / std).float().view(-1, 1, 1)
+    return scale, shift
+
+def dequantize(patch_uint8, scale, shift):
+    """
+    Converts uint8 channels to normalized float32 in one fused operation.
+
+    Args:
+        patch_uint8 (torch.Tensor): (C, H, W) or (B, C, H, W) uint8 tensor.
+        scale (torch.Tensor): From `dequantization_params`.
+        shift (torch.Tensor): From `dequantization_params`.
+
+    Returns:
+        torch.Tensor: The float32 tensor.
+    """
+    return torch.addcmul(shift, patch_uint8, scale)
@@ -0,0 +1,220 @@
+"""
+Frozen-Prefix Activation Caching for Partial Fine-Tuning.
+
+With `--unfreeze_blocks k < 5`, `build_vision_model` freezes every stage before
+the last k blocks, yet a normal epoch still runs that frozen prefix forward
+for every sample. In cache mode the model is split into
+
+    prefix (frozen, eval mode)  ->  tail (the unfrozen blocks + head)
+
+at the block boundaries used by `build_vision_model` (ResNet `layer1-4`,
+DenseNet `denseblock1-4`, EfficientNet `features[i]`). The prefix
+activations of every split are computed once, stored as memory-mapped `.npy`
+files in 'data/processed/activation_cache', and the training loop only runs
+the tail. `tail(prefix(x))` is exactly the model output.
+
+Two semantic differences to the normal mode (both required for a cache):
+
+- The input stem (the replaced first conv) is inflated from the pretrained
+  RGB weights and frozen (`build_vision_model(..., inflate_stem=True)`),
+  instead of being randomly initialized and trained.
+- BatchNorm layers (and EfficientNet stochastic depth) of the prefix run in
+  eval mode, i.e. with the pretrained running statistics. In the normal mode
+  the frozen BN layers still update their running statistics in training.
+
+Augmentation is either disabled or drawn from a fixed bank: `bank_views`
+augmented copies of the train split (seeded `BatchAugment`) are cached, and
+epoch e trains on view e % bank_views.
+
+Cache files are keyed by a hash of the architecture, the split point and the
+exact input tensors, so changed patches, normalization or augmentation seeds
+never reuse stale activations.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+import torch.nn as nn
+from pathlib import Path
+from torch.utils.data import Dataset
+
+from utils.augment import BatchAugment
+from utils.datasets import collate_batch
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_ACTIVATION_CACHE = PROJECT_ROOT / "data" / "processed" / "activation_cache"
+CACHE_BATCH_SIZE = 64
+
+# Index of the first tail stage per `unfreeze_blocks` (see `model_stages`)
+TAIL_START = {
+    'resnet': {0: 10, 1: 7, 2: 6, 3: 5, 4: 4},
+    'densenet': {0: 15, 1: 10, 2: 8, 3: 6, 4: 4},
+    'efficientnet': {0: 11, 1: 7, 2: 5, 3: 3, 4: 1},
+}
+
+def model_stages(model, model_name):
+    """
+    Lists the modules of a torchvision model in forward order.
+
+    Running them as one `nn.Sequential` reproduces `model(x)` exactly.
+
+    Args:
+        model (torch.nn.Module): ResNet18, DenseNet121 or EfficientNet-B0.
+        model_name (str): 'resnet', 'densenet' or 'efficientnet'.
+
+    Returns:
+        list: The stage modules.
+    """
+    if model_name == 'resnet':
+        return [model.conv1, model.bn1, model.relu, model.maxpool,
+                model.layer1, model.layer2, model.layer3, model.layer4,
+                model.avgpool, nn.Flatten(1), model.fc]
+    if model_name == 'densenet':
+        return list(model.features.children()) + [nn.ReLU(), nn.AdaptiveAvgPool2d((1, 1)),
+                                                  nn.Flatten(1), model.classifier]
+    if model_name == 'efficientnet':
+        return list(model.features.children()) + [model.avgpool, nn.Flatten(1), model.classifier]
+    raise ValueError(f"Unknown model: {model_name}")
+
+def split_frozen_prefix(model, model_name, unfreeze_blocks):
+    """
+    Splits a model into its frozen prefix and the trainable tail.
+
+    Args:
+        model (torch.nn.Module): Model from `build_vision_model(..., inflate_stem=True)`.
+        model_name (str): 'resnet', 'densenet' or 'efficientnet'.
+        unfreeze_blocks (int): 0-4 (5 = full fine-tuning has no frozen prefix).
+
+    Returns:
+        tuple: (prefix, tail) as `nn.Sequential`s sharing the model's modules;
+        the prefix is set to eval mode.
+    """
+    if unfreeze_blocks not in TAIL_START[model_name]:
+        raise ValueError(f"unfreeze_blocks={unfreeze_blocks} has no frozen prefix to cache.")
+
+    stages = model_stages(model, model_name)
+    start = TAIL_START[model_name][unfreeze_blocks]
+    prefix, tail = nn.Sequential(*stages[:start]), nn.Sequential(*stages[start:])
+    if any(p.requires_grad for p in prefix.parameters()):
+        raise ValueError("The prefix has trainable parameters (build the model with inflate_stem=True).")
+    return prefix.eval(), tail
+
+def cached_activations(prefix, make_batches, key, device, cache_dir=DIR_ACTIVATION_CACHE):
+    """
+    Returns the prefix activations of a sequence of input batches, computed once.
+
+    Args:
+        prefix (torch.nn.Module): The frozen prefix (eval mode).
+        make_batches (callable): Returns a fresh iterator over the input batches
+            (identical on every call); it is iterated once for the hash and,
+            on a cache miss, once more for the forward pass.
+        key (dict): Architecture/split description included in the cache key.
+        device (torch.device): Device of the prefix.
+        cache_dir (Path): Directory of the activation cache.
+
+    Returns:
+        numpy.memmap: Read-only float32 activations, one row per input sample.
+    """
+    digest, n_samples = hashlib.sha1(json.dumps(key, sort_keys=True).encode()), 0
+    for images in make_batches():
+        digest.update(images.numpy().tobytes())
+        n_samples += len(images)
+    path = Path(cache_dir) / f"{digest.hexdigest()}.npy"
+    if n_samples == 0:
+        return np.empty((0,), dtype=np.float32)
+    if path.exists():
+        return np.load(path, mmap_mode='r')
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp.npy')
+    store, row = None, 0
+    with torch.no_grad():
+        for images in make_batches():
+            features = prefix(images.to(device)).cpu().numpy()
+            if store is None:
+                store = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                                  shape=(n_samples,) + features.shape[1:])
+            store[row:row + len(features)] = features
+            row += len(features)
+    store.flush()
+    del store
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+def input_batches(dataset, batch_size=CACHE_BATCH_SIZE, augment_seed=None):
+    """
+    Builds a `make_batches` callable over a dataset in index order.
+
+    Args:
+        dataset (torch.utils.data.Dataset): Dataset yielding (image, label).
+        batch_size (int): Samples per batch.
+        augment_seed (int, optional): If given, every pass applies a
+            `BatchAugment` seeded with it (one fixed augmented view).
+
+    Returns:
+        callable: Returns a fresh iterator over (B, C, H, W) input batches.
+    """
+    def make_batches():
+        augment = BatchAugment(generator=torch.Generator().manual_seed(augment_seed)) if augment_seed is not None else None
+        for start in range(0, len(dataset), batch_size):
+            indices = list(range(start, min(start + batch_size, len(dataset))))
+            if hasattr(dataset, '__getitems__'):
+                images, _ = dataset.__getitems__(indices)
+            else:
+                images = torch.stack([dataset[idx][0] for idx in indices])
+            yield augment(images) if augment is not None else images
+    return make_batches
+
+class ActivationDataset(Dataset):
+    """
+    Dataset over cached prefix activations (one or several augmented views).
+
+    Args:
+        views (list of numpy.ndarray): Activations per view, each (N, ...).
+        labels (torch.Tensor): (N,) int64 labels.
+    """
+    collate_fn = staticmethod(collate_batch)
+
+    def __init__(self, views, labels):
+        self.views = views
+        self.labels = labels
+        self.view = 0
+
+    def set_epoch(self, epoch):
+        """Selects the augmented view used in this epoch."""
+        self.view = epoch % len(self.views)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return torch.from_numpy(np.array(self.views[self.view][idx])), self.labels[idx]
+
+    def __getitems__(self, indices):
+        indices = np.asarray(indices)
+        return torch.from_numpy(self.views[self.view][indices]), self.labels[torch.as_tensor(indices)]
+
+def build_activation_dataset(prefix, dataset, key, device, bank_views=0, bank_seed=42, cache_dir=DIR_ACTIVATION_CACHE):
+    """
+    Caches the prefix activations of one split and wraps them as a dataset.
+
+    Args:
+        prefix (torch.nn.Module): The frozen prefix.
+        dataset (torch.utils.data.Dataset): The split (without transform).
+        key (dict): Architecture/split description for the cache key.
+        device (torch.device): Device of the prefix.
+        bank_views (int): 0 = the clean split only; otherwise the number of
+            seeded augmented views (bank_seed, bank_seed + 1, ...).
+        bank_seed (int): Seed of the first augmented view.
+        cache_dir (Path): Directory of the activation cache.
+
+    Returns:
+        ActivationDataset: Activations with the split's labels.
+    """
+    seeds = [bank_seed + view for view in range(bank_views)] or [None]
+    views = [cached_activations(prefix, input_batches(dataset, augment_seed=seed),
+                                dict(key, augment_seed=seed), device, cache_dir) for seed in seeds]
+    return ActivationDataset(views, dataset.labels)
@@ -0,0 +1,126 @@
+"""
+Header-Only Slice Selection for Single-Slice Previews.
+
+Previews (the middle slice, a montage of N slices, the slice at a given Z)
+only need the anatomical order of a series, not its pixels. This module sorts
+a series from its headers alone, either from the cached per-patient header
+index (see `utils.dicom_index`, no file is opened at all) or by reading each
+header with `stop_before_pixels`, and then opens the pixel payload of the
+requested slices only.
+
+All slice lists use the order of `get_sorted_dicom_series` and the volume
+cache: (z_position, file_path, SOPInstanceUID) tuples sorted head to toe.
+"""
+
+import numpy as np
+import pydicom
+from pathlib import Path
+
+from utils.dicom_index import load_patient_index
+from utils.volume_cache import read_series_headers, slice_to_hu
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+def series_slices(series_dir, subject_id=None):
+    """
+    Lists the slices of a single-series folder in anatomical order without decoding pixels.
+
+    Args:
+        series_dir (Path): Folder containing the DICOM files of one series.
+        subject_id (str, optional): The patient ID. If given, the patient's
+            cached header index is used (and built on first use).
+
+    Returns:
+        list of tuples: (z_position, file_path, SOPInstanceUID), sorted head to toe.
+    """
+    series_dir = Path(series_dir)
+    if subject_id is not None:
+        index = load_patient_index(subject_id)
+        if not index.empty:
+            paths = index['path'].map(lambda p: PROJECT_ROOT / p)
+            rows = index[paths.map(lambda p: p.parent) == series_dir]
+            if not rows.empty:
+                slices = list(zip(rows['z'].astype(float), paths[rows.index], rows['sop_uid']))
+                slices.sort(key=lambda x: x[0], reverse=True)
+                return slices
+
+    slices, _ = read_series_headers(series_dir)
+    return slices
+
+def middle_index(n_slices):
+    """
+    Returns the index of the middle slice of a head-to-toe series.
+
+    For an even slice count this is the same slice that `n // 2` selects in
+    a toe-to-head (ascending Z) list.
+    """
+    return (n_slices - 1) // 2
+
+def montage_indices(n_slices, count):
+    """Returns `count` evenly spaced slice indices covering the whole series."""
+    return np.linspace(0, n_slices - 1, count).astype(int)
+
+def nearest_index(slices_info, z):
+    """Returns the index of the slice whose Z-position is closest to `z` (mm)."""
+    z_positions = np.array([s[0] for s in slices_info])
+    return int(np.argmin(np.abs(z_positions - z)))
+
+def read_slices(slices_info, indices):
+    """
+    Reads the full DICOM datasets (including pixel data) of the selected slices only.
+
+    Args:
+        slices_info (list of tuples): Output of `series_slices`.
+        indices (iterable of int): Positions in `slices_info`.
+
+    Returns:
+        list of pydicom.dataset.FileDataset: One dataset per index.
+    """
+    return [pydicom.dcmread(slices_info[i][1]) for i in indices]
+
+def read_middle_slice(series_dir, subject_id=None):
+    """
+    Reads the middle slice of a series, opening a single pixel payload.
+
+    Args:
+        series_dir (Path): Folder containing the DICOM files of one series.
+        subject_id (str, optional): The patient ID (enables the header index).
+
+    Returns:
+        pydicom.dataset.FileDataset or None: The middle slice, or None if the folder is empty.
+    """
+    slices_info = series_slices(series_dir, subject_id)
+    if not slices_info:
+        return None
+    return read_slices(slices_info, [middle_index(len(slices_info))])[0]
+
+def preview_hu(series_dir, count=None, z=None, subject_id=None):
+    """
+    Decodes the preview slices of a series into Hounsfield Units.
+
+    Without `count` and `z` the middle slice is returned; with `count` the
+    evenly spaced montage slices; with `z` the slice nearest to that position.
+
+    Args:
+        series_dir (Path): Folder containing the DICOM files of one series.
+        count (int, optional): Number of montage slices.
+        z (float, optional): Z-position in mm.
+        subject_id (str, optional): The patient ID (enables the header index).
+
+    Returns:
+        tuple: (images, indices) with images as an int16 array of shape
+        (k, Rows, Columns) and the slice indices in head-to-toe order.
+    """
+    slices_info = series_slices(series_dir, subject_id)
+    if not slices_info:
+        raise FileNotFoundError(f"No DICOM files found in {series_dir}")
+
+    if z is not None:
+        indices = [nearest_index(slices_info, z)]
+    elif count is not None:
+        indices = [int(i) for i in montage_indices(len(slices_info), count)]
+    else:
+        indices = [middle_index(len(slices_info))]
+    images = np.stack([slice_to_hu(ds) for ds in read_slices(slices_info, indices)])
+    return images, indices
@@ -0,0 +1,173 @@
+"""
+SQLite Database of Vision Sweep Runs.
+
+Every configuration of a sweep (see `03_sweep_phase2_vision.py`) is one row of
+the `runs` table, keyed by the sweep name and a readable run key
+(e.g. 'resnet_u1_lr0.001_bs16'). A row records the configuration (as JSON and
+as indexed columns), its status ('pending', 'running', 'done', 'failed',
+'killed'), timings, the best validation Sens+Spec / AUC, the test metrics and
+the paths of its checkpoint and log file.
+
+Successive-halving sweeps also fill the `rungs` table: one row per run and
+rung with the epoch budget, the validation scores reached within it and
+whether the run was promoted to the next rung. Runs that are not promoted
+end as 'killed' (no test metrics).
+
+Only the orchestrating process writes to the database; workers return their
+results. Finished runs are skipped when a sweep is restarted with the same
+configuration (`config_conflicts` detects changed ones).
+
+Default location: 'data/processed/sweeps/sweeps.sqlite'.
+"""
+
+import json
+import time
+import sqlite3
+from pathlib import Path
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_SWEEPS = PROJECT_ROOT / "data" / "processed" / "sweeps"
+FILE_SWEEP_DB = DIR_SWEEPS / "sweeps.sqlite"
+
+RESULT_COLUMNS = ['epochs_run', 'best_val_score', 'best_val_auc', 'test_acc', 'test_auc',
+                  'test_f1', 'test_sens', 'test_spec', 'test_thresh']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    sweep TEXT NOT NULL,
+    run_key TEXT NOT NULL,
+    model TEXT,
+    unfreeze_blocks INTEGER,
+    lr REAL,
+    batch_size INTEGER,
+    config TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    started_at REAL,
+    finished_at REAL,
+    wall_s REAL,
+    {', '.join(f'{c} REAL' for c in RESULT_COLUMNS)},
+    checkpoint TEXT,
+    log TEXT,
+    error TEXT,
+    PRIMARY KEY (sweep, run_key)
+)
+"""
+
+RUNG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rungs (
+    sweep TEXT NOT NULL,
+    run_key TEXT NOT NULL,
+    rung INTEGER NOT NULL,
+    budget INTEGER,
+    epochs_run INTEGER,
+    best_val_score REAL,
+    best_val_auc REAL,
+    last_val_score REAL,
+    stopped INTEGER,
+    wall_s REAL,
+    error TEXT,
+    promoted INTEGER,
+    finished_at REAL,
+    PRIMARY KEY (sweep, run_key, rung)
+)
+"""
+
+def run_key(config):
+    """Returns the readable key of a configuration."""
+    key = f"{config['model']}_u{config['unfreeze_blocks']}_lr{config['lr']:g}_bs{config['batch_size']}"
+    return key + ("_cached" if config.get('cache_prefix') else "")
+
+def connect(db_path=FILE_SWEEP_DB):
+    """Opens (and if needed creates) the sweep database."""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute(SCHEMA)
+    conn.execute(RUNG_SCHEMA)
+    conn.commit()
+    return conn
+
+def config_conflicts(conn, sweep, configs):
+    """
+    Finds runs already stored under the same key but with another configuration.
+
+    Returns:
+        list: The run keys whose stored configuration differs.
+    """
+    rows = conn.execute("SELECT run_key, config FROM runs WHERE sweep = ?", (sweep,))
+    stored = {row['run_key']: json.loads(row['config']) for row in rows}
+    # Compare via JSON, as stored (tuples become lists)
+    return [run_key(c) for c in configs
+            if run_key(c) in stored and stored[run_key(c)] != json.loads(json.dumps(c, sort_keys=True))]
+
+def register_runs(conn, sweep, configs, replace=False):
+    """
+    Inserts the configurations of a sweep as 'pending' runs.
+
+    Existing rows are kept, unless `replace` is True: then they are reset to
+    'pending' with the new configuration (and no results).
+    """
+    if replace:
+        conn.executemany("DELETE FROM runs WHERE sweep = ? AND run_key = ?",
+                         [(sweep, run_key(c)) for c in configs])
+    conn.executemany(
+        "INSERT OR IGNORE INTO runs (sweep, run_key, model, unfreeze_blocks, lr, batch_size, config) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(sweep, run_key(c), c['model'], c['unfreeze_blocks'], c['lr'], c['batch_size'],
+          json.dumps(c, sort_keys=True)) for c in configs])
+    conn.commit()
+
+def finished_keys(conn, sweep):
+    """Returns the run keys of a sweep that finished successfully."""
+    rows = conn.execute("SELECT run_key FROM runs WHERE sweep = ? AND status = 'done'", (sweep,))
+    return {row['run_key'] for row in rows}
+
+def mark_running(conn, sweep, key, checkpoint, log):
+    """Marks a run as started."""
+    conn.execute("UPDATE runs SET status = 'running', started_at = ?, checkpoint = ?, log = ?, error = NULL "
+                 "WHERE sweep = ? AND run_key = ?", (time.time(), str(checkpoint), str(log), sweep, key))
+    conn.commit()
+
+def record_result(conn, sweep, key, result=None, error=None, wall_s=None, status=None):
+    """Stores the result (or the error) of a finished run; `status` overrides 'done'/'failed'."""
+    values = {c: (result or {}).get(c) for c in RESULT_COLUMNS}
+    assignments = ', '.join(f"{c} = :{c}" for c in RESULT_COLUMNS)
+    conn.execute(f"UPDATE runs SET status = :status, finished_at = :finished_at, wall_s = :wall_s, "
+                 f"error = :error, {assignments} WHERE sweep = :sweep AND run_key = :run_key",
+                 dict(values, status=status or ('failed' if error else 'done'), finished_at=time.time(),
+                      wall_s=wall_s, error=error, sweep=sweep, run_key=key))
+    conn.commit()
+
+def load_runs(conn, sweep):
+    """Returns all runs of a sweep as a list of dicts."""
+    rows = conn.execute("SELECT * FROM runs WHERE sweep = ? ORDER BY model, unfreeze_blocks, lr, batch_size", (sweep,))
+    return [dict(row) for row in rows]
+
+def record_rung(conn, sweep, key, rung, budget, result=None, error=None, wall_s=None):
+    """Stores the outcome of one run in one successive-halving rung."""
+    result = result or {}
+    conn.execute(
+        "INSERT OR REPLACE INTO rungs (sweep, run_key, rung, budget, epochs_run, best_val_score, best_val_auc, "
+        "last_val_score, stopped, wall_s, error, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (sweep, key, rung, budget, result.get('epochs_run'), result.get('best_val_score'), result.get('best_val_auc'),
+         result.get('last_val_score'), result.get('stopped'), wall_s, error, time.time()))
+    conn.commit()
+
+def mark_promoted(conn, sweep, rung, keys):
+    """Sets the promotion flag of all runs of a rung (1 for `keys`, 0 for the rest)."""
+    conn.execute("UPDATE rungs SET promoted = 0 WHERE sweep = ? AND rung = ?", (sweep, rung))
+    conn.executemany("UPDATE rungs SET promoted = 1 WHERE sweep = ? AND rung = ? AND run_key = ?",
+                     [(sweep, rung, key) for key in keys])
+    conn.commit()
+
+def load_rungs(conn, sweep):
+    """Returns all rung rows of a sweep as a list of dicts."""
+    rows = conn.execute("SELECT * FROM rungs WHERE sweep = ? ORDER BY rung, run_key", (sweep,))
+    return [dict(row) for row in rows]
+
+def clear_rungs(conn, sweep):
+    """Deletes the rung rows of a sweep (to restart its successive halving)."""
+    conn.execute("DELETE FROM rungs WHERE sweep = ?", (sweep,))
+    conn.commit()
@@ -0,0 +1,521 @@
+"""
+Memory-Mapped Hounsfield Unit Volume Cache.
+
+Decoding a full DICOM series is the most expensive step of the pipeline. This
+module decodes each series exactly once and streams the slices into a
+preallocated int16 `.npy` file on disk, sorted anatomically (head to toe, the
+same order as `get_sorted_dicom_series`). The spatial metadata (Z-positions,
+SOPInstanceUIDs, pixel and slice spacing) is stored next to it as JSON.
+
+Consumers open the volume with `np.load(mmap_mode='r')`, so cropping a small
+patch only touches the pages of that crop and never pulls the full-resolution
+series into RAM.
+
+For interactive exploration, `load_series_hu` loads a series under an
+explicit memory budget: small series are streamed into a preallocated int16
+array in RAM, larger ones fall back to the memory-mapped cache.
+
+At ingest, the cache also stores a downsampled pyramid of every volume
+(`PYRAMID_FACTORS`, in-plane int16 block means, one level per file). Whole-
+volume consumers such as montages ask for the level that fits their output
+size (`load_volume_for_size`) instead of reading full-resolution slices.
+The pyramid only reduces Y/X, so slice indices (and SOPInstanceUIDs) are
+the same on every level; level coordinates are full coordinates // factor.
+
+Optionally the cache keeps only the bounding box of the patient body (see
+`precompute_body_mask`). The metadata then records the `offset` of the stored
+box inside the `full_shape` of the series; every index computed in full-series
+coordinates (e.g. the manifest's x_pixel/y_pixel) must subtract this offset.
+"""
+
+import os
+import json
+import numpy as np
+import pydicom
+from pathlib import Path
+
+from utils.body_mask import compute_body_mask, compute_lung_mask, mask_bbox, pack_mask, unpack_mask
+
+# --- CONFIGURATION ---
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DIR_VOLUME_CACHE = PROJECT_ROOT / "data" / "processed" / "volume_cache"
+
+AIR_HU = -1000
+BODY_MARGIN_VOXELS = 8
+DEFAULT_MEMORY_BUDGET_MB = 1024
+PYRAMID_FACTORS = (2, 4, 8)
+PYRAMID_CHUNK_SLICES = 32
+
+def get_cache_paths(series_uid, cache_dir=DIR_VOLUME_CACHE):
+    """
+    Returns the volume and metadata file paths for a series.
+
+    Args:
+        series_uid (str): The cleaned SeriesInstanceUID (digits and dots only).
+        cache_dir (Path): Root directory of the volume cache.
+
+    Returns:
+        tuple: (volume_path, meta_path).
+    """
+    cache_dir = Path(cache_dir)
+    return cache_dir / f"{series_uid}.npy", cache_dir / f"{series_uid}.json"
+
+def get_pyramid_path(series_uid, factor, cache_dir=DIR_VOLUME_CACHE):
+    """Returns the path of one downsampled pyramid level of a series."""
+    return Path(cache_dir) / f"{series_uid}.x{factor}.npy"
+
+def get_mask_path(series_uid, cache_dir=DIR_VOLUME_CACHE):
+    """Returns the path of the bit-packed body/lung masks of a series."""
+    return Path(cache_dir) / f"{series_uid}.masks.npz"
+
+def slice_to_hu(ds):
+    """
+    Converts one DICOM slice into an int16 Hounsfield Unit array.
+
+    Only a single slice is ever held as float, so the temporary cost is one
+    slice instead of the full volume.
+
+    Args:
+        ds (pydicom.dataset.FileDataset): The loaded DICOM file object.
+
+    Returns:
+        numpy.ndarray: The 2D slice in HU as int16.
+    """
+    intercept = float(ds.RescaleIntercept) if 'RescaleIntercept' in ds else -1024.0
+    slope = float(ds.RescaleSlope) if 'RescaleSlope' in ds else 1.0
+
+    image = ds.pixel_array
+    if slope == 1.0 and intercept.is_integer():
+        image = image.astype(np.int32) + int(intercept)
+    else:
+        image = np.rint(image * slope + intercept)
+    return np.clip(image, -32768, 32767).astype(np.int16)
+
+def estimate_slice_spacing(z_positions, fallback=None):
+    """
+    Estimates the Z-spacing (mm) of a series from its sorted slice positions.
+
+    Args:
+        z_positions (list of float): The Z-coordinates of all slices.
+        fallback (float, optional): Value used if fewer than two slices exist.
+
+    Returns:
+        float: The median absolute distance between neighbouring slices.
+    """
+    if len(z_positions) < 2:
+        return float(fallback) if fallback else 1.0
+    return float(np.median(np.abs(np.diff(z_positions))))
+
+def read_series_headers(series_dir):
+    """
+    Lists the slices of a single-series folder, sorted head to toe, from headers only.
+
+    Same order and tuple layout as `get_sorted_dicom_series`, but without
+    decoding any pixel data. Files of other series in the folder are ignored.
+
+    Args:
+        series_dir (Path): Folder containing the DICOM files of one series.
+
+    Returns:
+        tuple: (slices_info, series_uid) with slices_info as a list of
+        (z_position, file_path, SOPInstanceUID) tuples.
+    """
+    slices, series_uid = [], None
+    for f in sorted(os.listdir(series_dir)):
+        if not f.endswith('.dcm'):
+            continue
+        dcm_path = Path(series_dir) / f
+        ds = pydicom.dcmread(dcm_path, stop_before_pixels=True)
+        uid = str(ds.SeriesInstanceUID).strip().replace('\x00', '')
+        if series_uid is None:
+            series_uid = uid
+        elif uid != series_uid:
+            continue
+        z_pos = float(ds.ImagePositionPatient[2]) if 'ImagePositionPatient' in ds else float(ds.InstanceNumber)
+        slices.append((z_pos, dcm_path, str(ds.SOPInstanceUID).strip().replace('\x00', '')))
+
+    slices.sort(key=lambda x: x[0], reverse=True)
+    return slices, series_uid
+
+def series_meta(slices_info, series_uid, first):
+    """
+    Builds the metadata dict of a sorted series.
+
+    Args:
+        slices_info (list of tuples): (z_position, file_path, SOPInstanceUID), sorted head to toe.
+        series_uid (str): The SeriesInstanceUID of the series.
+        first (pydicom.dataset.FileDataset): Header of any slice of the series.
+
+    Returns:
+        dict: Shape, Z-positions, SOPInstanceUIDs, pixel and slice spacing.
+    """
+    rows, columns = int(first.Rows), int(first.Columns)
+    pixel_spacing = [float(v) for v in first.PixelSpacing] if 'PixelSpacing' in first else [1.0, 1.0]
+    thickness = float(first.SliceThickness) if 'SliceThickness' in first else None
+    z_positions = [float(z) for z, _, _ in slices_info]
+    return {
+        'series_uid': series_uid,
+        'shape': [len(slices_info), rows, columns],
+        'full_shape': [len(slices_info), rows, columns],
+        'offset': [0, 0, 0],
+        'z_positions': z_positions,
+        'sop_uids': [sop for _, _, sop in slices_info],
+        'pixel_spacing': pixel_spacing,
+        'slice_spacing': estimate_slice_spacing(z_positions, fallback=thickness),
+    }
+
+def write_meta(meta, series_uid, cache_dir=DIR_VOLUME_CACHE):
+    """Writes the JSON metadata of a cached series."""
+    _, meta_path = get_cache_paths(series_uid, cache_dir)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+def build_volume_cache(slices_info, series_uid, cache_dir=DIR_VOLUME_CACHE, crop_to_body=False):
+    """
+    Decodes a sorted DICOM series once and stores it as a memory-mapped HU volume.
+
+    The volume is written slice by slice into an `open_memmap` file, so the
+    peak memory of building the cache is a single slice. The file is written
+    under a temporary name and renamed at the end, which means a crash never
+    leaves a half-written volume behind.
+
+    Args:
+        slices_info (list of tuples): Output of `get_sorted_dicom_series`,
+            i.e. (z_position, file_path, SOPInstanceUID) sorted head to toe.
+        series_uid (str): The SeriesInstanceUID the slices belong to.
+        cache_dir (Path): Root directory of the volume cache.
+        crop_to_body (bool): If True, only the body bounding box is kept.
+
+    Returns:
+        dict: The metadata that was written alongside the volume.
+    """
+    volume_path, _ = get_cache_paths(series_uid, cache_dir)
+    volume_path.parent.mkdir(parents=True, exist_ok=True)
+
+    first = pydicom.dcmread(slices_info[0][1], stop_before_pixels=True)
+    meta = series_meta(slices_info, series_uid, first)
+    rows, columns = meta['shape'][1:]
+
+    tmp_path = volume_path.with_suffix('.tmp.npy')
+    volume = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int16,
+                                       shape=(len(slices_info), rows, columns))
+    for i, (_, dcm_path, _) in enumerate(slices_info):
+        ds = pydicom.dcmread(dcm_path)
+        volume[i] = slice_to_hu(ds)
+    volume.flush()
+    del volume
+    os.replace(tmp_path, volume_path)
+    write_meta(meta, series_uid, cache_dir)
+
+    if crop_to_body:
+        # Cropping rewrites the volume and builds the pyramid of the crop
+        meta = precompute_body_mask(series_uid, cache_dir, crop=True)
+    else:
+        meta = build_pyramid(series_uid, cache_dir)
+    return meta
+
+def load_volume(series_uid, cache_dir=DIR_VOLUME_CACHE, mmap=True):
+    """
+    Opens a cached HU volume.
+
+    Args:
+        series_uid (str): The SeriesInstanceUID of the cached series.
+        cache_dir (Path): Root directory of the volume cache.
+        mmap (bool): If True, returns a read-only memory map instead of loading
+            the whole volume into RAM.
+
+    Returns:
+        tuple: (volume, meta). Returns (None, None) if the series is not cached,
+        or if the volume does not have the shape recorded in its metadata
+        (an interrupted crop or rebuild), so that the cache is rebuilt.
+    """
+    volume_path, meta_path = get_cache_paths(series_uid, cache_dir)
+    if not volume_path.exists() or not meta_path.exists():
+        return None, None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta.setdefault('full_shape', meta['shape'])
+    meta.setdefault('offset', [0, 0, 0])
+    volume = np.load(volume_path, mmap_mode='r' if mmap else None)
+    if list(volume.shape) != list(meta['shape']):
+        return None, None
+    return volume, meta
+
+def precompute_body_mask(series_uid, cache_dir=DIR_VOLUME_CACHE, crop=False, margin=BODY_MARGIN_VOXELS):
+    """
+    Computes the body and lung masks of a cached series (once) and optionally crops it.
+
+    The masks are stored bit-packed next to the volume in the coordinates of
+    the stored volume. With `crop=True` the volume is rewritten to the body
+    bounding box (plus a margin), and the box offset is recorded in the
+    metadata. Already cropped series are left untouched.
+
+    Args:
+        series_uid (str): The SeriesInstanceUID of the cached series.
+        cache_dir (Path): Root directory of the volume cache.
+        crop (bool): If True, keep only the body bounding box in the cache.
+        margin (int): Voxels kept around the body on every side.
+
+    Returns:
+        dict: The (possibly updated) metadata of the series.
+    """
+    volume, meta = load_volume(series_uid, cache_dir)
+    mask_path = get_mask_path(series_uid, cache_dir)
+    is_cropped = meta.get('cropped_to_body', False)
+    if mask_path.exists() and (is_cropped or not crop):
+        return meta
+
+    body = compute_body_mask(volume)
+    lungs = compute_lung_mask(volume, body)
+
+    if crop and not is_cropped:
+        start, stop = mask_bbox(body, margin)
+        box = tuple(slice(a, b) for a, b in zip(start, stop))
+
+        volume_path, _ = get_cache_paths(series_uid, cache_dir)
+        tmp_path = volume_path.with_suffix('.tmp.npy')
+        cropped = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int16,
+                                            shape=tuple(b - a for a, b in zip(start, stop)))
+        cropped[:] = volume[box]
+        cropped.flush()
+        del cropped, volume
+
+        # The new metadata goes first: until the volume is replaced its shape no longer
+        # matches, so `load_volume` treats an interrupted crop as missing instead of
+        # serving it with the wrong offset. The uncropped pyramid is dropped with it.
+        body, lungs = body[box], lungs[box]
+        meta['offset'] = [o + a for o, a in zip(meta['offset'], start)]
+        meta['shape'] = list(body.shape)
+        meta['cropped_to_body'] = True
+        meta.pop('pyramid_factors', None)
+        write_meta(meta, series_uid, cache_dir)
+        os.replace(tmp_path, volume_path)
+        meta = build_pyramid(series_uid, cache_dir)
+
+    np.savez(mask_path, body=pack_mask(body), lung=pack_mask(lungs), shape=np.array(body.shape))
+    return meta
+
+def block_mean(images, factor):
+    """
+    Downsamples the last two axes by `factor` with block means.
+
+    Rows/columns that do not fill a complete block are dropped.
+
+    Args:
+        images (numpy.ndarray): Array of shape (..., Y, X).
+        factor (int): Block size.
+
+    Returns:
+        numpy.ndarray: float32 array of shape (..., Y // factor, X // factor).
+    """
+    rows, columns = images.shape[-2] // factor, images.shape[-1] // factor
+    blocks = np.asarray(images[..., :rows * factor, :columns * factor], dtype=np.float32)
+    blocks = blocks.reshape(images.shape[:-2] + (rows, factor, columns, factor))
+    return blocks.mean(axis=(-3, -1))
+
+def build_pyramid(series_uid, cache_dir=DIR_VOLUME_CACHE, factors=PYRAMID_FACTORS):
+    """
+    Builds the downsampled pyramid levels of a cached series.
+
+    The volume is streamed in chunks of slices; every level is computed from
+    the float means of the previous one (nested blocks, so this equals the
+    block mean of the full resolution) and rounded to int16 only once.
+
+    Args:
+        series_uid (str): The SeriesInstanceUID of the cached series.
+        cache_dir (Path): Root directory of the volume cache.
+        factors (tuple of int): Increasing factors, each a multiple of the previous.
+
+    Returns:
+        dict: The updated metadata (with 'pyramid_factors').
+    """
+    volume, meta = load_volume(series_uid, cache_dir)
+    n_slices, rows, columns = volume.shape
+
+    levels, tmp_paths = [], []
+    for factor in factors:
+        tmp_path = get_pyramid_path(series_uid, factor, cache_dir).with_suffix('.tmp.npy')
+        tmp_paths.append(tmp_path)
+        levels.append(np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int16,
+                                                shape=(n_slices, rows // factor, columns // factor)))
+
+    for z in range(0, n_slices, PYRAMID_CHUNK_SLICES):
+        chunk, previous = volume[z:z + PYRAMID_CHUNK_SLICES], 1
+        for factor, level in zip(factors, levels):
+            chunk = block_mean(chunk, factor // previous)
+            level[z:z + len(chunk)] = np.rint(chunk)
+            previous = factor
+
+    for factor, level, tmp_path in zip(factors, levels, tmp_paths):
+        level.flush()
+        del level
+        os.replace(tmp_path, get_pyramid_path(series_uid, factor, cache_dir))
+    del levels
+
+    meta['pyramid_factors'] = list(factors)
+    write_meta(meta, series_uid, cache_dir)
+    return meta
+
+def select_pyramid_factor(shape_yx, target_px, factors=PYRAMID_FACTORS):
+    """
+    Chooses the coarsest pyramid level that still covers an output size.
+
+    Args:
+        shape_yx (tuple): (rows, columns) of the full-resolution slices.
+        target_px (int): Required size of the longer image side in pixels.
+        factors (iterable of int): Available pyramid factors.
+
+    Returns:
+        int: The factor (1 = full resolution).
+    """
+    best = 1
+    for factor in sorted(factors):
+        if max(shape_yx) // factor >= target_px:
+            best = factor
+    return best
+
+def load_pyramid_level(series_uid, factor, cache_dir=DIR_VOLUME_CACHE):
+    """
+    Opens one pyramid level of a cached series (building the pyramid on first use).
+
+    Args:
+        series_uid (str): The SeriesInstanceUID of the cached series.
+        factor (int): 1 (full resolution) or one of the pyramid factors.
+        cache_dir (Path): Root directory of the volume cache.
+
+    Returns:
+        tuple: (volume, meta) with the level opened as a read-only memory map,
+        or (None, None) if the series is not cached.
+    """
+    volume, meta = load_volume(series_uid, cache_dir)
+    if volume is None or factor == 1:
+        return volume, meta
+    if factor not in meta.get('pyramid_factors', []):
+        meta = build_pyramid(series_uid, cache_dir)
+    return np.load(get_pyramid_path(series_uid, factor, cache_dir), mmap_mode='r'), meta
+
+def load_volume_for_size(series_uid, target_px, cache_dir=DIR_VOLUME_CACHE):
+    """
+    Opens the coarsest pyramid level whose slices are at least `target_px` large.
+
+    Returns:
+        tuple: (volume, meta, factor), or (None, None, None) if the series is not cached.
+    """
+    volume, meta = load_volume(series_uid, cache_dir)
+    if volume is None:
+        return None, None, None
+    factor = select_pyramid_factor(meta['shape'][1:], target_px, meta.get('pyramid_factors', PYRAMID_FACTORS))
+    volume, meta = load_pyramid_level(series_uid, factor, cache_dir)
+    return volume, meta, factor
+
+def overview_slices(volume, meta, indices, target_px, cache_dir=DIR_VOLUME_CACHE):
+    """
+    Returns selected slices at the coarsest resolution that still fits `target_px`.
+
+    Volumes served from the cache read the matching pyramid level; volumes
+    held in RAM (`load_series_hu`) are block-averaged on the selected slices
+    only, which gives the same values.
+
+    Args:
+        volume (numpy.ndarray): The full-resolution (Z, Y, X) volume.
+        meta (dict): Its metadata (from `load_volume` or `load_series_hu`).
+        indices (array-like): Slice indices to return.
+        target_px (int): Required size of the longer image side in pixels.
+        cache_dir (Path): Root directory of the volume cache.
+
+    Returns:
+        tuple: (slices, factor) with slices as an int16 array (len(indices), Y', X').
+    """
+    factor = select_pyramid_factor(volume.shape[1:], target_px)
+    if factor == 1:
+        return np.asarray(volume[indices]), factor
+    if meta.get('storage', 'mmap') == 'mmap':
+        level, _ = load_pyramid_level(meta['series_uid'], factor, cache_dir)
+        return np.asarray(level[indices]), factor
+    return np.rint(block_mean(volume[indices], factor)).astype(np.int16), factor
+
+def load_masks(series_uid, cache_dir=DIR_VOLUME_CACHE):
+    """
+    Loads the body and lung masks of a cached series.
+
+    Args:
+        series_uid (str): The SeriesInstanceUID of the cached series.
+        cache_dir (Path): Root directory of the volume cache.
+
+    Returns:
+        tuple: (body, lung) boolean arrays in stored-volume coordinates, or
+        (None, None) if the masks have not been computed.
+    """
+    mask_path = get_mask_path(series_uid, cache_dir)
+    if not mask_path.exists():
+        return None, None
+
+    with np.load(mask_path) as data:
+        shape = tuple(data['shape'])
+        return unpack_mask(data['body'], shape), unpack_mask(data['lung'], shape)
+
+def get_or_build_volume(slices_info, series_uid, cache_dir=DIR_VOLUME_CACHE, crop_to_body=False):
+    """
+    Returns the memory-mapped volume of a series, building the cache on first use.
+
+    Args:
+        slices_info (list of tuples): Output of `get_sorted_dicom_series`.
+        series_uid (str): The SeriesInstanceUID of the series.
+        cache_dir (Path): Root directory of the volume cache.
+        crop_to_body (bool): If True, a newly built cache keeps only the body box.
+
+    Returns:
+        tuple: (volume, meta) with the volume opened as a read-only memory map.
+    """
+    volume, meta = load_volume(series_uid, cache_dir)
+    if volume is None:
+        build_volume_cache(slices_info, series_uid, cache_dir, crop_to_body=crop_to_body)
+        volume, meta = load_volume(series_uid, cache_dir)
+    return volume, meta
+
+def load_series_hu(series_dir, budget_mb=DEFAULT_MEMORY_BUDGET_MB, cache_dir=DIR_VOLUME_CACHE):
+    """
+    Loads a DICOM series as an int16 HU volume under an explicit memory budget.
+
+    The slices are sorted from their headers only. If the series is already
+    cached (uncropped), or the int16 volume would exceed `budget_mb`, the
+    memory-mapped cache is returned (and built on first use). Otherwise the
+    slices are decoded one by one into a preallocated int16 array, so the peak
+    memory is the volume plus a single slice; no float copy of the volume is
+    ever made.
+
+    Both paths return identical values (`slice_to_hu`) in the same order, with
+    one exception: a body-cropped cache (see `precompute_body_mask`) is only
+    used for series over the budget, and then holds just the body box. Index
+    it in full-series coordinates minus `meta['offset']` (`meta['full_shape']`
+    is the uncropped shape); a cropped cache of a series within the budget is
+    bypassed and the full series decoded.
+
+    Args:
+        series_dir (Path): Folder containing the DICOM files of one series.
+        budget_mb (float): Maximum size of an in-RAM volume in megabytes.
+        cache_dir (Path): Root directory of the volume cache.
+
+    Returns:
+        tuple: (volume, meta). `meta['storage']` is 'ram' or 'mmap'.
+    """
+    slices_info, series_uid = read_series_headers(series_dir)
+    if not slices_info:
+        raise FileNotFoundError(f"No DICOM files found in {series_dir}")
+
+    volume, meta = load_volume(series_uid, cache_dir)
+    if volume is not None and not meta.get('cropped_to_body', False):
+        return volume, dict(meta, storage='mmap')
+
+    first = pydicom.dcmread(slices_info[0][1], stop_before_pixels=True)
+    meta = series_meta(slices_info, series_uid, first)
+    volume_mb = np.prod(meta['shape']) * np.dtype(np.int16).itemsize / 1024 ** 2
+    if volume_mb > budget_mb:
+        volume, meta = get_or_build_volume(slices_info, series_uid, cache_dir)
+        return volume, dict(meta, storage='mmap')
+
+    volume = np.empty(meta['shape'], dtype=np.int16)
+    for i, (_, dcm_path, _) in enumerate(slices_info):
+        volume[i] = slice_to_hu(pydicom.dcmread(dcm_path))
+    return volume, dict(meta, storage='ram')
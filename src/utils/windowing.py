@@ -0,0 +1,144 @@
+"""
+Lookup-Table Based Radiological Windowing.
+
+Windowing (`apply_window`, or `render_windows` for several windows at once)
+clips the HU range to a Window Center (Level) and Window Width. For display and
+training we need the windowed image as an 8-bit channel, i.e. clip and rescale
+to 0..255.
+
+Because CT data is int16, every possible input value can be tabulated once:
+a 65,536-entry uint8 lookup table per window turns the clip + rescale into a
+single fancy-index, which is both exact and much cheaper than float math.
+
+The tables are cached per (center, width), and `render_windows` maps one
+image through K windows with a single fancy-index into the stacked (K, 65536)
+table, so window sweeps and montages cost one table lookup per pixel.
+"""
+
+import functools
+import numpy as np
+
+# Named windows used across the thesis (Center/Level, Width) in HU
+WINDOW_PRESETS = {
+    'lung': (-600, 1500),
+    'mediastinal': (50, 350),
+}
+
+INT16_OFFSET = 32768
+
+def parse_window(spec):
+    """
+    Parses a window specification from the command line.
+
+    Args:
+        spec (str): Either a preset name ('lung') or 'name:center:width'
+            (e.g. 'bone:400:1800').
+
+    Returns:
+        tuple: (name, center, width).
+    """
+    if spec in WINDOW_PRESETS:
+        center, width = WINDOW_PRESETS[spec]
+        return spec, center, width
+    name, center, width = spec.split(':')
+    return name, int(center), int(width)
+
+def build_window_lut(center, width):
+    """
+    Builds the uint8 lookup table of one window for all int16 HU values.
+
+    Uses the same bounds as `apply_window` (center +/- width // 2) and maps
+    them linearly onto 0..255.
+
+    Args:
+        center (int): The center value (Level) of the window in HU.
+        width (int): The width of the window in HU.
+
+    Returns:
+        numpy.ndarray: A (65536,) uint8 table indexed by `hu + 32768`.
+    """
+    img_min = center - width // 2
+    img_max = center + width // 2
+    hu = np.arange(-INT16_OFFSET, INT16_OFFSET, dtype=np.float32)
+    scaled = (np.clip(hu, img_min, img_max) - img_min) / max(img_max - img_min, 1) * 255.0
+    return np.rint(scaled).astype(np.uint8)
+
+@functools.lru_cache(maxsize=256)
+def get_window_lut(center, width):
+    """Returns the cached (read-only) lookup table of one window, see `build_window_lut`."""
+    lut = build_window_lut(center, width)
+    lut.flags.writeable = False
+    return lut
+
+@functools.lru_cache(maxsize=64)
+def get_window_luts(windows):
+    """
+    Returns the cached (K, 65536) stack of the lookup tables of K windows.
+
+    Args:
+        windows (tuple of tuples): (center, width) per window.
+
+    Returns:
+        numpy.ndarray: Read-only uint8 array, row k is the table of window k.
+    """
+    luts = np.stack([get_window_lut(center, width) for center, width in windows])
+    luts.flags.writeable = False
+    return luts
+
+def lut_index(image_hu):
+    """
+    Converts an HU image into indices of the lookup tables.
+
+    Non-integer images (e.g. float HU) are rounded and clipped to the int16 range.
+    """
+    if not np.issubdtype(image_hu.dtype, np.integer):
+        image_hu = np.rint(image_hu)
+    if image_hu.dtype != np.int16:
+        image_hu = np.clip(image_hu, -INT16_OFFSET, INT16_OFFSET - 1)
+    return image_hu.astype(np.int32) + INT16_OFFSET
+
+def apply_window_lut(image_hu, lut):
+    """
+    Maps an int16 HU image through a window lookup table.
+
+    Args:
+        image_hu (numpy.ndarray): Image of any shape in HU (int16).
+        lut (numpy.ndarray): Table from `build_window_lut`.
+
+    Returns:
+        numpy.ndarray: The windowed image as uint8, same shape as the input.
+    """
+    index = image_hu.astype(np.int32, copy=False) + INT16_OFFSET
+    return lut[index]
+
+def apply_window(image_hu, center, width):
+    """
+    Applies radiological CT windowing to restrict the visible HU range.
+
+    Windowing acts as a contrast/brightness adjustment: HU values are clipped
+    to center +/- width // 2 and mapped linearly onto 0..255 (uint8) through
+    the cached lookup table of the window.
+
+    Args:
+        image_hu (numpy.ndarray): Image of any shape in HU (int16 is fastest).
+        center (int): The center value (Level) of the window in HU.
+        width (int): The width of the window in HU.
+
+    Returns:
+        numpy.ndarray: The windowed image as uint8, same shape as the input.
+    """
+    return get_window_lut(center, width)[lut_index(image_hu)]
+
+def render_windows(image_hu, windows):
+    """
+    Renders one image through K windows in a single batched lookup.
+
+    Args:
+        image_hu (numpy.ndarray): Image of any shape in HU (int16 is fastest).
+        windows (list of tuples): (center, width) per window.
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (K,) + image_hu.shape.
+    """
+    luts = get_window_luts(tuple((int(c), int(w)) for c, w in windows))
+    return luts[:, lut_index(image_hu)]